@@ -0,0 +1,79 @@
+/*
+EEG Dual Channel — бинарный протокол v1
+Вариант скетча _5_video_EEG.ino с компактными кадрами вместо текстовых меток "A0"/"A1".
+Передаёт полное 10-битное разрешение АЦП, номер кадра и контрольную сумму,
+чтобы хост мог точно посчитать потерянные отсчёты.
+
+Формат кадра (little-endian), для N каналов:
+  [0xA5][0x5A]         синхрослово
+  [VER<<4 | N]         версия протокола (1) и число каналов (1..6)
+  [SEQ_LO][SEQ_HI]     16-битный номер кадра
+  [DATA ...]           N × 10 бит, упакованы подряд, ceil(10*N/8) байт
+  [CRC8]               CRC-8 (полином 0x07) по байтам от VER до конца DATA
+
+Для двух каналов кадр занимает 9 байт: при 115200 бод это до ~1280 кадров/с.
+*/
+
+#include <TimerOne.h>
+
+#define SYNC0 0xA5
+#define SYNC1 0x5A
+#define PROTO_VERSION 1
+#define N_CHANNELS 2
+#define FRAME_SIZE (5 + (10 * N_CHANNELS + 7) / 8 + 1)
+
+const uint8_t channels[N_CHANNELS] = {A0, A1};
+
+uint16_t seq = 0;
+uint8_t frame[FRAME_SIZE];
+
+uint8_t crc8(const uint8_t *data, uint8_t len) {
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+// функция, вызываемая по прерыванию таймера
+void sendData() {
+  frame[0] = SYNC0;
+  frame[1] = SYNC1;
+  frame[2] = (PROTO_VERSION << 4) | N_CHANNELS;
+  frame[3] = seq & 0xFF;
+  frame[4] = seq >> 8;
+
+  // Упаковка 10-битных отсчётов подряд, младшие биты первыми
+  uint8_t pos = 5;
+  uint32_t acc = 0;
+  uint8_t bits = 0;
+  for (uint8_t i = 0; i < N_CHANNELS; i++) {
+    acc |= (uint32_t)(analogRead(channels[i]) & 0x3FF) << bits;
+    bits += 10;
+    while (bits >= 8) {
+      frame[pos++] = acc & 0xFF;
+      acc >>= 8;
+      bits -= 8;
+    }
+  }
+  if (bits > 0) {
+    frame[pos++] = acc & 0xFF;
+  }
+
+  frame[pos] = crc8(frame + 2, pos - 2);
+  Serial.write(frame, FRAME_SIZE);
+  seq++;
+}
+
+void setup() {
+  Serial.begin(115200);      // скорость обмена
+  Timer1.initialize(3000);   // интервал 3000 мкс (≈333 Гц)
+  Timer1.attachInterrupt(sendData);  // функция, вызываемая таймером
+}
+
+void loop() {
+  // Основной цикл пуст — всё делает таймер
+}
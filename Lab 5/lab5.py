@@ -1,17 +1,191 @@
+import time
+STARTUP_T0 = time.perf_counter()
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import serial
 import serial.tools.list_ports
-import time
 from collections import deque
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import threading
-import csv
 import os
+import sys
+import argparse
 from datetime import datetime
 
-class GSRMonitor:
+# Общий модуль sensorlab.py лежит в корне репозитория, на уровень выше лабораторных
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import (
+    load_matplotlib, StartupProfile, frame_size, encode_frame, FrameDecoder, WindowStats,
+    AutoScaler, ArtifactDetector, GsrDecomposer, MARKER_PORT, MarkerTrack, MarkerServer,
+    SEGMENT_OPTIONS, SegmentedRecorder, DEVICE_TAGGED, DEVICE_BINARY, DEVICE_FIRMATA, probe_ports,
+    candidate_ports, PortCache, describe_probe, RECORDING_HEADER, batch_main, RecordingCatalog,
+    catalog_main, PARQUET_AVAILABLE, ParquetSink, EdfSink, export_main, EPOCH_PRE_MS, EPOCH_POST_MS,
+    EpochEngine, epochs_main, SyntheticSignal, SoakTest, DEFAULT_PRESET, normalize_preset,
+    degrade_levels, describe_preset, PresetStore, PerformanceBudget, MonitorMixin,
+)
+
+STARTUP = StartupProfile(STARTUP_T0)
+
+
+# ---------------------- Протоколы и параметры Lab 5 ----------------------
+
+PROTOCOL_TAGGED = "Tagged A0/A1 (8-bit)"
+PROTOCOL_BINARY = "Binary v1 (10-bit)"
+
+# Протокол, в котором Lab 5 читает плату каждого типа
+DEVICE_PROTOCOLS = {DEVICE_TAGGED: PROTOCOL_TAGGED, DEVICE_BINARY: PROTOCOL_BINARY}
+PROBE_BAUDRATES = (115200, 57600)
+
+SIGNAL_TYPE = 'EEG'
+BATCH_ADC_MAX = None  # None — определить по данным (8 или 10 бит)
+SOAK_NOMINAL_RATE = 333.0
+
+
+# ---------------------- Длительный прогон (soak) на синтетическом устройстве ----------------------
+
+class SyntheticSerial:
+    """Поддельный порт: кадры выбранного протокола (оба канала) в темпе rate отсчётов в секунду."""
+
+    def __init__(self, protocol, rate, seed=0):
+        self.protocol = protocol
+        self.rate = rate
+        self.adc_max = 1023 if protocol == PROTOCOL_BINARY else 255
+        self.frame_bytes = frame_size(2) if protocol == PROTOCOL_BINARY else 6
+        self.signal = SyntheticSignal(SOAK_NOMINAL_RATE, self.adc_max, seed)
+        self.buffer = bytearray()
+        self.pos = 0
+        self.emitted = 0
+        self.started = time.perf_counter()
+        self.is_open = True
+
+    def _fill(self):
+        due = int((time.perf_counter() - self.started) * self.rate)
+        n = min(due - self.emitted, 4096)
+        if n <= 0:
+            return
+        values = self.signal.block(self.emitted, n)
+        if self.protocol == PROTOCOL_BINARY:
+            frames = [encode_frame(self.emitted + i, [v, self.adc_max - v]) for i, v in enumerate(values)]
+        else:
+            frames = [b'A0' + bytes([v]) + b'A1' + bytes([self.adc_max - v]) for v in values]
+        # Прочитанное начало буфера отбрасываем, чтобы буфер не рос
+        if self.pos > 1 << 16:
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer += b''.join(frames)
+        self.emitted += n
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self.buffer) - self.pos
+
+    def read(self, size=1):
+        if self.in_waiting == 0:
+            time.sleep(1 / self.rate)  # как таймаут настоящего порта
+            self._fill()
+        data = bytes(self.buffer[self.pos:self.pos + size])
+        self.pos += len(data)
+        return data
+
+    def reset_input_buffer(self):
+        self.buffer.clear()
+        self.pos = 0
+
+    def close(self):
+        self.is_open = False
+
+    def backlog_ms(self):
+        """Отставание чтения от устройства: непрочитанные кадры и ещё не выданные отсчёты."""
+        due = (time.perf_counter() - self.started) * self.rate
+        unread = (len(self.buffer) - self.pos) / self.frame_bytes + max(0.0, due - self.emitted)
+        return unread / self.rate * 1000
+
+
+class SerialSoakTest(SoakTest):
+    """Прогон Lab 5: синтетический порт выбранного протокола подключается как настоящий."""
+
+    def __init__(self, app, duration, out_dir, rate, protocol, *args, **kwargs):
+        super().__init__(app, duration, out_dir, rate, *args, **kwargs)
+        self.protocol = protocol
+
+    def connect(self):
+        app = self.app
+        app.port_var.set('synthetic')
+        app.protocol_var.set(self.protocol)
+        device = SyntheticSerial(self.protocol, self.rate)
+        app.connect_serial(device)
+        if app.ser is not device:
+            device.close()
+            return None
+        return device
+
+
+def soak_main(argv):
+    parser = argparse.ArgumentParser(prog='soak', description='Long-run soak test against a synthetic device')
+    parser.add_argument('--hours', type=float, default=1.0)
+    parser.add_argument('--speed', type=float, default=3.0,
+                        help=f'sample rate as a multiple of {SOAK_NOMINAL_RATE:g} Hz')
+    parser.add_argument('--interval', type=float, default=10.0, help='metric sampling period, s')
+    parser.add_argument('--segment', choices=list(SEGMENT_OPTIONS), default="60 min")
+    parser.add_argument('--protocol', choices=['tagged', 'binary'], default='tagged')
+    parser.add_argument('--output', default=None, help='directory for the recording and soak_metrics.csv')
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--preset', default=DEFAULT_PRESET, help='session profile (built-in or saved)')
+    args = parser.parse_args(argv)
+    if args.preset not in PresetStore(SIGNAL_TYPE, BUILTIN_PRESETS, normalize_lab_preset).names():
+        parser.error(f"unknown profile {args.preset!r}")
+    out_dir = args.output or os.path.join(os.getcwd(), f"soak_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    # Диалоги остановили бы прогон: информационные окна глушим, ошибки — в stderr
+    messagebox.showinfo = lambda *args, **kwargs: None
+    messagebox.askyesno = lambda *args, **kwargs: True
+    messagebox.showerror = lambda title, message, **kwargs: print(f"{title}: {message}", file=sys.stderr)
+    root = tk.Tk()
+    app = GSRMonitor(root)
+    app.apply_preset(args.preset, remember=False)
+    root.protocol("WM_DELETE_WINDOW", app.stop)
+    soak = SerialSoakTest(app, args.hours * 3600, out_dir, SOAK_NOMINAL_RATE * args.speed,
+                          {'tagged': PROTOCOL_TAGGED, 'binary': PROTOCOL_BINARY}[args.protocol],
+                          args.interval, not args.no_tracemalloc, args.segment)
+    root.after(500, soak.start)
+    root.mainloop()
+    return 1 if soak.failed or soak.failed is None else 0
+
+
+# ---------------------- Профили сеанса ----------------------
+
+BUILTIN_PRESETS = {
+    # Прежние значения, зашитые в GSRMonitor
+    DEFAULT_PRESET: dict(
+        protocol=PROTOCOL_TAGGED, baudrate=115200, channels=['A0'], sample_rate=333.0, poll_ms=1.0,
+        buffer_points=1000, visible_points=500, render_fps=30.0, decimation=1, y_range=None,
+        segment="Off", export=[], chain=['artifacts', 'gsr', 'epochs'],
+        cpu_budget=80.0, latency_budget_ms=200.0, degrade=True,
+    ),
+    # Второй канал пишется в ту же запись (и в EDF+) с counter отсчёта первого
+    "EEG 333 Hz two-channel": dict(
+        protocol=PROTOCOL_BINARY, baudrate=115200, channels=['A0', 'A1'], sample_rate=333.0, poll_ms=1.0,
+        buffer_points=10000, visible_points=2000, render_fps=20.0, decimation=2, y_range=None,
+        segment="60 min", export=['edf'], chain=['artifacts', 'epochs'],
+        cpu_budget=60.0, latency_budget_ms=150.0, degrade=True,
+    ),
+    "EEG 333 Hz single-channel": dict(
+        protocol=PROTOCOL_TAGGED, baudrate=115200, channels=['A0'], sample_rate=333.0, poll_ms=1.0,
+        buffer_points=5000, visible_points=1000, render_fps=25.0, decimation=1, y_range=[0, 270],
+        segment="Off", export=[], chain=['artifacts', 'epochs'],
+        cpu_budget=50.0, latency_budget_ms=120.0, degrade=True,
+    ),
+}
+
+
+def normalize_lab_preset(preset):
+    """normalize_preset по Default этой лабораторной плюс проверка протокола."""
+    result = normalize_preset(preset, BUILTIN_PRESETS[DEFAULT_PRESET])
+    if result['protocol'] not in (PROTOCOL_TAGGED, PROTOCOL_BINARY):
+        raise ValueError(f"protocol: invalid value {result['protocol']!r}")
+    return result
+
+
+class GSRMonitor(MonitorMixin):
     def __init__(self, root):
         self.root = root
         self.root.title("Advanced Sensor Monitor - Real Time")
@@ -20,27 +194,105 @@ class GSRMonitor:
 
         self.recording = False
         self.record_start_time = None
-        self.csv_file = None
-        self.csv_writer = None
-        self.recorded_data = []
+        self.recorder = None
+        self.record_samples = 0
+        self.display_pending = False
+        self.follow_latest = False
+        self.record_lost_start = 0
+        self.record_resyncs_start = 0
+        self.record_artifacts_start = 0
+
+        # Профиль сеанса: буферы, отрисовка, запись, цепочка обработки и бюджет
+        self.presets = PresetStore(SIGNAL_TYPE, BUILTIN_PRESETS, normalize_lab_preset)
+        self.preset_name = self.presets.last
+        self.preset = self.presets.get(self.preset_name)
+        self.settings = dict(self.preset)
+        self.stages = frozenset(self.preset['chain'])
+        self.degrade_level = 0
+        self.degrade_levels = degrade_levels(self.preset)
+        self.budget = PerformanceBudget(self.preset['cpu_budget'], self.preset['latency_budget_ms'])
+        self.last_render = 0.0
+        self.last_sample_time = None
+        self.render_sample_time = None
 
         self.PORT = None
-        self.BAUDRATE = 115200
-        self.CHANNEL = 'A0'
+        self.BAUDRATE = self.preset['baudrate']
+        self.CHANNEL = self.preset['channels'][0]
+        self.PROTOCOL = self.preset['protocol']
+        self.record_channels = [self.CHANNEL]
         self.ser = None
+        self.decoder = FrameDecoder()
 
-        self.x_data = deque(maxlen=1000)
-        self.y_data = deque(maxlen=1000)
+        self.x_data = deque(maxlen=self.preset['buffer_points'])
+        self.y_data = deque(maxlen=self.preset['buffer_points'])
         self.counter = 0
         self.running = True
 
-        self.visible_points = 500
+        self.visible_points = self.preset['visible_points']
         self.scroll_position = 0
 
+        self.ADC_MAX = 255
+        self.stats = WindowStats(1000, value_max=1023)
+        self.view_stats = WindowStats(self.visible_points, value_max=1023)
+        self.autoscaler = AutoScaler(0, 300, self.ADC_MAX)
+
+        self.detector = ArtifactDetector(self.ADC_MAX)
+        self.artifact_events = deque(maxlen=500)
+        self.artifact_count = 0
+        self.event_file = None
+        self.event_writer = None
+
+        self.gsr = GsrDecomposer(self.ADC_MAX, fs=self.preset['sample_rate'])
+        self.tonic_data = deque(maxlen=self.preset['buffer_points'])
+        self.scr_events = deque(maxlen=200)
+        self.record_scr_start = 0
+        self.scr_file = None
+        self.scr_writer = None
+
+        self.markers = MarkerTrack()
+        self.epoch_channels = self.profile_channels()
+        self.epochs = EpochEngine(self.epoch_samples(EPOCH_PRE_MS), self.epoch_samples(EPOCH_POST_MS), self.gsr.fs,
+                                  len(self.epoch_channels))
+        self.erp_window = None
+        self.marker_server = MarkerServer(self.markers)
+        self.record_markers_start = 0
+        self.marker_file = None
+        self.marker_writer = None
+
+        self.catalog = None
+        self.port_cache = PortCache()
+        self.port_info = {}
+        self.probing = False
+        self.probe_cancel = threading.Event()
+        self.probe_thread = None
+        self.record_marker_labels = {}
+        self.record_artifact_kinds = {}
+        self.record_artifact_samples = 0
+        self.export_sinks = []
+        # Поток чтения пишет в приёмники экспорта, поток Tk закрывает их при остановке записи
+        self.export_lock = threading.Lock()
+        self.sidecar_lock = threading.Lock()
+        self.record_segments = 0
+
+        self.startup = STARTUP
         self.setup_styles()
         self.setup_ui()
-        self.refresh_ports()
-        self.start_serial_reading()
+        self.apply_preset(self.preset_name, remember=False)
+        if self.presets.errors:
+            self.status_var.set("⚠️ Invalid profiles skipped: " + "; ".join(self.presets.errors))
+        self.recover_recordings()
+        self.start_marker_server()
+        self.startup.mark('ui shell')
+        # Порты, поток чтения и график — после показа окна; тяжёлые модули грузятся в фоне
+        self.window_shown = False
+        self.root.bind('<Map>', self.on_first_map)
+        self.preload_thread = threading.Thread(target=self.preload_modules, daemon=True)
+        self.preload_thread.start()
+
+    def preload_modules(self):
+        started = time.perf_counter()
+        load_matplotlib()
+        self.startup.background['module preload'] = (time.perf_counter() - started) * 1000
 
     def setup_styles(self):
         style = ttk.Style()
@@ -66,6 +318,10 @@ class GSRMonitor:
 
         ttk.Label(left_panel, text="💾 Data Recording", style='Header.TLabel', anchor='center').pack(fill=tk.X, pady=(0,10))
         self.setup_recording_panel(left_panel)
+        ttk.Separator(left_panel, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=15)
+
+        ttk.Label(left_panel, text="📍 Stimulus Markers", style='Header.TLabel', anchor='center').pack(fill=tk.X, pady=(0,10))
+        self.setup_marker_panel(left_panel)
 
         # Правая панель с графиком и информацией
         right_panel = ttk.Frame(self.root, padding=10)
@@ -84,6 +340,17 @@ class GSRMonitor:
         frame = ttk.Frame(parent)
         frame.pack(fill=tk.X)
 
+        ttk.Label(frame, text="Session profile:").pack(anchor='w', pady=3)
+        self.preset_var = tk.StringVar(value=self.preset_name)
+        self.preset_combo = ttk.Combobox(frame, textvariable=self.preset_var, values=self.presets.names(),
+                                         width=20, state="readonly")
+        self.preset_combo.pack(fill=tk.X, pady=3)
+        self.preset_combo.bind("<<ComboboxSelected>>", lambda event: self.apply_preset(self.preset_var.get()))
+        ttk.Button(frame, text="💾 Save Profile", command=self.save_preset).pack(fill=tk.X, pady=(0, 5))
+        self.preset_info_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.preset_info_var, font=("Helvetica", 9), foreground="#444",
+                  wraplength=220, justify=tk.LEFT).pack(anchor='w')
+
         ttk.Label(frame, text="Port:").pack(anchor='w', pady=3)
         self.port_var = tk.StringVar()
         self.port_combo = ttk.Combobox(frame, textvariable=self.port_var, width=20, state="readonly")
@@ -92,6 +359,12 @@ class GSRMonitor:
         refresh_btn = ttk.Button(frame, text="🔄 Refresh Ports", command=self.refresh_ports)
         refresh_btn.pack(fill=tk.X, pady=5)
 
+        detect_btn = ttk.Button(frame, text="🔎 Detect Devices", command=self.probe_devices)
+        detect_btn.pack(fill=tk.X, pady=(0, 5))
+        self.probe_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.probe_var, font=("Helvetica", 9), foreground="#444",
+                  wraplength=220, justify=tk.LEFT).pack(anchor='w')
+
         ttk.Label(frame, text="Baudrate:").pack(anchor='w', pady=3)
         self.baudrate_var = tk.StringVar(value="115200")
         baudrates = ["9600", "19200", "38400", "57600", "115200"]
@@ -106,6 +379,13 @@ class GSRMonitor:
                                           width=20, state="readonly")
         self.channel_combo.pack(fill=tk.X, pady=3)
 
+        ttk.Label(frame, text="Protocol:").pack(anchor='w', pady=3)
+        self.protocol_var = tk.StringVar(value=PROTOCOL_TAGGED)
+        self.protocol_combo = ttk.Combobox(frame, textvariable=self.protocol_var,
+                                           values=[PROTOCOL_TAGGED, PROTOCOL_BINARY],
+                                           width=20, state="readonly")
+        self.protocol_combo.pack(fill=tk.X, pady=3)
+
         self.connect_btn = ttk.Button(frame, text="🔌 Connect", command=self.toggle_connection)
         self.connect_btn.pack(fill=tk.X, pady=15)
 
@@ -127,9 +407,29 @@ class GSRMonitor:
         value_label = ttk.Label(info_frame, textvariable=self.value_var)
         value_label.grid(row=0, column=2, sticky='w', padx=10)
 
+        self.stats_var = tk.StringVar(value="📐 Mean: -- | RMS: -- | Peak: --")
+        stats_label = ttk.Label(info_frame, textvariable=self.stats_var)
+        stats_label.grid(row=0, column=3, sticky='w', padx=10)
+
+        self.link_var = tk.StringVar(value="📉 Lost: --")
+        link_label = ttk.Label(info_frame, textvariable=self.link_var)
+        link_label.grid(row=0, column=4, sticky='w', padx=10)
+
         self.record_status_var = tk.StringVar(value="🔴 Recording: OFF")
         record_status_label = ttk.Label(info_frame, textvariable=self.record_status_var, foreground="red")
-        record_status_label.grid(row=0, column=3, sticky='e', padx=5)
+        record_status_label.grid(row=0, column=5, sticky='e', padx=5)
+
+        self.artifact_var = tk.StringVar(value="⚠️ Artifacts: 0")
+        artifact_label = ttk.Label(info_frame, textvariable=self.artifact_var, style='Info.TLabel')
+        artifact_label.grid(row=1, column=0, columnspan=3, sticky='w', padx=5)
+
+        self.gsr_var = tk.StringVar(value="💧 Tonic: -- | Phasic: -- | SCR: 0")
+        gsr_label = ttk.Label(info_frame, textvariable=self.gsr_var, style='Info.TLabel')
+        gsr_label.grid(row=1, column=3, columnspan=3, sticky='w', padx=10)
+
+        self.budget_var = tk.StringVar(value="⏱️ CPU -- | frame latency --")
+        budget_label = ttk.Label(info_frame, textvariable=self.budget_var, style='Info.TLabel')
+        budget_label.grid(row=2, column=0, columnspan=6, sticky='w', padx=5)
 
     def setup_plot_with_scroll(self, parent):
         plot_frame = ttk.LabelFrame(parent, text="📈 Real-time Data with Scroll", padding=10)
@@ -141,22 +441,11 @@ class GSRMonitor:
         graph_scroll_frame.grid(row=0, column=0, sticky='nsew')
         graph_scroll_frame.columnconfigure(0, weight=1)
 
-        self.fig, self.ax = plt.subplots(figsize=(12, 5))
-        self.ax.set_facecolor('#fefefe')
-        self.fig.patch.set_facecolor('#f9f9f9')
-
-        self.ax.set_ylim(0, 300)
-        self.ax.set_xlim(0, self.visible_points)
-        self.ax.set_title(f'Sensor Data - Channel {self.channel_var.get()} (Scroll to navigate)', fontsize=14, pad=20)
-        self.ax.set_xlabel('Time (samples)', fontsize=12)
-        self.ax.set_ylabel('Sensor Value', fontsize=12)
-        self.ax.grid(True, alpha=0.3, linestyle='--')
-
-        self.line, = self.ax.plot([], [], 'teal', linewidth=2, alpha=0.8)
-
-        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_scroll_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew')
+        # Фигура строится после показа окна (build_plot), пока на её месте — заглушка
+        self.graph_frame = graph_scroll_frame
+        self.fig = self.ax = self.canvas = None
+        self.plot_placeholder = ttk.Label(graph_scroll_frame, text="⏳ Loading plot...", anchor='center')
+        self.plot_placeholder.grid(row=0, column=0, sticky='nsew')
 
         scroll_frame = ttk.Frame(graph_scroll_frame)
         scroll_frame.grid(row=0, column=1, sticky='ns', padx=5)
@@ -188,6 +477,48 @@ class GSRMonitor:
                                       font=("Helvetica", 9), foreground="#666666")
         scroll_info_label.pack(pady=5)
 
+        ttk.Separator(scroll_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=8)
+
+        self.autoscale_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(scroll_frame, text="Auto Y", variable=self.autoscale_var).pack(anchor='w')
+
+        ttk.Label(scroll_frame, text="Stats window:", font=("Helvetica", 9)).pack(anchor='w', pady=(8, 0))
+        self.stats_window_var = tk.StringVar(value=str(self.stats.window))
+        stats_window_combo = ttk.Combobox(scroll_frame, textvariable=self.stats_window_var,
+                                          values=["100", "250", "500", "1000", "2000", "5000"],
+                                          width=6, state="readonly")
+        stats_window_combo.pack(anchor='w')
+        stats_window_combo.bind("<<ComboboxSelected>>", self.on_stats_window_change)
+
+    def build_plot(self):
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        self.fig = Figure(figsize=(12, 5))
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_facecolor('#fefefe')
+        self.fig.patch.set_facecolor('#f9f9f9')
+
+        self.ax.set_ylim(*(self.settings['y_range'] or
+                           (0, self.ADC_MAX * 1.05 if self.ser and self.ser.is_open else 300)))
+        self.ax.set_xlim(0, self.visible_points)
+        self.ax.set_title(f'Sensor Data - Channel {self.channel_var.get()} (Scroll to navigate)', fontsize=14, pad=20)
+        self.ax.set_xlabel('Time (samples)', fontsize=12)
+        self.ax.set_ylabel('Sensor Value', fontsize=12)
+        self.ax.grid(True, alpha=0.3, linestyle='--')
+
+        self.line, = self.ax.plot([], [], 'teal', linewidth=2, alpha=0.8)
+        self.artifact_line, = self.ax.plot([], [], color='crimson', linewidth=3,
+                                           marker='.', markersize=5, alpha=0.9)
+        self.tonic_line, = self.ax.plot([], [], color='darkorange', linewidth=1.5, linestyle='--', alpha=0.8)
+        self.scr_line, = self.ax.plot([], [], linestyle='none', marker='v', color='purple', markersize=8)
+        self.marker_line, = self.ax.plot([], [], color='navy', linewidth=1.2, alpha=0.7)
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+        self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew')
+        self.plot_placeholder.destroy()
+        self.update_plot_view()
+
     def setup_recording_panel(self, parent):
         record_frame = ttk.Frame(parent)
         record_frame.pack(fill=tk.X, pady=5)
@@ -206,6 +537,22 @@ class GSRMonitor:
 
         ttk.Button(path_row, text="📁 Browse", command=self.browse_save_path).pack(side=tk.RIGHT)
 
+        segment_row = ttk.Frame(record_frame)
+        segment_row.pack(fill=tk.X, pady=3)
+        ttk.Label(segment_row, text="New segment every:").pack(side=tk.LEFT)
+        self.segment_var = tk.StringVar(value="Off")
+        ttk.Combobox(segment_row, textvariable=self.segment_var, values=list(SEGMENT_OPTIONS),
+                     width=8, state="readonly").pack(side=tk.LEFT, padx=5)
+
+        export_row = ttk.Frame(record_frame)
+        export_row.pack(fill=tk.X, pady=3)
+        ttk.Label(export_row, text="Also write:").pack(side=tk.LEFT)
+        self.export_edf_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_row, text="EDF+", variable=self.export_edf_var).pack(side=tk.LEFT, padx=5)
+        self.export_parquet_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_row, text="Parquet", variable=self.export_parquet_var,
+                        state="normal" if PARQUET_AVAILABLE else "disabled").pack(side=tk.LEFT, padx=5)
+
         button_row = ttk.Frame(record_frame)
         button_row.pack(fill=tk.X, pady=10)
 
@@ -224,12 +571,78 @@ class GSRMonitor:
                                       font=("Helvetica", 9), foreground="#0066cc")
         record_info_label.pack(anchor='w')
 
-    def refresh_ports(self):
-        ports = serial.tools.list_ports.comports()
-        port_list = [port.device for port in ports]
-        self.port_combo['values'] = port_list
-        if port_list and not self.port_var.get():
-            self.port_var.set(port_list[0])
+    def setup_marker_panel(self, parent):
+        marker_frame = ttk.Frame(parent)
+        marker_frame.pack(fill=tk.X, pady=5)
+
+        label_row = ttk.Frame(marker_frame)
+        label_row.pack(fill=tk.X, pady=5)
+        ttk.Label(label_row, text="Label:", width=7).pack(side=tk.LEFT)
+        self.marker_label_var = tk.StringVar(value="stim")
+        ttk.Entry(label_row, textvariable=self.marker_label_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5))
+        ttk.Button(label_row, text="📍 Mark",
+                   command=lambda: self.add_marker(self.marker_label_var.get() or "stim", source='button')).pack(side=tk.RIGHT)
+
+        ttk.Label(marker_frame, text=f"Keys 0-9 / Space, UDP 127.0.0.1:{MARKER_PORT}",
+                  font=("Helvetica", 9), foreground="#444").pack(anchor='w', pady=3)
+
+        self.marker_info_var = tk.StringVar(value="No markers yet")
+        ttk.Label(marker_frame, textvariable=self.marker_info_var,
+                  font=("Helvetica", 9), foreground="#0066cc").pack(anchor='w')
+
+        epoch_row = ttk.Frame(marker_frame)
+        epoch_row.pack(fill=tk.X, pady=5)
+        ttk.Label(epoch_row, text="Epoch, ms:").pack(side=tk.LEFT)
+        self.epoch_pre_var = tk.StringVar(value=str(EPOCH_PRE_MS))
+        ttk.Entry(epoch_row, textvariable=self.epoch_pre_var, width=5).pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Label(epoch_row, text="before /").pack(side=tk.LEFT)
+        self.epoch_post_var = tk.StringVar(value=str(EPOCH_POST_MS))
+        ttk.Entry(epoch_row, textvariable=self.epoch_post_var, width=5).pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Label(epoch_row, text="after").pack(side=tk.LEFT)
+        ttk.Button(epoch_row, text="📈 Evoked Response", command=self.show_evoked_response).pack(side=tk.RIGHT)
+
+        self.epoch_info_var = tk.StringVar(value="No epochs yet")
+        ttk.Label(marker_frame, textvariable=self.epoch_info_var,
+                  font=("Helvetica", 9), foreground="#444").pack(anchor='w')
+
+        self.root.bind('<KeyPress>', self.on_marker_key)
+
+    def probe_devices(self):
+        """Опрос USB-портов по кнопке: плате отправляется запрос Firmata, порт сбрасывает её по DTR."""
+        if self.probing:
+            return
+        busy = self.PORT if self.ser and self.ser.is_open else None
+        ports = [port for port in candidate_ports()
+                 if port.device != busy]
+        if not ports:
+            self.probe_var.set("No USB devices detected")
+            return
+        self.probing = True
+        cancel = self.probe_cancel = threading.Event()
+        self.probe_var.set(f"🔎 Probing {len(ports)} port(s)...")
+        # Сначала выбранная скорость, затем остальные
+        selected = int(self.baudrate_var.get())
+        baudrates = sorted(PROBE_BAUDRATES, key=lambda baudrate: baudrate != selected)
+
+        def worker():
+            results = probe_ports([port.device for port in ports], baudrates, cancel=cancel)
+            if not cancel.is_set():
+                self.root.after(0, self.apply_probe_results, ports, results)
+
+        self.probe_thread = threading.Thread(target=worker, daemon=True)
+        self.probe_thread.start()
+
+    def select_detected_port(self):
+        """Выбирает порт с платой ЭЭГ, её протокол и скорость, если пользователь ещё не подключился."""
+        if self.ser and self.ser.is_open:
+            return
+        current = self.port_info.get(self.port_var.get())
+        if not (current and current['kind'] in DEVICE_PROTOCOLS):
+            current = next((result for result in self.port_info.values() if result['kind'] in DEVICE_PROTOCOLS), None)
+        if current:
+            self.port_var.set(current['device'])
+            self.protocol_var.set(DEVICE_PROTOCOLS[current['kind']])
+            self.baudrate_var.set(str(current['baudrate']))
 
     def toggle_connection(self):
         if self.ser and self.ser.is_open:
@@ -237,23 +650,45 @@ class GSRMonitor:
         else:
             self.connect_serial()
 
-    def connect_serial(self):
+    def connect_serial(self, ser=None):
+        """ser — уже открытый порт (например, синтетическое устройство soak-прогона)."""
         if not self.port_var.get():
             messagebox.showerror("Error", "Please select a port")
             return
+        self.cancel_probe()
+        known = self.port_info.get(self.port_var.get())
+        if known and known['kind'] == DEVICE_FIRMATA and not messagebox.askyesno(
+                "Firmata Device", f"{describe_probe(known)}\nThis board runs Firmata (see Lab 6). Connect anyway?"):
+            return
         try:
             self.PORT = self.port_var.get()
             self.BAUDRATE = int(self.baudrate_var.get())
             self.CHANNEL = self.channel_var.get()
-            self.ser = serial.Serial(self.PORT, self.BAUDRATE, timeout=1)
-            time.sleep(2)
+            self.PROTOCOL = self.protocol_var.get()
+            if ser is None:
+                ser = serial.Serial(self.PORT, self.BAUDRATE, timeout=1)
+                time.sleep(2)
+            self.ser = ser
             self.ser.reset_input_buffer()
+            self.decoder.reset()
+            if self.PROTOCOL == PROTOCOL_BINARY:
+                self.ADC_MAX = 1023
+                self.link_var.set("📉 Lost: 0 | Resyncs: 0")
+            else:
+                self.ADC_MAX = 255
+                self.link_var.set("📉 Lost: --")
+            self.autoscaler = AutoScaler(0, self.ADC_MAX, self.ADC_MAX)
+            self.detector = ArtifactDetector(self.ADC_MAX)
+            self.gsr = GsrDecomposer(self.ADC_MAX, fs=self.preset['sample_rate'])
+            self.reset_epochs()
             self.status_var.set("✅ Connected to " + self.PORT)
             self.connect_btn.config(text="🔌 Disconnect")
             self.start_record_btn.config(state="normal")
             self.record_info_var.set("Ready to record! Click 'START Recording'")
-            self.ax.set_title(f'Sensor Data - Channel {self.CHANNEL} (Scroll to navigate)', fontsize=14, pad=20)
-            self.canvas.draw()
+            if self.canvas is not None:
+                self.ax.set_ylim(*(self.settings['y_range'] or (0, self.ADC_MAX * 1.05)))
+                self.ax.set_title(f'Sensor Data - Channel {self.CHANNEL} (Scroll to navigate)', fontsize=14, pad=20)
+                self.canvas.draw()
         except Exception as e:
             messagebox.showerror("Connection Error", f"Failed to connect: {e}")
             self.status_var.set("❌ Connection failed")
@@ -272,39 +707,275 @@ class GSRMonitor:
     def start_serial_reading(self):
         def read_from_serial():
             while self.running:
-                if self.ser and self.ser.is_open and self.ser.in_waiting >= 3:
+                if self.ser and self.ser.is_open:
                     try:
-                        byte1 = self.ser.read(1)
-                        byte2 = self.ser.read(1)
-                        expected_bytes = self.CHANNEL.encode('utf-8')
-                        if byte1 == expected_bytes[0:1] and byte2 == expected_bytes[1:2]:
-                            value_byte = self.ser.read(1)
-                            sensor_value = ord(value_byte)
-                            timestamp = time.time()
-                            self.x_data.append(self.counter)
-                            self.y_data.append(sensor_value)
-                            self.counter += 1
-                            if self.scroll_position >= len(self.x_data) - self.visible_points - 10:
-                                self.scroll_to_latest()
-                            if self.recording:
-                                elapsed = time.time() - self.record_start_time
-                                self.recorded_data.append({'timestamp': timestamp, 'value': sensor_value, 'counter': self.counter})
-                                if self.csv_writer:
-                                    self.csv_writer.writerow([timestamp, sensor_value, self.counter, self.CHANNEL])
-                                    self.record_info_var.set(f"Recording... {len(self.recorded_data)} points | Elapsed: {elapsed:.1f}s")
-                            self.root.after(0, self.update_display, sensor_value)
+                        if self.PROTOCOL == PROTOCOL_BINARY:
+                            self.read_binary_frames()
+                        else:
+                            while self.running and self.ser.in_waiting >= 3:
+                                self.read_tagged_frame()
                     except Exception as e:
                         self.root.after(0, lambda: self.status_var.set(f"Read error: {e}"))
-                time.sleep(0.001)
+                time.sleep(self.settings['poll_ms'] / 1000)
 
         self.serial_thread = threading.Thread(target=read_from_serial, daemon=True)
         self.serial_thread.start()
 
-    def update_display(self, value):
+    def read_tagged_frame(self):
+        # Побайтовая синхронизация: при несовпадении теряется один байт, а не пара,
+        # иначе чтение может навсегда сместиться относительно 3-байтовых кадров
+        expected_bytes = self.CHANNEL.encode('utf-8')
+        if self.ser.read(1) != expected_bytes[0:1]:
+            return
+        channel = (expected_bytes[0:1] + self.ser.read(1)).decode('ascii', 'replace')
+        if channel == self.CHANNEL:
+            value_byte = self.ser.read(1)
+            self.process_sample(ord(value_byte), time.time())
+        elif channel in self.epoch_channels[1:] or (self.recording and channel in self.record_channels[1:]):
+            self.process_extra_sample(channel, ord(self.ser.read(1)), time.time())
+
+    def read_binary_frames(self):
+        waiting = self.ser.in_waiting
+        if not waiting:
+            return
+        frames = self.decoder.feed(self.ser.read(waiting))
+        channel_index = int(self.CHANNEL[1])
+        timestamp = time.time()
+        for seq, values in frames:
+            if channel_index < len(values):
+                self.process_sample(values[channel_index], timestamp)
+                for channel in self.epoch_channels[1:]:
+                    if int(channel[1]) < len(values):
+                        self.process_extra_sample(channel, values[int(channel[1])], timestamp)
+        if frames:
+            self.root.after(0, self.update_link_stats)
+
+    def process_sample(self, sensor_value, timestamp):
+        self.x_data.append(self.counter)
+        self.y_data.append(sensor_value)
+        self.stats.push(sensor_value)
+        self.view_stats.push(sensor_value)
+        stages = self.stages
+        if 'artifacts' in stages:
+            events = self.detector.push(self.counter, sensor_value)
+            if events:
+                self.handle_artifacts(events)
+        if 'gsr' in stages:
+            scr = self.gsr.push(self.counter, sensor_value, timestamp)
+            self.tonic_data.append(self.gsr.tonic_level)
+            if scr:
+                self.handle_scr(scr)
+        else:
+            self.tonic_data.append(float('nan'))
+        if 'epochs' in stages:
+            self.epochs.push(self.counter, sensor_value, 0)
+        resolved = self.markers.on_sample(self.counter, time.monotonic())
+        if resolved:
+            self.handle_markers(resolved)
+        self.counter += 1
+        # Следование за последними данными; отрисовка — в update_display в потоке Tk
+        if self.scroll_position >= len(self.x_data) - self.visible_points - 10:
+            self.scroll_position = max(0, len(self.x_data) - self.visible_points)
+            self.follow_latest = True
+        if self.recording:
+            elapsed = time.time() - self.record_start_time
+            self.record_samples += 1
+            if self.recorder:
+                self.recorder.write_row([timestamp, sensor_value, self.counter, self.CHANNEL])
+            self.write_exports(timestamp, sensor_value, self.CHANNEL)
+            self.record_info_var.set(f"Recording... {self.record_samples} points | Elapsed: {elapsed:.1f}s")
+        # Одно обновление экрана на пачку отсчётов и не чаще render_fps кадров в секунду
+        self.last_sample_time = timestamp
+        if not self.display_pending:
+            self.display_pending = True
+            delay = self.last_render + 1 / self.settings['render_fps'] - time.perf_counter()
+            self.root.after(max(0, int(delay * 1000)), self.update_display)
+
+    def process_extra_sample(self, channel, value, timestamp):
+        """Дополнительный канал профиля относится к последнему отсчёту основного канала."""
+        if 'epochs' in self.stages and channel in self.epoch_channels:
+            self.epochs.put(self.counter - 1, self.epoch_channels.index(channel), value)
+        if self.recording and channel in self.record_channels[1:]:
+            self.record_extra_sample(channel, value, timestamp)
+
+    def record_extra_sample(self, channel, value, timestamp):
+        """Дополнительный канал профиля — в запись с counter последнего отсчёта основного канала."""
+        if self.recorder:
+            self.recorder.write_row([timestamp, value, self.counter, channel])
+        self.write_exports(timestamp, value, channel)
+
+    def update_link_stats(self):
+        d = self.decoder
+        self.link_var.set(f"📉 Lost: {d.lost} ({d.loss_ratio() * 100:.2f}%) | Resyncs: {d.resyncs} | "
+                          f"CRC: {d.crc_errors}")
+
+    def open_export_sinks(self):
+        base = os.path.splitext(self.path_var.get())[0]
+        sinks = []
+        try:
+            if self.export_edf_var.get():
+                sinks.append(EdfSink(base + '.edf', self.record_channels, self.gsr.fs, self.ADC_MAX, time.time(), SIGNAL_TYPE))
+            if self.export_parquet_var.get():
+                sinks.append(ParquetSink(base + '.parquet'))
+        except Exception:
+            for sink in sinks:
+                sink.close()
+            raise
+        return sinks
+
+    # ---------------------- Профиль сеанса и бюджет ----------------------
+
+    def apply_preset(self, name, remember=True):
+        """Применяет профиль; порт, скорость и канал — при следующем подключении."""
+        if self.recording:
+            messagebox.showwarning("Session profile", "Stop recording before switching profiles")
+            self.preset_var.set(self.preset_name)
+            return
+        preset = self.presets.get(name)
+        if remember:
+            self.presets.select(name)
+        rate_changed = preset['sample_rate'] != self.preset['sample_rate']
+        self.preset_name, self.preset = name, preset
+        self.preset_var.set(name)
+        self.baudrate_var.set(str(preset['baudrate']))
+        self.channel_var.set(preset['channels'][0])
+        self.protocol_var.set(preset['protocol'])
+        self.segment_var.set(preset['segment'])
+        self.export_edf_var.set('edf' in preset['export'])
+        self.export_parquet_var.set('parquet' in preset['export'] and PARQUET_AVAILABLE)
+        self.autoscale_var.set(preset['y_range'] is None)
+        if rate_changed:
+            self.gsr = GsrDecomposer(self.ADC_MAX, fs=preset['sample_rate'])
+            self.reset_epochs(force=True)
+        self.budget = PerformanceBudget(preset['cpu_budget'], preset['latency_budget_ms'])
+        self.degrade_level = 0
+        self.degrade_levels = degrade_levels(preset)
+        self.apply_settings(self.degrade_levels[0])
+        info = describe_preset(preset)
+        connection = (preset['baudrate'], preset['channels'][0], preset['protocol'])
+        if self.ser is not None and self.ser.is_open and connection != (self.BAUDRATE, self.CHANNEL, self.PROTOCOL):
+            info += "\nReconnect to apply connection settings"
+        self.preset_info_var.set(info)
+        if self.canvas is not None and preset['y_range']:
+            self.ax.set_ylim(*preset['y_range'])
+
+    def save_preset(self):
+        name = simpledialog.askstring(
+            "Save profile", "Profile name:", parent=self.root,
+            initialvalue="" if self.preset_name in BUILTIN_PRESETS else self.preset_name
+        )
+        name = (name or "").strip()
+        if not name:
+            return
+        if name in BUILTIN_PRESETS:
+            messagebox.showerror("Save profile", f"'{name}' is a built-in profile, choose another name")
+            return
+        # Буферы, частота кадров, цепочка и бюджет берутся из текущего профиля (правятся в JSON)
+        channel = self.channel_var.get()
+        if self.autoscale_var.get():
+            y_range = None
+        else:
+            y_range = ([round(limit, 1) for limit in self.ax.get_ylim()] if self.canvas is not None
+                       else self.preset['y_range'])
+        preset = dict(
+            self.preset, baudrate=int(self.baudrate_var.get()),
+            channels=[channel] + [other for other in self.preset['channels'] if other != channel],
+            protocol=self.protocol_var.get(),
+            segment=self.segment_var.get(), y_range=y_range,
+            export=[kind for kind, var in (('edf', self.export_edf_var), ('parquet', self.export_parquet_var))
+                    if var.get()],
+        )
+        try:
+            self.presets.save(name, preset)
+        except ValueError as e:
+            messagebox.showerror("Save profile", f"Invalid profile: {e}")
+            return
+        self.preset_combo['values'] = self.presets.names()
+        self.apply_preset(name, remember=False)
+
+    # ---------------------- Вызванные ответы ----------------------
+
+    def profile_channels(self):
+        """Основной канал и остальные каналы профиля — в этом порядке они пишутся и усредняются."""
+        return [self.CHANNEL] + [channel for channel in self.preset['channels'] if channel != self.CHANNEL]
+
+    def reset_epochs(self, force=False):
+        """Пересоздаёт движок эпох, если изменились окно или каналы (или force); усреднения начинаются заново."""
+        try:
+            pre = self.epoch_samples(float(self.epoch_pre_var.get()))
+            post = max(1, self.epoch_samples(float(self.epoch_post_var.get())))
+        except ValueError:
+            messagebox.showerror("Evoked response", "Epoch window must be a number of milliseconds")
+            return
+        channels = self.profile_channels()
+        if force or (pre, post, channels) != (self.epochs.pre, self.epochs.post, self.epoch_channels):
+            self.epochs, self.epoch_channels = EpochEngine(pre, post, self.gsr.fs, len(channels)), channels
+            self.epoch_info_var.set("No epochs yet")
+            if self.erp_window is not None and self.erp_window.winfo_exists():
+                self.draw_evoked_response()
+
+    def poll_epochs(self):
+        if self.epochs.update():
+            e = self.epochs
+            self.epoch_info_var.set(f"📈 Epochs: {e.accepted} averaged, {e.rejected} rejected | "
+                                    + ", ".join(f"{label}: {avg.n}" for label, avg in sorted(e.averages.items())))
+            if self.erp_window is not None and self.erp_window.winfo_exists():
+                self.draw_evoked_response()
+        if self.running:
+            self.root.after(500, self.poll_epochs)
+
+    def show_evoked_response(self):
+        self.reset_epochs()
+        if self.erp_window is not None and self.erp_window.winfo_exists():
+            self.erp_window.lift()
+            return
+        self.erp_window = tk.Toplevel(self.root)
+        self.erp_window.title("Evoked response (mean ± 95% CI)")
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        self.erp_figure = Figure(figsize=(6, 4))
+        self.erp_canvas = FigureCanvasTkAgg(self.erp_figure, master=self.erp_window)
+        self.erp_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.draw_evoked_response()
+
+    def draw_evoked_response(self):
+        # По графику на канал профиля, общая ось времени
+        self.erp_figure.clear()
+        channels = self.epoch_channels
+        axes = self.erp_figure.subplots(len(channels), 1, sharex=True, squeeze=False)[:, 0]
+        times = self.epochs.times_ms
+        for row, (ax, channel) in enumerate(zip(axes, channels)):
+            for label, average in sorted(self.epochs.averages.items()):
+                low, high = average.band(0.95)
+                line, = ax.plot(times, average.mean[row], label=f"{label} (n={average.n})")
+                ax.fill_between(times, low[row], high[row], color=line.get_color(), alpha=0.2)
+            ax.axvline(0, color='gray', linestyle='--')
+            ax.set_ylabel(f'{channel}, baseline-corrected' if len(channels) > 1 else 'Baseline-corrected value')
+        axes[-1].set_xlabel('Time from marker (ms)')
+        if self.epochs.averages:
+            axes[0].legend()
+        else:
+            axes[0].set_title('Waiting for markers...')
+        self.erp_canvas.draw_idle()
+
+    def update_display(self):
+        self.display_pending = False
+        self.last_render = time.perf_counter()
+        self.render_sample_time = self.last_sample_time
         if self.x_data and self.y_data:
+            value = self.y_data[-1]
+            if self.follow_latest:
+                self.follow_latest = False
+                self.update_scrollbar_position()
             self.update_plot_view()
             self.counter_var.set(f"📊 Data points: {self.counter}")
             self.value_var.set(f"🎯 Current value: {value}")
+            self.stats_var.set(f"📐 Mean: {self.stats.mean:.1f} ± {self.stats.std:.1f} | "
+                               f"RMS: {self.stats.rms:.1f} | Peak: {self.stats.maximum}")
+            gsr_info = f"💧 Tonic: {self.gsr.tonic_level:.1f} | Phasic: {self.gsr.phasic:+.1f} | SCR: {self.gsr.scr_count}"
+            if self.scr_events:
+                onset, peak, amplitude, rise_time, onset_ts = self.scr_events[-1]
+                gsr_info += f" (last: amp {amplitude:.1f}, rise {rise_time:.2f}s)"
+            self.gsr_var.set(gsr_info)
 
     def browse_save_path(self):
         filename = filedialog.asksaveasfilename(
@@ -326,120 +997,110 @@ class GSRMonitor:
             messagebox.showerror("Error", "Please select a save path first")
             return
         try:
-            self.csv_file = open(self.path_var.get(), 'w', newline='', encoding='utf-8')
-            self.csv_writer = csv.writer(self.csv_file)
-            self.csv_writer.writerow(['timestamp', 'value', 'counter', 'channel'])
+            max_seconds, max_bytes = SEGMENT_OPTIONS[self.segment_var.get()]
+            self.recorder = SegmentedRecorder(self.path_var.get(), RECORDING_HEADER, max_seconds, max_bytes)
+            self.record_artifacts_start = self.artifact_count
+            self.record_scr_start = self.gsr.scr_count
+            self.record_markers_start = self.markers.count
+            self.record_marker_labels = {}
+            self.record_artifact_kinds = {}
+            self.record_artifact_samples = 0
+            self.open_sidecar_files()
+            self.record_channels = self.profile_channels()
+            self.export_sinks = self.open_export_sinks()
             self.recording = True
             self.record_start_time = time.time()
-            self.recorded_data = []
+            self.record_lost_start = self.decoder.lost
+            self.record_resyncs_start = self.decoder.resyncs
+            self.record_samples = 0
             self.record_status_var.set("🟢 Recording: ON")
             self.start_record_btn.config(state="disabled")
             self.stop_record_btn.config(state="normal")
             self.record_info_var.set(f"Recording started! Saving to: {os.path.basename(self.path_var.get())}")
             messagebox.showinfo("Recording Started", f"Data recording started!\nFile: {self.path_var.get()}\nData will be saved in real-time.")
         except Exception as e:
+            self.abort_recording()
             messagebox.showerror("Error", f"Failed to start recording: {e}")
 
     def stop_recording(self):
         if self.recording:
             self.recording = False
-            if self.csv_file:
-                self.csv_file.close()
-                self.csv_file = None
-                self.csv_writer = None
+            self.handle_artifacts(self.detector.flush())
+            if self.recorder:
+                self.record_segments = self.recorder.segment_count
+                self.recorder.close()
+                self.recorder = None
+            self.close_sidecar_files()
+            export_warnings = self.close_export_sinks()
             duration = time.time() - self.record_start_time
-            data_points = len(self.recorded_data)
+            data_points = self.record_samples
             self.record_status_var.set("🔴 Recording: OFF")
             self.start_record_btn.config(state="normal")
             self.stop_record_btn.config(state="disabled")
             self.record_info_var.set(f"Recording saved! {data_points} points | Duration: {duration:.1f}s | File: {os.path.basename(self.path_var.get())}")
-            messagebox.showinfo("Recording Stopped", f"Recording completed!\n\n📊 Data points: {data_points}\n⏱️ Duration: {duration:.1f} seconds\n📁 File: {self.path_var.get()}\n📈 Average rate: {data_points / duration:.1f} points/second")
-
-    def clear_plot(self):
-        self.x_data.clear()
-        self.y_data.clear()
-        self.counter = 0
-        self.scroll_position = 0
-        self.scroll_var.set(0)
-        self.line.set_data([], [])
-        self.ax.set_xlim(0, self.visible_points)
-        self.canvas.draw()
-        self.counter_var.set("📊 Data points: 0")
-        self.value_var.set("🎯 Current value: --")
-        self.scroll_info_var.set("Viewing: latest data")
+            self.register_session(duration, data_points)
+            summary = f"Recording completed!\n\n📊 Data points: {data_points}\n⏱️ Duration: {duration:.1f} seconds\n📁 File: {self.path_var.get()}\n📈 Average rate: {data_points / duration:.1f} points/second"
+            if self.PROTOCOL == PROTOCOL_BINARY:
+                summary += (f"\n📉 Lost frames: {self.decoder.lost - self.record_lost_start}, "
+                            f"resyncs: {self.decoder.resyncs - self.record_resyncs_start}")
+            summary += f"\n⚠️ Artifact events: {self.artifact_count - self.record_artifacts_start}"
+            summary += f"\n💧 SCRs: {self.gsr.scr_count - self.record_scr_start}"
+            summary += f"\n📍 Markers: {self.markers.count - self.record_markers_start}"
+            summary += ''.join(f"\n⚠️ {warning}" for warning in export_warnings)
+            messagebox.showinfo("Recording Stopped", summary)
+
+    def register_session(self, duration, data_points):
+        try:
+            if self.catalog is None:
+                self.catalog = RecordingCatalog()
+            self.catalog.register(dict(
+                path=self.recorded_path(), device="Arduino serial", signal=SIGNAL_TYPE,
+                port=self.PORT, protocol=self.PROTOCOL, channels=','.join(self.record_channels),
+                sample_rate=data_points / duration if duration > 0 else 0.0,
+                start_time=self.record_start_time, duration_s=duration, samples=data_points,
+                marker_count=sum(self.record_marker_labels.values()), markers=self.record_marker_labels,
+                artifact_count=sum(self.record_artifact_kinds.values()), artifacts=self.record_artifact_kinds,
+                artifact_share=self.record_artifact_samples / data_points if data_points else 0.0,
+                scr_count=self.gsr.scr_count - self.record_scr_start,
+                lost_frames=self.decoder.lost - self.record_lost_start if self.PROTOCOL == PROTOCOL_BINARY else None,
+            ))
+        except Exception as e:
+            self.record_info_var.set(f"{self.record_info_var.get()} | Catalog error: {e}")
 
     def stop(self):
         if self.recording:
             self.stop_recording()
         self.running = False
+        self.marker_server.stop()
         if self.ser and self.ser.is_open:
             self.ser.close()
         self.root.quit()
         self.root.destroy()
 
-    def on_scroll(self, value):
-        if len(self.x_data) > self.visible_points:
-            max_scroll = len(self.x_data) - self.visible_points
-            self.scroll_position = int(float(value) / 100 * max_scroll)
-            self.update_plot_view()
-
-    def scroll_up(self):
-        if self.scroll_position > 0:
-            self.scroll_position -= 10
-            if self.scroll_position < 0:
-                self.scroll_position = 0
-            self.update_scrollbar_position()
-            self.update_plot_view()
-
-    def scroll_down(self):
-        max_scroll = max(0, len(self.x_data) - self.visible_points)
-        if self.scroll_position < max_scroll:
-            self.scroll_position += 10
-            if self.scroll_position > max_scroll:
-                self.scroll_position = max_scroll
-            self.update_scrollbar_position()
-            self.update_plot_view()
-
-    def scroll_to_latest(self):
-        self.scroll_position = max(0, len(self.x_data) - self.visible_points)
-        self.update_scrollbar_position()
-        self.update_plot_view()
-
-    def update_scrollbar_position(self):
-        max_scroll = max(1, len(self.x_data) - self.visible_points)
-        if max_scroll > 0:
-            scroll_percentage = (self.scroll_position / max_scroll) * 100
-            self.scroll_var.set(scroll_percentage)
-
-    def update_plot_view(self):
-        if len(self.x_data) > 0:
-            start_idx = self.scroll_position
-            end_idx = start_idx + self.visible_points
-
-            if len(self.x_data) >= end_idx:
-                x_view = list(self.x_data)[start_idx:end_idx]
-                y_view = list(self.y_data)[start_idx:end_idx]
-            else:
-                x_view = list(self.x_data)
-                y_view = list(self.y_data)
-
-            self.line.set_data(x_view, y_view)
-            self.ax.set_xlim(start_idx, end_idx)
-
-            total_points = len(self.x_data)
-            if total_points > self.visible_points:
-                view_info = f"Viewing: {start_idx}-{min(end_idx, total_points)} of {total_points}"
-                if end_idx >= total_points:
-                    view_info += " (LATEST)"
-            else:
-                view_info = "Viewing: all data"
-
-            self.scroll_info_var.set(view_info)
-            self.canvas.draw_idle()
-
 
 def main():
+    # python lab5.py batch <каталог> — пакетный анализ записей без GUI
+    if sys.argv[1:2] == ['batch']:
+        batch_main(sys.argv[2:], BATCH_ADC_MAX)
+        return
+    # python lab5.py catalog --channel A1 --min-duration 600 --days 31 — поиск по каталогу
+    if sys.argv[1:2] == ['catalog']:
+        catalog_main(sys.argv[2:], SIGNAL_TYPE, BATCH_ADC_MAX)
+        return
+    # python lab5.py export <запись.csv> [--edf out.edf] [--parquet out.parquet]
+    if sys.argv[1:2] == ['export']:
+        export_main(sys.argv[2:], SIGNAL_TYPE, BATCH_ADC_MAX)
+        return
+    # python lab5.py epochs <запись.csv> --pre 0.2 --post 0.8 --labels key_1 key_2 — усреднение по меткам
+    if sys.argv[1:2] == ['epochs']:
+        epochs_main(sys.argv[2:])
+        return
+    # python lab5.py soak --hours 4 --speed 10 — длительный прогон на синтетическом устройстве
+    if sys.argv[1:2] == ['soak']:
+        sys.exit(soak_main(sys.argv[2:]))
+    STARTUP.mark('imports')
     root = tk.Tk()
+    STARTUP.mark('tk root')
     app = GSRMonitor(root)
     root.protocol("WM_DELETE_WINDOW", app.stop)
     root.mainloop()
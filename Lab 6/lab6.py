@@ -1,13 +1,13 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import serial.tools.list_ports
 import time
+STARTUP_T0 = time.perf_counter()
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox, simpledialog
 from collections import deque
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import threading
-import csv
+import numpy as np
 import os
+import sys
+import argparse
 from datetime import datetime
 
 import inspect
@@ -24,11 +24,299 @@ if not hasattr(inspect, "getargspec"):
     inspect.getargspec = getargspec
 # -------------------------------------------------------------------------
 
+# Общий модуль sensorlab.py лежит в корне репозитория, на уровень выше лабораторных
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import (
+    load_matplotlib, StartupProfile, WindowStats, AutoScaler, ArtifactDetector, GsrDecomposer,
+    MARKER_PORT, MarkerTrack, MarkerServer, SEGMENT_OPTIONS, SegmentedRecorder, DEVICE_TAGGED,
+    DEVICE_BINARY, DEVICE_FIRMATA, probe_ports, candidate_ports, PortCache, describe_probe,
+    RECORDING_HEADER, batch_main, RecordingCatalog, catalog_main, PARQUET_AVAILABLE, ParquetSink,
+    EdfSink, export_main, EPOCH_PRE_MS, EPOCH_POST_MS, EpochEngine, epochs_main, SyntheticSignal,
+    SoakTest, DEFAULT_PRESET, normalize_preset, degrade_levels, describe_preset, PresetStore,
+    PerformanceBudget, MonitorMixin,
+)
+
+STARTUP = StartupProfile(STARTUP_T0)
+
+
+# ---------------------- Параметры Lab 6 ----------------------
+
+# Firmata на 57600; 115200 — скетчи Lab 5, чтобы подсказать, что плата не та
+PROBE_BAUDRATES = (57600, 115200)
+
+SIGNAL_TYPE = 'GSR'
+BATCH_ADC_MAX = 1023
+SOAK_NOMINAL_RATE = 100.0  # частота опроса пина потоком чтения
+
+
+# ---------------------- Биологическая обратная связь (выходы Firmata) ----------------------
+
+RULE_ABOVE = "Value above"
+RULE_BELOW = "Value below"
+RULE_BAND_RATIO = "Band ratio above"
+RULE_SCR_ONSET = "SCR onset"
+
+OUTPUT_DIGITAL = "Digital"
+OUTPUT_PWM = "PWM"
+
+
+class FeedbackRule:
+    """Условие на входном потоке и выход на пин платы.
+
+    Для цифрового выхода условие включает/выключает пин (SCR — импульс длиной
+    hold_s). Для ШИМ выход пропорционален метрике в диапазоне [low, high]
+    (по умолчанию [threshold, 2 * threshold]), для RULE_BELOW — инвертирован.
+    """
+
+    def __init__(self, condition, threshold, pin_def, output=OUTPUT_DIGITAL,
+                 low=None, high=None, band_a=(8.0, 12.0), band_b=(13.0, 30.0), hold_s=0.5):
+        self.condition = condition
+        self.threshold = threshold
+        self.pin_def = pin_def
+        self.output = output
+        self.low = low
+        self.high = high
+        self.band_a = band_a
+        self.band_b = band_b
+        self.hold_s = hold_s
+        self.pin = None
+        self.state = None
+        self.hold_until = 0.0
+
+    def level(self, metric):
+        if self.output == OUTPUT_PWM:
+            low = self.threshold if self.low is None else self.low
+            high = 2 * self.threshold if self.high is None else self.high
+            if high > low:
+                level = min(max((metric - low) / (high - low), 0.0), 1.0)
+            else:
+                level = 1.0 if metric >= low else 0.0
+            if self.condition == RULE_BELOW:
+                level = 1.0 - level
+            return round(float(level), 3)
+        if self.condition == RULE_BELOW:
+            return 1 if metric < self.threshold else 0
+        return 1 if metric > self.threshold else 0
+
+
+class FeedbackEngine:
+    """Вычисляет правила на каждом отсчёте и пишет в пины только при изменении уровня.
+
+    Полосовая мощность считается БПФ по окну band_window отсчётов раз в band_step
+    отсчётов, остальные условия — за O(1). Задержка «вход → выход» измеряется от
+    прихода отсчёта до завершения записи в пин. process вызывается из потока чтения,
+    остальное — из потока Tk, поэтому правила и их пины меняются только под self.lock.
+    """
+
+    def __init__(self, band_window=256, band_step=16, budget_ms=50.0):
+        self.rules = []
+        self.band_window = band_window
+        self.band_step = band_step
+        self.budget_ms = budget_ms
+        self.samples = deque(maxlen=band_window)
+        self.since_band = 0
+        self.band_ratios = {}
+        self.latencies_ms = deque(maxlen=5000)
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def add_rule(self, rule):
+        with self.lock:
+            self.rules.append(rule)
+        return rule
+
+    def clear(self):
+        """Снимает все правила; их пины гасятся и переводятся во вход (INPUT) под той же
+        блокировкой, так что process не запишет в пин после выключения."""
+        with self.lock:
+            rules, self.rules = self.rules, []
+            self.band_ratios = {}
+            for rule in rules:
+                try:
+                    rule.pin.write(0)
+                    rule.pin.mode = 0  # INPUT: освобождаем пин
+                    rule.pin.taken = False
+                except Exception:
+                    pass
+
+    def reset_latency(self):
+        with self.lock:
+            self.latencies_ms.clear()
+            self.writes = 0
+
+    def latencies(self):
+        with self.lock:
+            return list(self.latencies_ms)
+
+    def _update_band_ratios(self, fs):
+        x = np.asarray(self.samples, dtype=np.float64)
+        x = (x - x.mean()) * np.hanning(x.size)
+        power = np.abs(np.fft.rfft(x)) ** 2
+        freqs = np.fft.rfftfreq(x.size, d=1.0 / fs)
+        for rule in self.rules:
+            if rule.condition != RULE_BAND_RATIO:
+                continue
+            a = power[(freqs >= rule.band_a[0]) & (freqs < rule.band_a[1])].sum()
+            b = power[(freqs >= rule.band_b[0]) & (freqs < rule.band_b[1])].sum()
+            self.band_ratios[id(rule)] = a / b if b > 0 else 0.0
+
+    def process(self, value, t_arrival, fs, scr_onset=False):
+        with self.lock:
+            if not self.rules:
+                return
+            self.samples.append(value)
+            self.since_band += 1
+            if self.since_band >= self.band_step and len(self.samples) == self.band_window:
+                self.since_band = 0
+                self._update_band_ratios(fs)
+
+            now = time.monotonic()
+            for rule in self.rules:
+                if rule.pin is None:
+                    continue
+                if rule.condition == RULE_SCR_ONSET:
+                    if scr_onset:
+                        rule.hold_until = now + rule.hold_s
+                    level = 1 if now < rule.hold_until else 0
+                elif rule.condition == RULE_BAND_RATIO:
+                    level = rule.level(self.band_ratios.get(id(rule), 0.0))
+                else:
+                    level = rule.level(value)
+                if level == rule.state:
+                    continue
+                rule.pin.write(level)
+                rule.state = level
+                self.writes += 1
+                self.latencies_ms.append((time.monotonic() - t_arrival) * 1000)
+
+    def latency_summary(self):
+        data = sorted(self.latencies())
+        if not data:
+            return None
+        n = len(data)
+        return {
+            'count': n,
+            'p50': data[n // 2],
+            'p95': data[min(n - 1, int(n * 0.95))],
+            'max': data[-1],
+            'within_budget': sum(1 for v in data if v <= self.budget_ms) / n,
+        }
+
+
+# ---------------------- Длительный прогон (soak) на синтетическом устройстве ----------------------
+
+class SyntheticBoard:
+    """Поддельная плата Firmata: поток подаёт отсчёты в монитор, как итератор pyfirmata."""
+
+    def __init__(self, app, rate, seed=0):
+        self.app = app
+        self.rate = rate
+        self.signal = SyntheticSignal(SOAK_NOMINAL_RATE, 1023, seed)
+        self.delivered = 0
+        self.running = False
 
-from pyfirmata import Arduino, util
+    def start(self):
+        self.running = True
+        self.started = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while self.running:
+            due = int((time.perf_counter() - self.started) * self.rate)
+            if due <= self.delivered:
+                time.sleep(1 / self.rate)
+                continue
+            for value in self.signal.block(self.delivered, min(due - self.delivered, 1024)):
+                self.app.process_sample(int(value), time.time())
+                self.delivered += 1
+
+    def backlog_ms(self):
+        due = (time.perf_counter() - self.started) * self.rate
+        return max(0.0, due - self.delivered) / self.rate * 1000
+
+    def exit(self):
+        self.running = False
 
 
-class GSRMonitor:
+class FirmataSoakTest(SoakTest):
+    """Прогон Lab 6: поток синтетической платы подаёт отсчёты вместо итератора pyfirmata."""
+
+    def connect(self):
+        app = self.app
+        app.PORT, app.CHANNEL = 'synthetic', app.channel_var.get()
+        app.board = SyntheticBoard(app, self.rate)
+        app.status_var.set("✅ Connected to synthetic board (soak)")
+        app.connect_btn.config(text="🔌 Disconnect")
+        app.start_record_btn.config(state="normal")
+        app.board.start()
+        return app.board
+
+
+def soak_main(argv):
+    parser = argparse.ArgumentParser(prog='soak', description='Long-run soak test against a synthetic device')
+    parser.add_argument('--hours', type=float, default=1.0)
+    parser.add_argument('--speed', type=float, default=3.0,
+                        help=f'sample rate as a multiple of {SOAK_NOMINAL_RATE:g} Hz')
+    parser.add_argument('--interval', type=float, default=10.0, help='metric sampling period, s')
+    parser.add_argument('--segment', choices=list(SEGMENT_OPTIONS), default="60 min")
+    parser.add_argument('--output', default=None, help='directory for the recording and soak_metrics.csv')
+    parser.add_argument('--no-tracemalloc', action='store_true')
+    parser.add_argument('--preset', default=DEFAULT_PRESET, help='session profile (built-in or saved)')
+    args = parser.parse_args(argv)
+    if args.preset not in PresetStore(SIGNAL_TYPE, BUILTIN_PRESETS, normalize_lab_preset).names():
+        parser.error(f"unknown profile {args.preset!r}")
+    out_dir = args.output or os.path.join(os.getcwd(), f"soak_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    # Диалоги остановили бы прогон: информационные окна глушим, ошибки — в stderr
+    messagebox.showinfo = lambda *args, **kwargs: None
+    messagebox.askyesno = lambda *args, **kwargs: True
+    messagebox.showerror = lambda title, message, **kwargs: print(f"{title}: {message}", file=sys.stderr)
+    root = tk.Tk()
+    app = GSRMonitor(root)
+    app.apply_preset(args.preset, remember=False)
+    root.protocol("WM_DELETE_WINDOW", app.stop)
+    soak = FirmataSoakTest(app, args.hours * 3600, out_dir, SOAK_NOMINAL_RATE * args.speed, args.interval,
+                           not args.no_tracemalloc, args.segment)
+    root.after(500, soak.start)
+    root.mainloop()
+    return 1 if soak.failed or soak.failed is None else 0
+
+
+# ---------------------- Профили сеанса ----------------------
+
+BUILTIN_PRESETS = {
+    # Прежние значения, зашитые в GSRMonitor
+    DEFAULT_PRESET: dict(
+        baudrate=115200, channels=['A0'], sample_rate=100.0, poll_ms=10.0,
+        buffer_points=1000, visible_points=500, render_fps=30.0, decimation=1, y_range=None,
+        segment="Off", export=[], chain=['artifacts', 'gsr', 'epochs'],
+        cpu_budget=80.0, latency_budget_ms=200.0, degrade=True,
+    ),
+    "GSR slow single-channel": dict(
+        baudrate=115200, channels=['A0'], sample_rate=20.0, poll_ms=50.0,
+        buffer_points=6000, visible_points=1200, render_fps=5.0, decimation=1, y_range=None,
+        segment="60 min", export=[], chain=['gsr', 'artifacts'],
+        cpu_budget=15.0, latency_budget_ms=400.0, degrade=True,
+    ),
+    "GSR biofeedback 100 Hz": dict(
+        baudrate=115200, channels=['A0'], sample_rate=100.0, poll_ms=10.0,
+        buffer_points=3000, visible_points=500, render_fps=30.0, decimation=1, y_range=None,
+        segment="Off", export=[], chain=['gsr', 'artifacts', 'epochs'],
+        cpu_budget=40.0, latency_budget_ms=100.0, degrade=True,
+    ),
+}
+
+
+def normalize_lab_preset(preset):
+    """normalize_preset по Default этой лабораторной. Firmata: отсчёт — одно чтение пина
+    за период опроса (читается первый канал), поэтому частота выводится из poll_ms."""
+    result = normalize_preset(preset, BUILTIN_PRESETS[DEFAULT_PRESET])
+    if result['poll_ms'] <= 0:
+        raise ValueError(f"poll_ms: invalid value {result['poll_ms']!r}")
+    result['sample_rate'] = 1000.0 / result['poll_ms']
+    return result
+
+
+class GSRMonitor(MonitorMixin):
     def __init__(self, root):
         self.root = root
         self.root.title("Advanced Sensor Monitor - Real Time (Firmata)")
@@ -38,14 +326,28 @@ class GSRMonitor:
         # Запись
         self.recording = False
         self.record_start_time = None
-        self.csv_file = None
-        self.csv_writer = None
-        self.recorded_data = []
+        self.recorder = None
+        self.record_samples = 0
+        self.display_pending = False
+        self.follow_latest = False
+
+        # Профиль сеанса: буферы, отрисовка, запись, цепочка обработки и бюджет
+        self.presets = PresetStore(SIGNAL_TYPE, BUILTIN_PRESETS, normalize_lab_preset)
+        self.preset_name = self.presets.last
+        self.preset = self.presets.get(self.preset_name)
+        self.settings = dict(self.preset)
+        self.stages = frozenset(self.preset['chain'])
+        self.degrade_level = 0
+        self.degrade_levels = degrade_levels(self.preset)
+        self.budget = PerformanceBudget(self.preset['cpu_budget'], self.preset['latency_budget_ms'])
+        self.last_render = 0.0
+        self.last_sample_time = None
+        self.render_sample_time = None
 
         # Порт/канал
         self.PORT = None
-        self.BAUDRATE = 115200
-        self.CHANNEL = 'A0'
+        self.BAUDRATE = self.preset['baudrate']
+        self.CHANNEL = self.preset['channels'][0]
 
         # Объект платы Firmata
         self.board = None
@@ -53,22 +355,93 @@ class GSRMonitor:
         self.analog_pin = None
 
         # Данные для графика
-        self.x_data = deque(maxlen=1000)
-        self.y_data = deque(maxlen=1000)
+        self.x_data = deque(maxlen=self.preset['buffer_points'])
+        self.y_data = deque(maxlen=self.preset['buffer_points'])
         self.counter = 0
         self.running = True
 
         # Параметры отображения/скролла
-        self.visible_points = 500
+        self.visible_points = self.preset['visible_points']
         self.scroll_position = 0
 
+        # Скользящая статистика и автомасштаб
+        self.ADC_MAX = 1023
+        self.stats = WindowStats(1000, value_max=self.ADC_MAX)
+        self.view_stats = WindowStats(self.visible_points, value_max=self.ADC_MAX)
+        self.autoscaler = AutoScaler(0, self.ADC_MAX, self.ADC_MAX)
+
+        # Детектор артефактов и журнал событий
+        self.detector = ArtifactDetector(self.ADC_MAX)
+        self.artifact_events = deque(maxlen=500)
+        self.artifact_count = 0
+        self.record_artifacts_start = 0
+        self.event_file = None
+        self.event_writer = None
+
+        # Разложение КГР и поиск SCR
+        self.gsr = GsrDecomposer(self.ADC_MAX, fs=self.preset['sample_rate'])
+        self.tonic_data = deque(maxlen=self.preset['buffer_points'])
+        self.scr_events = deque(maxlen=200)
+        self.record_scr_start = 0
+        self.scr_file = None
+        self.scr_writer = None
+
+        # Метки стимулов
+        self.markers = MarkerTrack()
+        self.epochs = EpochEngine(
+            self.epoch_samples(EPOCH_PRE_MS), self.epoch_samples(EPOCH_POST_MS), self.gsr.fs
+        )
+        self.erp_window = None
+        self.marker_server = MarkerServer(self.markers)
+        self.record_markers_start = 0
+        self.marker_file = None
+        self.marker_writer = None
+
+        # Каталог записей
+        self.catalog = None
+        self.port_cache = PortCache()
+        self.port_info = {}
+        self.probing = False
+        self.probe_cancel = threading.Event()
+        self.probe_thread = None
+        self.record_marker_labels = {}
+        self.record_artifact_kinds = {}
+        self.record_artifact_samples = 0
+        self.export_sinks = []
+        # Поток чтения пишет в приёмники экспорта, поток Tk закрывает их при остановке записи
+        self.export_lock = threading.Lock()
+        self.sidecar_lock = threading.Lock()
+        self.record_segments = 0
+
+        # Обратная связь через выходы Firmata
+        self.feedback = FeedbackEngine()
+        self.analog_arrival = {}
+        self.scr_rising = False
+        self.latency_window = None
+
+        self.startup = STARTUP
         self.setup_styles()
         self.setup_ui()
-        self.refresh_ports()
-        self.start_serial_reading()
+        self.apply_preset(self.preset_name, remember=False)
+        if self.presets.errors:
+            self.status_var.set("⚠️ Invalid profiles skipped: " + "; ".join(self.presets.errors))
+        self.recover_recordings()
+        self.start_marker_server()
+        self.startup.mark('ui shell')
+        # Порты, поток чтения и график — после показа окна; тяжёлые модули грузятся в фоне
+        self.window_shown = False
+        self.root.bind('<Map>', self.on_first_map)
+        self.preload_thread = threading.Thread(target=self.preload_modules, daemon=True)
+        self.preload_thread.start()
 
     # ---------------------- UI и стили ----------------------
 
+    def preload_modules(self):
+        started = time.perf_counter()
+        load_matplotlib()
+        import pyfirmata  # noqa: F401 — подключение к плате не ждёт импорта
+        self.startup.background['module preload'] = (time.perf_counter() - started) * 1000
+
     def setup_styles(self):
         style = ttk.Style()
         style.theme_use('clam')
@@ -98,6 +471,18 @@ class GSRMonitor:
                   style='Header.TLabel', anchor='center').pack(fill=tk.X, pady=(0, 10))
         self.setup_recording_panel(left_panel)
 
+        ttk.Separator(left_panel, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=15)
+
+        ttk.Label(left_panel, text="📍 Stimulus Markers",
+                  style='Header.TLabel', anchor='center').pack(fill=tk.X, pady=(0, 10))
+        self.setup_marker_panel(left_panel)
+
+        ttk.Separator(left_panel, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=15)
+
+        ttk.Label(left_panel, text="🎛️ Biofeedback Output",
+                  style='Header.TLabel', anchor='center').pack(fill=tk.X, pady=(0, 10))
+        self.setup_feedback_panel(left_panel)
+
         # Правая панель
         right_panel = ttk.Frame(self.root, padding=10)
         right_panel.grid(row=0, column=1, sticky='nsew')
@@ -114,6 +499,19 @@ class GSRMonitor:
         frame = ttk.Frame(parent)
         frame.pack(fill=tk.X)
 
+        ttk.Label(frame, text="Session profile:").pack(anchor='w', pady=3)
+        self.preset_var = tk.StringVar(value=self.preset_name)
+        self.preset_combo = ttk.Combobox(
+            frame, textvariable=self.preset_var, values=self.presets.names(),
+            width=20, state="readonly"
+        )
+        self.preset_combo.pack(fill=tk.X, pady=3)
+        self.preset_combo.bind("<<ComboboxSelected>>", lambda event: self.apply_preset(self.preset_var.get()))
+        ttk.Button(frame, text="💾 Save Profile", command=self.save_preset).pack(fill=tk.X, pady=(0, 5))
+        self.preset_info_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.preset_info_var, font=("Helvetica", 9), foreground="#444",
+                  wraplength=220, justify=tk.LEFT).pack(anchor='w')
+
         ttk.Label(frame, text="Port:").pack(anchor='w', pady=3)
         self.port_var = tk.StringVar()
         self.port_combo = ttk.Combobox(
@@ -124,6 +522,12 @@ class GSRMonitor:
         refresh_btn = ttk.Button(frame, text="🔄 Refresh Ports", command=self.refresh_ports)
         refresh_btn.pack(fill=tk.X, pady=5)
 
+        detect_btn = ttk.Button(frame, text="🔎 Detect Devices", command=self.probe_devices)
+        detect_btn.pack(fill=tk.X, pady=(0, 5))
+        self.probe_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.probe_var, font=("Helvetica", 9), foreground="#444",
+                  wraplength=220, justify=tk.LEFT).pack(anchor='w')
+
         ttk.Label(frame, text="Baudrate (Firmata auto):").pack(anchor='w', pady=3)
         self.baudrate_var = tk.StringVar(value="115200")
         baudrates = ["57600", "115200"]
@@ -163,10 +567,26 @@ class GSRMonitor:
         value_label = ttk.Label(info_frame, textvariable=self.value_var)
         value_label.grid(row=0, column=2, sticky='w', padx=10)
 
+        self.stats_var = tk.StringVar(value="📐 Mean: -- | RMS: -- | Peak: --")
+        stats_label = ttk.Label(info_frame, textvariable=self.stats_var)
+        stats_label.grid(row=0, column=3, sticky='w', padx=10)
+
         self.record_status_var = tk.StringVar(value="🔴 Recording: OFF")
         record_status_label = ttk.Label(info_frame, textvariable=self.record_status_var,
                                         foreground="red")
-        record_status_label.grid(row=0, column=3, sticky='e', padx=5)
+        record_status_label.grid(row=0, column=4, sticky='e', padx=5)
+
+        self.artifact_var = tk.StringVar(value="⚠️ Artifacts: 0")
+        artifact_label = ttk.Label(info_frame, textvariable=self.artifact_var, style='Info.TLabel')
+        artifact_label.grid(row=1, column=0, columnspan=3, sticky='w', padx=5)
+
+        self.gsr_var = tk.StringVar(value="💧 Tonic: -- | Phasic: -- | SCR: 0")
+        gsr_label = ttk.Label(info_frame, textvariable=self.gsr_var, style='Info.TLabel')
+        gsr_label.grid(row=1, column=3, columnspan=2, sticky='w', padx=10)
+
+        self.budget_var = tk.StringVar(value="⏱️ CPU -- | frame latency --")
+        budget_label = ttk.Label(info_frame, textvariable=self.budget_var, style='Info.TLabel')
+        budget_label.grid(row=2, column=0, columnspan=6, sticky='w', padx=5)
 
     def setup_plot_with_scroll(self, parent):
         plot_frame = ttk.LabelFrame(parent, text="📈 Real-time Data with Scroll", padding=10)
@@ -178,25 +598,11 @@ class GSRMonitor:
         graph_scroll_frame.grid(row=0, column=0, sticky='nsew')
         graph_scroll_frame.columnconfigure(0, weight=1)
 
-        self.fig, self.ax = plt.subplots(figsize=(12, 5))
-        self.ax.set_facecolor('#fefefe')
-        self.fig.patch.set_facecolor('#f9f9f9')
-
-        self.ax.set_ylim(0, 1023)
-        self.ax.set_xlim(0, self.visible_points)
-        self.ax.set_title(
-            f'Sensor Data - Channel {self.channel_var.get()} (Firmata, scroll to navigate)',
-            fontsize=14, pad=20
-        )
-        self.ax.set_xlabel('Time (samples)', fontsize=12)
-        self.ax.set_ylabel('Sensor Value (0–1023)', fontsize=12)
-        self.ax.grid(True, alpha=0.3, linestyle='--')
-
-        self.line, = self.ax.plot([], [], 'teal', linewidth=2, alpha=0.8)
-
-        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_scroll_frame)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew')
+        # Фигура строится после показа окна (build_plot), пока на её месте — заглушка
+        self.graph_frame = graph_scroll_frame
+        self.fig = self.ax = self.canvas = None
+        self.plot_placeholder = ttk.Label(graph_scroll_frame, text="⏳ Loading plot...", anchor='center')
+        self.plot_placeholder.grid(row=0, column=0, sticky='nsew')
 
         scroll_frame = ttk.Frame(graph_scroll_frame)
         scroll_frame.grid(row=0, column=1, sticky='ns', padx=5)
@@ -230,6 +636,59 @@ class GSRMonitor:
                                       font=("Helvetica", 9), foreground="#666666")
         scroll_info_label.pack(pady=5)
 
+        ttk.Separator(scroll_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=8)
+
+        self.autoscale_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(scroll_frame, text="Auto Y", variable=self.autoscale_var).pack(anchor='w')
+
+        ttk.Label(scroll_frame, text="Stats window:", font=("Helvetica", 9)).pack(
+            anchor='w', pady=(8, 0)
+        )
+        self.stats_window_var = tk.StringVar(value=str(self.stats.window))
+        stats_window_combo = ttk.Combobox(
+            scroll_frame, textvariable=self.stats_window_var,
+            values=["100", "250", "500", "1000", "2000", "5000"],
+            width=6, state="readonly"
+        )
+        stats_window_combo.pack(anchor='w')
+        stats_window_combo.bind("<<ComboboxSelected>>", self.on_stats_window_change)
+
+    def build_plot(self):
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        self.fig = Figure(figsize=(12, 5))
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_facecolor('#fefefe')
+        self.fig.patch.set_facecolor('#f9f9f9')
+
+        self.ax.set_ylim(*(self.settings['y_range'] or (0, 1023)))
+        self.ax.set_xlim(0, self.visible_points)
+        self.ax.set_title(
+            f'Sensor Data - Channel {self.channel_var.get()} (Firmata, scroll to navigate)',
+            fontsize=14, pad=20
+        )
+        self.ax.set_xlabel('Time (samples)', fontsize=12)
+        self.ax.set_ylabel('Sensor Value (0–1023)', fontsize=12)
+        self.ax.grid(True, alpha=0.3, linestyle='--')
+
+        self.line, = self.ax.plot([], [], 'teal', linewidth=2, alpha=0.8)
+        self.artifact_line, = self.ax.plot(
+            [], [], color='crimson', linewidth=3, marker='.', markersize=5, alpha=0.9
+        )
+        self.tonic_line, = self.ax.plot(
+            [], [], color='darkorange', linewidth=1.5, linestyle='--', alpha=0.8
+        )
+        self.scr_line, = self.ax.plot(
+            [], [], linestyle='none', marker='v', color='purple', markersize=8
+        )
+        self.marker_line, = self.ax.plot([], [], color='navy', linewidth=1.2, alpha=0.7)
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+        self.canvas.get_tk_widget().grid(row=0, column=0, sticky='nsew')
+        self.plot_placeholder.destroy()
+        self.update_plot_view()
+
     def setup_recording_panel(self, parent):
         record_frame = ttk.Frame(parent)
         record_frame.pack(fill=tk.X, pady=5)
@@ -253,6 +712,22 @@ class GSRMonitor:
 
         ttk.Button(path_row, text="📁 Browse", command=self.browse_save_path).pack(side=tk.RIGHT)
 
+        segment_row = ttk.Frame(record_frame)
+        segment_row.pack(fill=tk.X, pady=3)
+        ttk.Label(segment_row, text="New segment every:").pack(side=tk.LEFT)
+        self.segment_var = tk.StringVar(value="Off")
+        ttk.Combobox(segment_row, textvariable=self.segment_var, values=list(SEGMENT_OPTIONS),
+                     width=8, state="readonly").pack(side=tk.LEFT, padx=5)
+
+        export_row = ttk.Frame(record_frame)
+        export_row.pack(fill=tk.X, pady=3)
+        ttk.Label(export_row, text="Also write:").pack(side=tk.LEFT)
+        self.export_edf_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_row, text="EDF+", variable=self.export_edf_var).pack(side=tk.LEFT, padx=5)
+        self.export_parquet_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_row, text="Parquet", variable=self.export_parquet_var,
+                        state="normal" if PARQUET_AVAILABLE else "disabled").pack(side=tk.LEFT, padx=5)
+
         button_row = ttk.Frame(record_frame)
         button_row.pack(fill=tk.X, pady=10)
 
@@ -277,14 +752,129 @@ class GSRMonitor:
         )
         record_info_label.pack(anchor='w')
 
+    def setup_marker_panel(self, parent):
+        marker_frame = ttk.Frame(parent)
+        marker_frame.pack(fill=tk.X, pady=5)
+
+        label_row = ttk.Frame(marker_frame)
+        label_row.pack(fill=tk.X, pady=5)
+        ttk.Label(label_row, text="Label:", width=7).pack(side=tk.LEFT)
+        self.marker_label_var = tk.StringVar(value="stim")
+        ttk.Entry(label_row, textvariable=self.marker_label_var).pack(
+            side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 5)
+        )
+        ttk.Button(
+            label_row, text="📍 Mark",
+            command=lambda: self.add_marker(self.marker_label_var.get() or "stim", source='button')
+        ).pack(side=tk.RIGHT)
+
+        ttk.Label(
+            marker_frame, text=f"Keys 0-9 / Space, UDP 127.0.0.1:{MARKER_PORT}",
+            font=("Helvetica", 9), foreground="#444"
+        ).pack(anchor='w', pady=3)
+
+        self.marker_info_var = tk.StringVar(value="No markers yet")
+        ttk.Label(
+            marker_frame, textvariable=self.marker_info_var,
+            font=("Helvetica", 9), foreground="#0066cc"
+        ).pack(anchor='w')
+
+        epoch_row = ttk.Frame(marker_frame)
+        epoch_row.pack(fill=tk.X, pady=5)
+        ttk.Label(epoch_row, text="Epoch, ms:").pack(side=tk.LEFT)
+        self.epoch_pre_var = tk.StringVar(value=str(EPOCH_PRE_MS))
+        ttk.Entry(epoch_row, textvariable=self.epoch_pre_var, width=5).pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Label(epoch_row, text="before /").pack(side=tk.LEFT)
+        self.epoch_post_var = tk.StringVar(value=str(EPOCH_POST_MS))
+        ttk.Entry(epoch_row, textvariable=self.epoch_post_var, width=5).pack(side=tk.LEFT, padx=(5, 2))
+        ttk.Label(epoch_row, text="after").pack(side=tk.LEFT)
+        ttk.Button(
+            epoch_row, text="📈 Evoked Response", command=self.show_evoked_response
+        ).pack(side=tk.RIGHT)
+
+        self.epoch_info_var = tk.StringVar(value="No epochs yet")
+        ttk.Label(
+            marker_frame, textvariable=self.epoch_info_var,
+            font=("Helvetica", 9), foreground="#444"
+        ).pack(anchor='w')
+
+        self.root.bind('<KeyPress>', self.on_marker_key)
+
+    def setup_feedback_panel(self, parent):
+        fb_frame = ttk.Frame(parent)
+        fb_frame.pack(fill=tk.X, pady=5)
+
+        self.rule_var = tk.StringVar(value=RULE_ABOVE)
+        ttk.Combobox(
+            fb_frame, textvariable=self.rule_var,
+            values=[RULE_ABOVE, RULE_BELOW, RULE_BAND_RATIO, RULE_SCR_ONSET],
+            width=20, state="readonly"
+        ).pack(fill=tk.X, pady=3)
+
+        row = ttk.Frame(fb_frame)
+        row.pack(fill=tk.X, pady=3)
+        ttk.Label(row, text="Threshold:").pack(side=tk.LEFT)
+        self.threshold_var = tk.StringVar(value="600")
+        ttk.Entry(row, textvariable=self.threshold_var, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(row, text="Pin:").pack(side=tk.LEFT)
+        self.output_pin_var = tk.StringVar(value="13")
+        ttk.Entry(row, textvariable=self.output_pin_var, width=4).pack(side=tk.LEFT, padx=5)
+
+        self.output_mode_var = tk.StringVar(value=OUTPUT_DIGITAL)
+        ttk.Combobox(
+            fb_frame, textvariable=self.output_mode_var,
+            values=[OUTPUT_DIGITAL, OUTPUT_PWM], width=20, state="readonly"
+        ).pack(fill=tk.X, pady=3)
+
+        button_row = ttk.Frame(fb_frame)
+        button_row.pack(fill=tk.X, pady=5)
+        self.feedback_btn = ttk.Button(button_row, text="▶️ Enable", command=self.toggle_feedback)
+        self.feedback_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_row, text="📊 Latency", command=self.show_latency_histogram).pack(
+            side=tk.LEFT, padx=5
+        )
+
+        self.feedback_info_var = tk.StringVar(value="Feedback off")
+        ttk.Label(
+            fb_frame, textvariable=self.feedback_info_var,
+            font=("Helvetica", 9), foreground="#0066cc"
+        ).pack(anchor='w')
+
     # ---------------------- Подключение к плате (Firmata) ----------------------
 
-    def refresh_ports(self):
-        ports = serial.tools.list_ports.comports()
-        port_list = [port.device for port in ports]
-        self.port_combo['values'] = port_list
-        if port_list and not self.port_var.get():
-            self.port_var.set(port_list[0])
+    def probe_devices(self):
+        """Опрос USB-портов по кнопке: плате отправляется запрос Firmata, порт сбрасывает её по DTR."""
+        if self.probing:
+            return
+        busy = self.PORT if self.board is not None else None
+        ports = [port for port in candidate_ports()
+                 if port.device != busy]
+        if not ports:
+            self.probe_var.set("No USB devices detected")
+            return
+        self.probing = True
+        cancel = self.probe_cancel = threading.Event()
+        self.probe_var.set(f"🔎 Probing {len(ports)} port(s)...")
+        baudrates = PROBE_BAUDRATES
+
+        def worker():
+            results = probe_ports([port.device for port in ports], baudrates, cancel=cancel)
+            if not cancel.is_set():
+                self.root.after(0, self.apply_probe_results, ports, results)
+
+        self.probe_thread = threading.Thread(target=worker, daemon=True)
+        self.probe_thread.start()
+
+    def select_detected_port(self):
+        """Выбирает порт с платой Firmata и её скорость, если пользователь ещё не подключился."""
+        if self.board is not None:
+            return
+        current = self.port_info.get(self.port_var.get())
+        if not (current and current['kind'] == DEVICE_FIRMATA):
+            current = next((result for result in self.port_info.values() if result['kind'] == DEVICE_FIRMATA), None)
+        if current:
+            self.port_var.set(current['device'])
+            self.baudrate_var.set(str(current['baudrate']))
 
     def toggle_connection(self):
         if self.board is not None:
@@ -296,12 +886,22 @@ class GSRMonitor:
         if not self.port_var.get():
             messagebox.showerror("Error", "Please select a port")
             return
+        self.cancel_probe()
+        known = self.port_info.get(self.port_var.get())
+        if known and known['kind'] in (DEVICE_TAGGED, DEVICE_BINARY) and not messagebox.askyesno(
+            "Not a Firmata Device",
+            f"{describe_probe(known)}\nThis board streams the Lab 5 protocol. Connect anyway?"
+        ):
+            return
 
         try:
             self.PORT = self.port_var.get()
             self.CHANNEL = self.channel_var.get()
 
+            from pyfirmata import Arduino, util, ANALOG_MESSAGE
+
             self.board = Arduino(self.PORT)
+            self.board.add_cmd_handler(ANALOG_MESSAGE, self.on_firmata_analog)
 
             self.iterator = util.Iterator(self.board)
             self.iterator.start()
@@ -315,11 +915,12 @@ class GSRMonitor:
             self.connect_btn.config(text="🔌 Disconnect")
             self.start_record_btn.config(state="normal")
             self.record_info_var.set("Ready to record! Click 'START Recording'")
-            self.ax.set_title(
-                f'Sensor Data - Channel {self.CHANNEL} (Firmata, scroll to navigate)',
-                fontsize=14, pad=20
-            )
-            self.canvas.draw()
+            if self.canvas is not None:
+                self.ax.set_title(
+                    f'Sensor Data - Channel {self.CHANNEL} (Firmata, scroll to navigate)',
+                    fontsize=14, pad=20
+                )
+                self.canvas.draw()
 
         except Exception as e:
             self.board = None
@@ -327,9 +928,16 @@ class GSRMonitor:
             messagebox.showerror("Connection Error", f"Failed to connect (Firmata): {e}")
             self.status_var.set("❌ Connection failed")
 
+    def on_firmata_analog(self, pin_nr, lsb, msb):
+        # Обработчик pyFirmata плюс отметка времени прихода отсчёта для замера задержки
+        self.board._handle_analog_message(pin_nr, lsb, msb)
+        self.analog_arrival[pin_nr] = time.monotonic()
+
     def disconnect_serial(self):
         if self.recording:
             self.stop_recording()
+        if self.feedback.rules:
+            self.disable_feedback()
         try:
             if self.board is not None:
                 self.board.exit()
@@ -354,63 +962,318 @@ class GSRMonitor:
                     try:
                         value = self.analog_pin.read()
                         if value is not None:
-                            sensor_value = int(value * 1023) 
-
-                            timestamp = time.time()
-                            self.x_data.append(self.counter)
-                            self.y_data.append(sensor_value)
-                            self.counter += 1
-
-                            if self.scroll_position >= len(self.x_data) - self.visible_points - 10:
-                                self.scroll_to_latest()
-
-                            if self.recording:
-                                elapsed = time.time() - self.record_start_time
-                                self.recorded_data.append(
-                                    {'timestamp': timestamp,
-                                     'value': sensor_value,
-                                     'counter': self.counter}
-                                )
-                                if self.csv_writer:
-                                    self.csv_writer.writerow(
-                                        [timestamp, sensor_value, self.counter, self.CHANNEL]
-                                    )
-                                    self.record_info_var.set(
-                                        f"Recording... {len(self.recorded_data)} points | "
-                                        f"Elapsed: {elapsed:.1f}s"
-                                    )
-
-                            self.root.after(0, self.update_display, sensor_value)
+                            self.process_sample(int(value * 1023), time.time())
 
                     except Exception as e:
                         self.root.after(
                             0, lambda: self.status_var.set(f"Read error (Firmata): {e}")
                         )
-                time.sleep(0.01)
+                time.sleep(self.settings['poll_ms'] / 1000)
 
         self.serial_thread = threading.Thread(target=read_from_board, daemon=True)
         self.serial_thread.start()
 
+    def process_sample(self, sensor_value, timestamp):
+        self.x_data.append(self.counter)
+        self.y_data.append(sensor_value)
+        self.stats.push(sensor_value)
+        self.view_stats.push(sensor_value)
+        stages = self.stages
+        if 'artifacts' in stages:
+            events = self.detector.push(self.counter, sensor_value)
+            if events:
+                self.handle_artifacts(events)
+        if 'gsr' in stages:
+            scr = self.gsr.push(self.counter, sensor_value, timestamp)
+            self.tonic_data.append(self.gsr.tonic_level)
+            if scr:
+                self.handle_scr(scr)
+        else:
+            self.tonic_data.append(float('nan'))
+        if 'epochs' in stages:
+            self.epochs.push(self.counter, sensor_value)
+        resolved = self.markers.on_sample(self.counter, time.monotonic())
+        if resolved:
+            self.handle_markers(resolved)
+
+        if self.feedback.rules:
+            scr_onset = self.gsr.rising and not self.scr_rising
+            arrival = self.analog_arrival.get(int(self.CHANNEL[1]), time.monotonic())
+            self.feedback.process(sensor_value, arrival, self.gsr.fs, scr_onset)
+        self.scr_rising = self.gsr.rising
+        self.counter += 1
+
+        # Следование за последними данными; отрисовка — в update_display в потоке Tk
+        if self.scroll_position >= len(self.x_data) - self.visible_points - 10:
+            self.scroll_position = max(0, len(self.x_data) - self.visible_points)
+            self.follow_latest = True
+
+        if self.recording:
+            elapsed = time.time() - self.record_start_time
+            self.record_samples += 1
+            if self.recorder:
+                self.recorder.write_row(
+                    [timestamp, sensor_value, self.counter, self.CHANNEL]
+                )
+            self.write_exports(timestamp, sensor_value, self.CHANNEL)
+            self.record_info_var.set(
+                f"Recording... {self.record_samples} points | "
+                f"Elapsed: {elapsed:.1f}s"
+            )
+
+        # Одно обновление экрана на пачку отсчётов и не чаще render_fps кадров в секунду
+        self.last_sample_time = timestamp
+        if not self.display_pending:
+            self.display_pending = True
+            delay = self.last_render + 1 / self.settings['render_fps'] - time.perf_counter()
+            self.root.after(max(0, int(delay * 1000)), self.update_display)
+
+    def open_export_sinks(self):
+        base = os.path.splitext(self.path_var.get())[0]
+        sinks = []
+        try:
+            if self.export_edf_var.get():
+                sinks.append(EdfSink(base + '.edf', [self.CHANNEL], self.gsr.fs, self.ADC_MAX, time.time(),
+                                     SIGNAL_TYPE))
+            if self.export_parquet_var.get():
+                sinks.append(ParquetSink(base + '.parquet'))
+        except Exception:
+            for sink in sinks:
+                sink.close()
+            raise
+        return sinks
+
+
+    # ---------------------- Профиль сеанса и бюджет ----------------------
+
+    def apply_preset(self, name, remember=True):
+        """Применяет профиль; порт, скорость и канал — при следующем подключении."""
+        if self.recording:
+            messagebox.showwarning("Session profile", "Stop recording before switching profiles")
+            self.preset_var.set(self.preset_name)
+            return
+        preset = self.presets.get(name)
+        if remember:
+            self.presets.select(name)
+        rate_changed = preset['sample_rate'] != self.preset['sample_rate']
+        self.preset_name, self.preset = name, preset
+        self.preset_var.set(name)
+        self.baudrate_var.set(str(preset['baudrate']))
+        self.channel_var.set(preset['channels'][0])
+        self.segment_var.set(preset['segment'])
+        self.export_edf_var.set('edf' in preset['export'])
+        self.export_parquet_var.set('parquet' in preset['export'] and PARQUET_AVAILABLE)
+        self.autoscale_var.set(preset['y_range'] is None)
+        if rate_changed:
+            self.gsr = GsrDecomposer(self.ADC_MAX, fs=preset['sample_rate'])
+            self.reset_epochs(force=True)
+        self.budget = PerformanceBudget(preset['cpu_budget'], preset['latency_budget_ms'])
+        self.degrade_level = 0
+        self.degrade_levels = degrade_levels(preset)
+        self.apply_settings(self.degrade_levels[0])
+        info = describe_preset(preset)
+        connection = (preset['baudrate'], preset['channels'][0])
+        if self.board is not None and connection != (self.BAUDRATE, self.CHANNEL):
+            info += "\nReconnect to apply connection settings"
+        self.preset_info_var.set(info)
+        if self.canvas is not None and preset['y_range']:
+            self.ax.set_ylim(*preset['y_range'])
+
+    def save_preset(self):
+        name = simpledialog.askstring(
+            "Save profile", "Profile name:", parent=self.root,
+            initialvalue="" if self.preset_name in BUILTIN_PRESETS else self.preset_name
+        )
+        name = (name or "").strip()
+        if not name:
+            return
+        if name in BUILTIN_PRESETS:
+            messagebox.showerror("Save profile", f"'{name}' is a built-in profile, choose another name")
+            return
+        # Буферы, частота кадров, цепочка и бюджет берутся из текущего профиля (правятся в JSON)
+        channel = self.channel_var.get()
+        if self.autoscale_var.get():
+            y_range = None
+        else:
+            y_range = ([round(limit, 1) for limit in self.ax.get_ylim()] if self.canvas is not None
+                       else self.preset['y_range'])
+        preset = dict(
+            self.preset, baudrate=int(self.baudrate_var.get()),
+            channels=[channel] + [other for other in self.preset['channels'] if other != channel],
+            segment=self.segment_var.get(), y_range=y_range,
+            export=[kind for kind, var in (('edf', self.export_edf_var), ('parquet', self.export_parquet_var))
+                    if var.get()],
+        )
+        try:
+            self.presets.save(name, preset)
+        except ValueError as e:
+            messagebox.showerror("Save profile", f"Invalid profile: {e}")
+            return
+        self.preset_combo['values'] = self.presets.names()
+        self.apply_preset(name, remember=False)
+
+    # ---------------------- Вызванные ответы ----------------------
+
+    def reset_epochs(self, force=False):
+        """Пересоздаёт движок эпох, если изменилось окно (или force); усреднения начинаются заново.
+
+        Эпохи одноканальные: Firmata опрашивает и записывает только выбранный вход CHANNEL.
+        """
+        try:
+            pre = self.epoch_samples(float(self.epoch_pre_var.get()))
+            post = max(1, self.epoch_samples(float(self.epoch_post_var.get())))
+        except ValueError:
+            messagebox.showerror("Evoked response", "Epoch window must be a number of milliseconds")
+            return
+        if force or (pre, post) != (self.epochs.pre, self.epochs.post):
+            self.epochs = EpochEngine(pre, post, self.gsr.fs)
+            self.epoch_info_var.set("No epochs yet")
+            if self.erp_window is not None and self.erp_window.winfo_exists():
+                self.draw_evoked_response()
+
+    def poll_epochs(self):
+        if self.epochs.update():
+            e = self.epochs
+            counts = ", ".join(f"{label}: {avg.n}" for label, avg in sorted(e.averages.items()))
+            self.epoch_info_var.set(
+                f"📈 Epochs: {e.accepted} averaged, {e.rejected} rejected | {counts}"
+            )
+            if self.erp_window is not None and self.erp_window.winfo_exists():
+                self.draw_evoked_response()
+        if self.running:
+            self.root.after(500, self.poll_epochs)
+
+    def show_evoked_response(self):
+        self.reset_epochs()
+        if self.erp_window is not None and self.erp_window.winfo_exists():
+            self.erp_window.lift()
+            return
+        self.erp_window = tk.Toplevel(self.root)
+        self.erp_window.title("Evoked response (mean ± 95% CI)")
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        fig = Figure(figsize=(6, 4))
+        self.erp_ax = fig.add_subplot(111)
+        self.erp_canvas = FigureCanvasTkAgg(fig, master=self.erp_window)
+        self.erp_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.draw_evoked_response()
+
+    def draw_evoked_response(self):
+        ax = self.erp_ax
+        ax.clear()
+        times = self.epochs.times_ms
+        for label, average in sorted(self.epochs.averages.items()):
+            low, high = average.band(0.95)
+            line, = ax.plot(times, average.mean[0], label=f"{label} (n={average.n})")
+            ax.fill_between(times, low[0], high[0], color=line.get_color(), alpha=0.2)
+        ax.axvline(0, color='gray', linestyle='--')
+        ax.set_xlabel('Time from marker (ms)')
+        ax.set_ylabel('Baseline-corrected value')
+        if self.epochs.averages:
+            ax.legend()
+        else:
+            ax.set_title('Waiting for markers...')
+        self.erp_canvas.draw_idle()
+
+    # ---------------------- Обратная связь ----------------------
+
+    def toggle_feedback(self):
+        if self.feedback.rules:
+            self.disable_feedback()
+        else:
+            self.enable_feedback()
+
+    def enable_feedback(self):
+        if self.board is None:
+            messagebox.showerror("Error", "Not connected to any device (Firmata)")
+            return
+        try:
+            threshold = float(self.threshold_var.get())
+            pin_number = int(self.output_pin_var.get())
+            mode = 'p' if self.output_mode_var.get() == OUTPUT_PWM else 'o'
+            rule = FeedbackRule(self.rule_var.get(), threshold, f'd:{pin_number}:{mode}',
+                                output=self.output_mode_var.get())
+            rule.pin = self.board.get_pin(rule.pin_def)
+            rule.pin.write(0)
+            rule.state = 0
+        except Exception as e:
+            messagebox.showerror("Biofeedback", f"Failed to set up output: {e}")
+            return
+        self.feedback.reset_latency()
+        self.feedback.add_rule(rule)
+        self.feedback_btn.config(text="⏹️ Disable")
+        self.feedback_info_var.set(f"{rule.condition} {threshold:g} → pin {pin_number} ({rule.output})")
+        self.root.after(500, self.update_feedback_info)
+
+    def disable_feedback(self):
+        self.feedback.clear()
+        self.feedback_btn.config(text="▶️ Enable")
+        self.feedback_info_var.set("Feedback off")
+
+    def update_feedback_info(self):
+        rules = self.feedback.rules
+        if not rules:
+            return
+        rule = rules[0]
+        info = f"{rule.condition} {rule.threshold:g} → {rule.pin_def} | writes: {self.feedback.writes}"
+        if rule.condition == RULE_BAND_RATIO:
+            info += f" | ratio {self.feedback.band_ratios.get(id(rule), 0.0):.2f}"
+        summary = self.feedback.latency_summary()
+        if summary:
+            info += (
+                f"\nlatency p50 {summary['p50']:.1f} / p95 {summary['p95']:.1f} / "
+                f"max {summary['max']:.1f} ms | ≤{self.feedback.budget_ms:.0f} ms: "
+                f"{summary['within_budget'] * 100:.0f}%"
+            )
+        self.feedback_info_var.set(info)
+        self.root.after(500, self.update_feedback_info)
+
+    def show_latency_histogram(self):
+        latencies = self.feedback.latencies()
+        if not latencies:
+            messagebox.showinfo("Biofeedback latency", "No output writes measured yet")
+            return
+        if self.latency_window is not None and self.latency_window.winfo_exists():
+            self.latency_window.destroy()
+        self.latency_window = tk.Toplevel(self.root)
+        self.latency_window.title("Input → output latency")
+        Figure, FigureCanvasTkAgg = load_matplotlib()
+        fig = Figure(figsize=(6, 4))
+        ax = fig.add_subplot(111)
+        ax.hist(latencies, bins=min(50, max(10, len(latencies) // 10)), color='teal', alpha=0.8)
+        ax.axvline(self.feedback.budget_ms, color='crimson', linestyle='--', label='budget')
+        ax.set_xlabel('Latency (ms)')
+        ax.set_ylabel('Output writes')
+        ax.legend()
+        canvas = FigureCanvasTkAgg(fig, master=self.latency_window)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
     # ---------------------- Обновление графика и статусов ----------------------
 
-    def update_display(self, value):
+    def update_display(self):
+        self.display_pending = False
+        self.last_render = time.perf_counter()
+        self.render_sample_time = self.last_sample_time
         if self.x_data and self.y_data:
+            value = self.y_data[-1]
+            if self.follow_latest:
+                self.follow_latest = False
+                self.update_scrollbar_position()
             self.update_plot_view()
             self.counter_var.set(f"📊 Data points: {self.counter}")
             self.value_var.set(f"🎯 Current value: {value}")
-
-    def clear_plot(self):
-        self.x_data.clear()
-        self.y_data.clear()
-        self.counter = 0
-        self.scroll_position = 0
-        self.scroll_var.set(0)
-        self.line.set_data([], [])
-        self.ax.set_xlim(0, self.visible_points)
-        self.canvas.draw()
-        self.counter_var.set("📊 Data points: 0")
-        self.value_var.set("🎯 Current value: --")
-        self.scroll_info_var.set("Viewing: latest data")
+            self.stats_var.set(
+                f"📐 Mean: {self.stats.mean:.1f} ± {self.stats.std:.1f} | "
+                f"RMS: {self.stats.rms:.1f} | Peak: {self.stats.maximum}"
+            )
+            gsr_info = (
+                f"💧 Tonic: {self.gsr.tonic_level:.1f} | Phasic: {self.gsr.phasic:+.1f} | "
+                f"SCR: {self.gsr.scr_count}"
+            )
+            if self.scr_events:
+                onset, peak, amplitude, rise_time, onset_ts = self.scr_events[-1]
+                gsr_info += f" (last: amp {amplitude:.1f}, rise {rise_time:.2f}s)"
+            self.gsr_var.set(gsr_info)
 
     # ---------------------- Запись в CSV ----------------------
 
@@ -436,13 +1299,23 @@ class GSRMonitor:
             messagebox.showerror("Error", "Please select a save path first")
             return
         try:
-            self.csv_file = open(self.path_var.get(), 'w', newline='', encoding='utf-8')
-            self.csv_writer = csv.writer(self.csv_file)
-            self.csv_writer.writerow(['timestamp', 'value', 'counter', 'channel'])
+            max_seconds, max_bytes = SEGMENT_OPTIONS[self.segment_var.get()]
+            self.recorder = SegmentedRecorder(
+                self.path_var.get(), RECORDING_HEADER, max_seconds, max_bytes
+            )
+
+            self.record_artifacts_start = self.artifact_count
+            self.record_scr_start = self.gsr.scr_count
+            self.record_markers_start = self.markers.count
+            self.record_marker_labels = {}
+            self.record_artifact_kinds = {}
+            self.record_artifact_samples = 0
+            self.open_sidecar_files()
+            self.export_sinks = self.open_export_sinks()
 
             self.recording = True
             self.record_start_time = time.time()
-            self.recorded_data = []
+            self.record_samples = 0
 
             self.record_status_var.set("🟢 Recording: ON")
             self.start_record_btn.config(state="disabled")
@@ -456,17 +1329,21 @@ class GSRMonitor:
                 f"Data will be saved in real-time."
             )
         except Exception as e:
+            self.abort_recording()
             messagebox.showerror("Error", f"Failed to start recording: {e}")
 
     def stop_recording(self):
         if self.recording:
             self.recording = False
-            if self.csv_file:
-                self.csv_file.close()
-                self.csv_file = None
-                self.csv_writer = None
+            self.handle_artifacts(self.detector.flush())
+            if self.recorder:
+                self.record_segments = self.recorder.segment_count
+                self.recorder.close()
+                self.recorder = None
+            self.close_sidecar_files()
+            export_warnings = self.close_export_sinks()
             duration = time.time() - self.record_start_time
-            data_points = len(self.recorded_data)
+            data_points = self.record_samples
             self.record_status_var.set("🔴 Recording: OFF")
             self.start_record_btn.config(state="normal")
             self.stop_record_btn.config(state="disabled")
@@ -474,6 +1351,7 @@ class GSRMonitor:
                 f"Recording saved! {data_points} points | Duration: {duration:.1f}s | "
                 f"File: {os.path.basename(self.path_var.get())}"
             )
+            self.register_session(duration, data_points)
             if duration > 0:
                 avg_rate = data_points / duration
             else:
@@ -484,75 +1362,41 @@ class GSRMonitor:
                 f"📊 Data points: {data_points}\n"
                 f"⏱️ Duration: {duration:.1f} seconds\n"
                 f"📁 File: {self.path_var.get()}\n"
-                f"📈 Average rate: {avg_rate:.1f} points/second"
+                f"📈 Average rate: {avg_rate:.1f} points/second\n"
+                f"⚠️ Artifact events: {self.artifact_count - self.record_artifacts_start}\n"
+                f"💧 SCRs: {self.gsr.scr_count - self.record_scr_start}\n"
+                f"📍 Markers: {self.markers.count - self.record_markers_start}"
+                + ''.join(f"\n⚠️ {warning}" for warning in export_warnings)
             )
 
-    # ---------------------- Работа со скроллом графика ----------------------
-
-    def on_scroll(self, value):
-        if len(self.x_data) > self.visible_points:
-            max_scroll = len(self.x_data) - self.visible_points
-            self.scroll_position = int(float(value) / 100 * max_scroll)
-            self.update_plot_view()
-
-    def scroll_up(self):
-        if self.scroll_position > 0:
-            self.scroll_position -= 10
-            if self.scroll_position < 0:
-                self.scroll_position = 0
-            self.update_scrollbar_position()
-            self.update_plot_view()
-
-    def scroll_down(self):
-        max_scroll = max(0, len(self.x_data) - self.visible_points)
-        if self.scroll_position < max_scroll:
-            self.scroll_position += 10
-            if self.scroll_position > max_scroll:
-                self.scroll_position = max_scroll
-            self.update_scrollbar_position()
-            self.update_plot_view()
-
-    def scroll_to_latest(self):
-        self.scroll_position = max(0, len(self.x_data) - self.visible_points)
-        self.update_scrollbar_position()
-        self.update_plot_view()
-
-    def update_scrollbar_position(self):
-        max_scroll = max(1, len(self.x_data) - self.visible_points)
-        if max_scroll > 0:
-            scroll_percentage = (self.scroll_position / max_scroll) * 100
-            self.scroll_var.set(scroll_percentage)
-
-    def update_plot_view(self):
-        if len(self.x_data) > 0:
-            start_idx = self.scroll_position
-            end_idx = start_idx + self.visible_points
-
-            if len(self.x_data) >= end_idx:
-                x_view = list(self.x_data)[start_idx:end_idx]
-                y_view = list(self.y_data)[start_idx:end_idx]
-            else:
-                x_view = list(self.x_data)
-                y_view = list(self.y_data)
-
-            self.line.set_data(x_view, y_view)
-            self.ax.set_xlim(start_idx, end_idx)
-
-            total_points = len(self.x_data)
-            if total_points > self.visible_points:
-                view_info = f"Viewing: {start_idx}-{min(end_idx, total_points)} of {total_points}"
-                if end_idx >= total_points:
-                    view_info += " (LATEST)"
-            else:
-                view_info = "Viewing: all data"
+    def register_session(self, duration, data_points):
+        try:
+            if self.catalog is None:
+                self.catalog = RecordingCatalog()
+            self.catalog.register(dict(
+                path=self.recorded_path(), device="Arduino Firmata", signal=SIGNAL_TYPE,
+                port=self.PORT, protocol="Firmata", channels=self.CHANNEL,
+                sample_rate=data_points / duration if duration > 0 else 0.0,
+                start_time=self.record_start_time, duration_s=duration, samples=data_points,
+                marker_count=sum(self.record_marker_labels.values()),
+                markers=self.record_marker_labels,
+                artifact_count=sum(self.record_artifact_kinds.values()),
+                artifacts=self.record_artifact_kinds,
+                artifact_share=self.record_artifact_samples / data_points if data_points else 0.0,
+                scr_count=self.gsr.scr_count - self.record_scr_start,
+            ))
+        except Exception as e:
+            self.record_info_var.set(f"{self.record_info_var.get()} | Catalog error: {e}")
 
-            self.scroll_info_var.set(view_info)
-            self.canvas.draw_idle()
+    # ---------------------- Работа со скроллом графика ----------------------
 
     def stop(self):
         if self.recording:
             self.stop_recording()
+        if self.feedback.rules:
+            self.disable_feedback()
         self.running = False
+        self.marker_server.stop()
         try:
             if self.board is not None:
                 self.board.exit()
@@ -563,7 +1407,28 @@ class GSRMonitor:
 
 
 def main():
+    # python lab6.py batch <каталог> — пакетный анализ записей без GUI
+    if sys.argv[1:2] == ['batch']:
+        batch_main(sys.argv[2:], BATCH_ADC_MAX)
+        return
+    # python lab6.py catalog --channel A1 --min-duration 600 --days 31 — поиск по каталогу
+    if sys.argv[1:2] == ['catalog']:
+        catalog_main(sys.argv[2:], SIGNAL_TYPE, BATCH_ADC_MAX)
+        return
+    # python lab6.py export <запись.csv> [--edf out.edf] [--parquet out.parquet]
+    if sys.argv[1:2] == ['export']:
+        export_main(sys.argv[2:], SIGNAL_TYPE, BATCH_ADC_MAX)
+        return
+    # python lab6.py epochs <запись.csv> --pre 0.2 --post 0.8 --labels key_1 key_2 — усреднение по меткам
+    if sys.argv[1:2] == ['epochs']:
+        epochs_main(sys.argv[2:])
+        return
+    # python lab6.py soak --hours 4 --speed 10 — длительный прогон на синтетическом устройстве
+    if sys.argv[1:2] == ['soak']:
+        sys.exit(soak_main(sys.argv[2:]))
+    STARTUP.mark('imports')
     root = tk.Tk()
+    STARTUP.mark('tk root')
     app = GSRMonitor(root)
     root.protocol("WM_DELETE_WINDOW", app.stop)
     root.mainloop()
@@ -0,0 +1,3023 @@
+"""Общая часть Lab 5 (ЭЭГ) и Lab 6 (КГР): протокол кадров binary v1, обработка сигнала, метки,
+сегментированная запись, опрос портов, пакетный анализ и каталог, экспорт EDF+/Parquet, эпохи,
+soak-прогон и профили сеанса. Окно монитора и всё, что зависит от платы, остаются в lab5.py и
+lab6.py."""
+import time
+import serial
+import serial.tools.list_ports
+from collections import deque
+import threading
+import numpy as np
+import csv
+import math
+import os
+import sys
+import itertools
+import sqlite3
+import importlib.util
+import glob
+import json
+import hashlib
+import argparse
+import concurrent.futures
+import socket
+import tracemalloc
+import bisect
+import re
+from datetime import datetime
+from statistics import NormalDist
+
+
+# ---------------------- Профиль запуска и отложенные импорты ----------------------
+
+# matplotlib (~0.5 с) импортируется в фоне уже после показа окна
+Figure = FigureCanvasTkAgg = None
+
+
+def load_matplotlib():
+    global Figure, FigureCanvasTkAgg
+    if FigureCanvasTkAgg is None:
+        from matplotlib.figure import Figure as figure_class
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as canvas_class
+        Figure, FigureCanvasTkAgg = figure_class, canvas_class
+    return Figure, FigureCanvasTkAgg
+
+
+class StartupProfile:
+    """Длительность фаз запуска (мс) от t0 (момент загрузки модуля лабораторной) до готового графика."""
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.last = self.t0
+        self.phases = []
+        self.background = {}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000, (now - self.t0) * 1000))
+        self.last = now
+
+    def report(self):
+        lines = ["Startup timing:"]
+        lines += [f"  {phase:<16}{ms:8.1f} ms  (at {total:.1f} ms)" for phase, ms, total in self.phases]
+        lines += [f"  {phase:<16}{ms:8.1f} ms  (background)" for phase, ms in self.background.items()]
+        return '\n'.join(lines)
+
+
+# ---------------------- Бинарный протокол v1 (_5_video_EEG_binary.ino) ----------------------
+
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_VERSION = 1
+FRAME_MAX_CHANNELS = 6
+# Скачок номера кадра на полкруга и больше — это перезапуск скетча (seq снова с 0), а не потери
+FRAME_SEQ_RESTART = 0x8000
+
+
+def _make_crc8_table(poly=0x07):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _make_crc8_table()
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def frame_size(n_channels):
+    """Размер кадра: синхрослово, заголовок, номер, упакованные 10-битные отсчёты, CRC."""
+    return 5 + (10 * n_channels + 7) // 8 + 1
+
+
+def encode_frame(seq, values):
+    """Кодирование кадра так же, как это делает скетч (нужно для проверки и симуляции)."""
+    n_channels = len(values)
+    acc = 0
+    for i, value in enumerate(values):
+        acc |= (int(value) & 0x3FF) << (10 * i)
+    payload = acc.to_bytes((10 * n_channels + 7) // 8, 'little')
+    body = bytes([(FRAME_VERSION << 4) | n_channels, seq & 0xFF, (seq >> 8) & 0xFF]) + payload
+    return FRAME_SYNC + body + bytes([crc8(body)])
+
+
+def unpack_10bit(payload, n_channels):
+    acc = int.from_bytes(payload, 'little')
+    return [(acc >> (10 * i)) & 0x3FF for i in range(n_channels)]
+
+
+class FrameDecoder:
+    """Потоковый декодер кадров v1 со счётчиками потерь, ошибок CRC и пересинхронизаций.
+
+    Пересинхронизация — потеря кадровой синхронизации: пропущенный мусор между кадрами
+    (сколько бы чтений он ни занял) или перезапуск нумерации кадров устройством.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = None
+        self.frames = 0
+        self.lost = 0
+        self.crc_errors = 0
+        self.resyncs = 0
+        self.skipping = False
+
+    def reset(self):
+        self.__init__()
+
+    def feed(self, data):
+        """Добавляет байты и возвращает список (seq, [значения каналов]) для целых кадров."""
+        buf = self.buffer
+        buf.extend(data)
+        frames = []
+        pos = 0
+        while True:
+            start = buf.find(FRAME_SYNC, pos)
+            if start < 0:
+                # Последний байт может оказаться началом синхрослова
+                if len(buf) - 1 > pos:
+                    self._skip()
+                pos = max(pos, len(buf) - 1)
+                break
+            if start > pos:
+                self._skip()
+            if len(buf) - start < 3:
+                pos = start
+                break
+            header = buf[start + 2]
+            version, n_channels = header >> 4, header & 0x0F
+            if version != FRAME_VERSION or not 1 <= n_channels <= FRAME_MAX_CHANNELS:
+                pos = start + 1
+                continue
+            size = frame_size(n_channels)
+            if len(buf) - start < size:
+                pos = start
+                break
+            body = bytes(buf[start + 2:start + size - 1])
+            if crc8(body) != buf[start + size - 1]:
+                self.crc_errors += 1
+                pos = start + 1
+                continue
+            seq = body[1] | (body[2] << 8)
+            if self.expected_seq is not None:
+                gap = (seq - self.expected_seq) & 0xFFFF
+                if gap >= FRAME_SEQ_RESTART:
+                    self.resyncs += 1
+                else:
+                    self.lost += gap
+            self.expected_seq = (seq + 1) & 0xFFFF
+            self.frames += 1
+            self.skipping = False
+            frames.append((seq, unpack_10bit(body[3:], n_channels)))
+            pos = start + size
+        del buf[:pos]
+        return frames
+
+    def _skip(self):
+        if not self.skipping:
+            self.skipping = True
+            self.resyncs += 1
+
+    def loss_ratio(self):
+        total = self.frames + self.lost
+        return self.lost / total if total else 0.0
+
+
+# ---------------------- Скользящая статистика окна ----------------------
+
+class WindowStats:
+    """Статистика по скользящему окну за O(1) на отсчёт.
+
+    Сумма и сумма квадратов ведутся инкрементально, минимум и максимум — через
+    монотонные деки, перцентили — по гистограмме целых значений АЦП.
+    """
+
+    def __init__(self, window, value_max=1023):
+        self.window = window
+        self.value_max = value_max
+        self.reset()
+
+    def reset(self):
+        self.values = deque()
+        self.index = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min_deque = deque()
+        self.max_deque = deque()
+        self.histogram = [0] * (self.value_max + 1)
+
+    def resize(self, window):
+        self.window = window
+        while len(self.values) > window:
+            self._drop_oldest()
+
+    def push(self, value):
+        value = min(max(int(value), 0), self.value_max)
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        self.histogram[value] += 1
+
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append((self.index, value))
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append((self.index, value))
+        self.index += 1
+
+        if len(self.values) > self.window:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        old = self.values.popleft()
+        self.total -= old
+        self.total_sq -= old * old
+        self.histogram[old] -= 1
+        first_index = self.index - len(self.values)
+        while self.min_deque and self.min_deque[0][0] < first_index:
+            self.min_deque.popleft()
+        while self.max_deque and self.max_deque[0][0] < first_index:
+            self.max_deque.popleft()
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else 0.0
+
+    @property
+    def std(self):
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        var = (self.total_sq - self.total * self.total / n) / n
+        return max(var, 0.0) ** 0.5
+
+    @property
+    def rms(self):
+        n = len(self.values)
+        return (self.total_sq / n) ** 0.5 if n else 0.0
+
+    @property
+    def minimum(self):
+        return self.min_deque[0][1] if self.min_deque else 0
+
+    @property
+    def maximum(self):
+        return self.max_deque[0][1] if self.max_deque else 0
+
+    def percentile(self, q):
+        """Перцентиль q (0..100) по гистограмме; стоимость зависит от диапазона АЦП, а не от окна."""
+        n = len(self.values)
+        if not n:
+            return 0
+        rank = q / 100 * (n - 1)
+        seen = 0
+        lo, hi = self.minimum, self.maximum
+        for value in range(lo, hi + 1):
+            seen += self.histogram[value]
+            if seen > rank:
+                return value
+        return hi
+
+
+# Автомасштаб по перцентилям окна: одиночные выбросы не растягивают ось Y
+AUTOSCALE_PERCENTILE = 0.5
+
+
+def robust_range(values, q=AUTOSCALE_PERCENTILE):
+    """Перцентили q и 100 - q списка (правило как в WindowStats.percentile) — для окна,
+    прокрученного назад, где скользящей статистики нет."""
+    ordered = sorted(values)
+    n = len(ordered)
+    return ordered[int(q / 100 * (n - 1))], ordered[int((100 - q) / 100 * (n - 1))]
+
+
+class AutoScaler:
+    """Плавное автомасштабирование оси Y: мгновенное расширение, медленное сужение."""
+
+    def __init__(self, lo, hi, value_max, margin=0.1, min_span=10, alpha=0.2):
+        self.lo = lo
+        self.hi = hi
+        self.value_max = value_max
+        self.margin = margin
+        self.min_span = min_span
+        self.alpha = alpha
+
+    def update(self, data_lo, data_hi):
+        span = max(data_hi - data_lo, self.min_span)
+        target_lo = max(data_lo - span * self.margin, -self.value_max * 0.05)
+        target_hi = min(data_hi + span * self.margin, self.value_max * 1.05)
+        self.lo = target_lo if target_lo < self.lo else self.lo + self.alpha * (target_lo - self.lo)
+        self.hi = target_hi if target_hi > self.hi else self.hi + self.alpha * (target_hi - self.hi)
+        return self.lo, self.hi
+
+
+# ---------------------- Детектор артефактов и насыщения ----------------------
+
+ARTIFACT_CLIP = 'clip'
+ARTIFACT_FLAT = 'flat'
+ARTIFACT_STEP = 'step'
+ARTIFACT_OUTLIER = 'outlier'
+
+
+class ArtifactDetector:
+    """Пакетный векторизованный детектор: насыщение АЦП, плато, скачки и выбросы амплитуды.
+
+    Отсчёты копятся в пакет и обрабатываются NumPy целиком. Серии, не закончившиеся
+    в пакете, переносятся в следующий. Если обработка пакета не укладывается в
+    budget_ms, размер пакета уменьшается; при большом запасе — растёт обратно.
+    События — кортежи (kind, start, end, value) с индексами отсчётов.
+
+    push/flush/reset берут один замок: отсчёты подаёт поток чтения, а flush при
+    остановке записи и reset при очистке вызываются из потока Tk.
+    """
+
+    def __init__(self, adc_max, batch_size=64, clip_run=3, flat_run=50,
+                 step_threshold=None, z_threshold=6.0, budget_ms=2.0):
+        self.adc_max = adc_max
+        self.max_batch_size = batch_size
+        self.batch_size = batch_size
+        self.clip_run = clip_run
+        self.flat_run = flat_run
+        self.step_threshold = step_threshold if step_threshold is not None else 0.2 * adc_max
+        self.z_threshold = z_threshold
+        self.budget_ms = budget_ms
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._reset()
+
+    def _reset(self):
+        self.batch_size = self.max_batch_size
+        self.pending_index = []
+        self.pending_value = []
+        self.open_runs = {}
+        self.prev_value = None
+        self.mean = None
+        self.var = None
+        self.batches = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.overruns = 0
+
+    def push(self, index, value):
+        with self.lock:
+            self.pending_index.append(index)
+            self.pending_value.append(value)
+            if len(self.pending_value) >= self.batch_size:
+                return self.process()
+            return []
+
+    def push_batch(self, indices, values):
+        """Обработка готового пакета целиком (офлайн-анализ записей)."""
+        with self.lock:
+            self.pending_index.extend(indices)
+            self.pending_value.extend(values)
+            return self.process()
+
+    def flush(self):
+        """Обрабатывает остаток и закрывает незавершённые серии."""
+        with self.lock:
+            events = self.process() if self.pending_value else []
+            for kind, (start, end, value) in sorted(self.open_runs.items()):
+                if end - start + 1 >= self._min_run(kind):
+                    events.append((kind, start, end, value))
+            self.open_runs = {}
+            return events
+
+    def _min_run(self, kind):
+        return {ARTIFACT_CLIP: self.clip_run, ARTIFACT_FLAT: self.flat_run}.get(kind, 1)
+
+    def process(self):
+        t0 = time.perf_counter()
+        idx = np.asarray(self.pending_index, dtype=np.int64)
+        x = np.asarray(self.pending_value, dtype=np.float64)
+        self.pending_index = []
+        self.pending_value = []
+
+        prev = x[0] if self.prev_value is None else self.prev_value
+        diff = np.diff(x, prepend=prev)
+        self.prev_value = x[-1]
+
+        clipped = (x <= 0) | (x >= self.adc_max)
+        events = self._runs(ARTIFACT_CLIP, clipped, idx, x)
+        events += self._runs(ARTIFACT_FLAT, (diff == 0) & ~clipped, idx, x)
+
+        for i in np.flatnonzero(np.abs(diff) > self.step_threshold):
+            events.append((ARTIFACT_STEP, int(idx[i]), int(idx[i]), float(diff[i])))
+
+        if self.mean is not None:
+            std = max(self.var ** 0.5, 1.0)
+            z = (x - self.mean) / std
+            events += self._runs(ARTIFACT_OUTLIER, (np.abs(z) > self.z_threshold) & ~clipped, idx, z)
+        # Базовая линия для выбросов — экспоненциальное среднее по пакетам без насыщения
+        good = x[~clipped]
+        if good.size:
+            if self.mean is None:
+                self.mean, self.var = float(good.mean()), float(good.var())
+            else:
+                alpha = min(1.0, good.size / 1000)
+                self.mean += alpha * (float(good.mean()) - self.mean)
+                self.var += alpha * (float(good.var()) - self.var)
+
+        self.batches += 1
+        self.last_ms = (time.perf_counter() - t0) * 1000
+        self.max_ms = max(self.max_ms, self.last_ms)
+        if self.last_ms > self.budget_ms:
+            self.overruns += 1
+            self.batch_size = max(8, self.batch_size // 2)
+        elif self.last_ms < self.budget_ms / 4 and self.batch_size < self.max_batch_size:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        return events
+
+    def _runs(self, kind, mask, idx, x):
+        """Серии True в mask с учётом серии, открытой в предыдущем пакете."""
+        events = []
+        edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        open_run = self.open_runs.pop(kind, None)
+        if open_run is not None and (not starts.size or starts[0] != 0):
+            start, end, value = open_run
+            if end - start + 1 >= self._min_run(kind):
+                events.append((kind, start, end, value))
+            open_run = None
+        for s, e in zip(starts, ends):
+            start = int(idx[s])
+            value = float(x[s:e + 1][np.argmax(np.abs(x[s:e + 1]))])
+            if s == 0 and open_run is not None:
+                start = open_run[0]
+                value = max(open_run[2], value, key=abs)
+            if e == len(mask) - 1:
+                self.open_runs[kind] = (start, int(idx[e]), value)
+                continue
+            if int(idx[e]) - start + 1 >= self._min_run(kind):
+                events.append((kind, start, int(idx[e]), value))
+        return events
+
+# ---------------------- КГР: тоническая/фазическая составляющие и SCR ----------------------
+
+class GsrDecomposer:
+    """Онлайн-разложение КГР с постоянной стоимостью на отсчёт.
+
+    Сигнал сглаживается однополюсным ФНЧ (smooth_hz), тонический уровень — ещё более
+    медленным ФНЧ (tonic_hz), фазическая составляющая — их разность. SCR ищется по
+    сглаженной производной: начало — подъём круче onset_slope (ед./с), пик — смена
+    знака производной. Частота дискретизации оценивается по меткам времени.
+    """
+
+    def __init__(self, adc_max, fs=100.0, smooth_hz=1.0, tonic_hz=0.05, onset_slope=None,
+                 min_amplitude=None, max_rise_s=5.0, polarity=1):
+        self.adc_max = adc_max
+        self.smooth_hz = smooth_hz
+        self.tonic_hz = tonic_hz
+        self.onset_slope = onset_slope if onset_slope is not None else 0.005 * adc_max
+        self.min_amplitude = min_amplitude if min_amplitude is not None else 0.01 * adc_max
+        self.max_rise_s = max_rise_s
+        self.polarity = polarity
+        self.nominal_fs = fs
+        self.reset()
+
+    def reset(self):
+        self.fs = self.nominal_fs
+        self._update_coefficients()
+        self.smooth = None
+        self.tonic = None
+        self.phasic = 0.0
+        self.slope = 0.0
+        self.rate_ts = None
+        self.rate_samples = 0
+        self.rising = False
+        self.onset = None
+        self.peak = None
+        self.scr_count = 0
+
+    def _update_coefficients(self):
+        self.alpha_smooth = 1 - math.exp(-2 * math.pi * self.smooth_hz / self.fs)
+        self.alpha_tonic = 1 - math.exp(-2 * math.pi * self.tonic_hz / self.fs)
+        self.alpha_slope = 1 - math.exp(-2 * math.pi * 2 * self.smooth_hz / self.fs)
+
+    def _track_rate(self, timestamp):
+        # Отсчёты из одного пакета приходят с одной меткой времени — считаем их вместе
+        self.rate_samples += 1
+        if self.rate_ts is None:
+            self.rate_ts = timestamp
+            self.rate_samples = 0
+            return
+        dt = timestamp - self.rate_ts
+        if dt >= 0.25:
+            self.fs += 0.2 * (self.rate_samples / dt - self.fs)
+            self.rate_ts = timestamp
+            self.rate_samples = 0
+            self._update_coefficients()
+
+    def push(self, index, value, timestamp):
+        """Возвращает SCR (onset_index, peak_index, amplitude, rise_time, onset_ts) или None."""
+        self._track_rate(timestamp)
+        x = self.polarity * value
+        if self.smooth is None:
+            self.smooth = self.tonic = float(x)
+            return None
+        prev = self.smooth
+        self.smooth += self.alpha_smooth * (x - self.smooth)
+        self.tonic += self.alpha_tonic * (self.smooth - self.tonic)
+        self.phasic = self.smooth - self.tonic
+        self.slope += self.alpha_slope * ((self.smooth - prev) * self.fs - self.slope)
+
+        if not self.rising:
+            if self.slope > self.onset_slope:
+                self.rising = True
+                self.onset = (index, prev, timestamp)
+                self.peak = (index, self.smooth, timestamp)
+            return None
+
+        if self.smooth >= self.peak[1]:
+            self.peak = (index, self.smooth, timestamp)
+        if timestamp - self.onset[2] > self.max_rise_s and self.slope > 0:
+            # Слишком долгий подъём — это дрейф тонического уровня, а не SCR
+            self.onset = (index, self.smooth, timestamp)
+            self.peak = (index, self.smooth, timestamp)
+            return None
+        if self.slope > 0:
+            return None
+
+        self.rising = False
+        amplitude = self.peak[1] - self.onset[1]
+        if amplitude < self.min_amplitude:
+            return None
+        self.scr_count += 1
+        return (self.onset[0], self.peak[0], amplitude, self.peak[2] - self.onset[2], self.onset[2])
+
+    @property
+    def tonic_level(self):
+        return self.polarity * self.tonic if self.tonic is not None else 0.0
+
+# ---------------------- Метки стимулов ----------------------
+
+MARKER_PORT = 5005
+
+
+def send_marker(label, port=MARKER_PORT, host='127.0.0.1'):
+    """API для скриптов стимуляции: метка с отметкой монотонных часов отправителя.
+
+    Пример из другого процесса:  from sensorlab import send_marker; send_marker("stim_1")
+    Или без Python:              echo -n stim_1 | nc -u -w0 127.0.0.1 5005
+    """
+    message = f"{label}|{time.monotonic():.6f}".encode('utf-8')
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(message, (host, port))
+
+
+class MarkerTrack:
+    """Дорожка меток: время по time.monotonic(), привязка к ближайшему индексу отсчёта.
+
+    Метка ждёт первого отсчёта, пришедшего не раньше неё, затем выбирается ближайший
+    из соседних отсчётов. Для каждой метки считаются задержка привязки (сколько
+    метка ждала отсчёта) и смещение (разность времени метки и выбранного отсчёта).
+    """
+
+    def __init__(self, history=4096):
+        self.sample_clock = deque(maxlen=history)
+        self.pending = deque()
+        self.markers = deque(maxlen=500)
+        self.latencies_ms = deque(maxlen=500)
+        self.offsets_ms = deque(maxlen=500)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.sample_clock.clear()
+            self.pending.clear()
+            self.markers.clear()
+            self.latencies_ms.clear()
+            self.offsets_ms.clear()
+
+    def mark(self, label, source='api', t=None):
+        with self.lock:
+            self.pending.append((time.monotonic() if t is None else t, label, source))
+
+    def on_sample(self, index, t):
+        """Вызывается на каждый отсчёт; возвращает список привязанных меток."""
+        self.sample_clock.append((t, index))
+        if not self.pending or self.pending[0][0] > t:
+            return []
+        resolved = []
+        with self.lock:
+            clock = list(self.sample_clock)
+            times = [c[0] for c in clock]
+            while self.pending and self.pending[0][0] <= t:
+                t_mark, label, source = self.pending.popleft()
+                pos = bisect.bisect_left(times, t_mark)
+                candidates = [clock[i] for i in (pos - 1, pos) if 0 <= i < len(clock)]
+                t_sample, sample_index = min(candidates, key=lambda c: abs(c[0] - t_mark))
+                latency_ms = (time.monotonic() - t_mark) * 1000
+                offset_ms = (t_sample - t_mark) * 1000
+                marker = (sample_index, label, source, t_mark, offset_ms, latency_ms)
+                self.markers.append(marker)
+                self.latencies_ms.append(latency_ms)
+                self.offsets_ms.append(offset_ms)
+                self.count += 1
+                resolved.append(marker)
+        return resolved
+
+    def latency_report(self):
+        if not self.latencies_ms:
+            return None
+        latencies = list(self.latencies_ms)
+        offsets = [abs(o) for o in self.offsets_ms]
+        return {
+            'count': self.count,
+            'latency_mean_ms': sum(latencies) / len(latencies),
+            'latency_max_ms': max(latencies),
+            'offset_mean_ms': sum(offsets) / len(offsets),
+            'offset_max_ms': max(offsets),
+        }
+
+
+class MarkerServer:
+    """UDP-приёмник меток на localhost: датаграмма "label" или "label|monotonic_time"."""
+
+    def __init__(self, track, port=MARKER_PORT):
+        self.track = track
+        self.port = port
+        self.running = False
+        self.sock = None
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', self.port))
+        self.sock.settimeout(0.5)
+        self.running = True
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, _ = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            received = time.monotonic()
+            label, _, sent = data.decode('utf-8', 'replace').strip().partition('|')
+            try:
+                t = float(sent) if sent else received
+            except ValueError:
+                t = received
+            # Часы отправителя не могут быть впереди наших
+            self.track.mark(label or 'marker', source='socket', t=min(t, received))
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+
+# ---------------------- Сегментированная запись с восстановлением ----------------------
+
+MANIFEST_SUFFIX = '.manifest.json'
+SEGMENT_OPTIONS = {
+    "Off": (None, None),
+    "10 min": (600, None),
+    "60 min": (3600, None),
+    "50 MB": (None, 50 * 1024 * 1024),
+    "200 MB": (None, 200 * 1024 * 1024),
+}
+# Файлы-спутники записи: журнал артефактов, SCR и метки (суффикс, заголовок)
+SIDECAR_HEADERS = (
+    ('_events.csv', ['kind', 'start_counter', 'end_counter', 'value']),
+    ('_scr.csv', ['onset_counter', 'peak_counter', 'amplitude', 'rise_time_s', 'onset_timestamp']),
+    ('_markers.csv', ['counter', 'label', 'source', 'monotonic_time', 'offset_ms', 'latency_ms']),
+)
+# Реестр незакрытых манифестов всех лабораторных: восстановление находит и записи вне
+# текущего каталога, а владельца (pid, хост) проверяет перед тем, как чинить
+ACTIVE_RECORDINGS_PATH = os.environ.get('SENSOR_ACTIVE_RECORDINGS',
+                                        os.path.join(os.path.expanduser('~'), '.sensor_active_recordings.json'))
+_registry_lock = threading.Lock()
+
+
+def recording_base(path):
+    """Путь записи без расширения; к нему добавляются суффиксы файлов-спутников."""
+    if path.endswith(MANIFEST_SUFFIX):
+        return path[:-len(MANIFEST_SUFFIX)]
+    return os.path.splitext(path)[0]
+
+
+def manifest_path_for(path):
+    return recording_base(path) + MANIFEST_SUFFIX
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_registry(registry):
+    try:
+        with open(registry, encoding='utf-8') as f:
+            entries = json.load(f)
+        return entries if isinstance(entries, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_registry(registry, manifest_path, owner=None):
+    """Добавляет манифест в реестр (owner) или убирает его (owner=None)."""
+    if not registry:
+        return
+    with _registry_lock:
+        entries = _read_registry(registry)
+        key = os.path.abspath(manifest_path)
+        if owner is None:
+            if entries.pop(key, None) is None:
+                return
+        else:
+            entries[key] = owner
+        try:
+            _write_json_atomic(registry, entries)
+        except OSError:
+            pass
+
+
+def recording_owner():
+    return {'pid': os.getpid(), 'host': socket.gethostname(), 'started': time.time()}
+
+
+# Допуск при сравнении времени запуска процесса с owner['started']: btime в /proc — с точностью до секунды
+OWNER_START_SLACK_S = 2.0
+
+
+def _linux_process_start(pid):
+    """Время запуска процесса (Unix time) по /proc или None, если узнать нельзя."""
+    try:
+        with open(f'/proc/{pid}/stat', encoding='ascii', errors='replace') as f:
+            # Имя процесса в скобках может содержать пробелы; поле 22 (starttime) — 20-е после ')'
+            ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/stat', encoding='ascii') as f:
+            btime = next(int(line.split()[1]) for line in f if line.startswith('btime '))
+        return btime + ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+def owner_alive(owner):
+    """Жив ли процесс, ведущий запись. Запись с другого компьютера (общий сетевой
+    каталог) проверить нельзя — считается живой, её не трогаем.
+
+    Pid после перезагрузки мог достаться другому процессу: процесс, запущенный позже
+    owner['started'], владельцем записи быть не может. Где время запуска узнать нельзя
+    (не Linux и не Windows), проверяется только существование pid."""
+    if not isinstance(owner, dict) or not isinstance(owner.get('pid'), int):
+        return False
+    if owner.get('host') != socket.gethostname():
+        return True
+    pid = owner['pid']
+    started = owner.get('started')
+    if sys.platform == 'win32':
+        # os.kill(pid, 0) на Windows не проверка, а CTRL_C_EVENT
+        import ctypes
+        from ctypes import wintypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        times = [wintypes.FILETIME() for _ in range(4)]
+        ok = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        timed = kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times))
+        kernel32.CloseHandle(handle)
+        if not (ok and code.value == 259):  # STILL_ACTIVE
+            return False
+        if timed and isinstance(started, (int, float)):
+            # FILETIME — сотни наносекунд от 1601-01-01
+            created = (times[0].dwHighDateTime << 32 | times[0].dwLowDateTime) / 1e7 - 11644473600
+            return created <= started + OWNER_START_SLACK_S
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    except OSError:
+        return False
+    process_start = _linux_process_start(pid) if sys.platform.startswith('linux') else None
+    if process_start is not None and isinstance(started, (int, float)):
+        return process_start <= started + OWNER_START_SLACK_S
+    return True
+
+
+class SegmentedRecorder:
+    """CSV-запись с ротацией файлов и манифестом контрольных точек.
+
+    Каждые flush_interval секунд буферы сбрасываются на диск (flush + fsync) вместе с
+    подключёнными файлами-спутниками, а в манифест атомарно записывается контрольная
+    точка. При аварии теряется не больше одного интервала. Без ротации запись идёт
+    в один файл path; с ротацией — в path_part001.csv, path_part002.csv, ...
+    Пока запись открыта, манифест числится в реестре registry с владельцем-процессом.
+    """
+
+    def __init__(self, path, header, max_seconds=None, max_bytes=None, flush_interval=1.0,
+                 registry=ACTIVE_RECORDINGS_PATH):
+        self.path = path
+        self.header = header
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.rotating = bool(max_seconds or max_bytes)
+        self.manifest_path = manifest_path_for(path)
+        self.sidecars = []
+        self.lock = threading.Lock()
+        self.registry = registry
+        owner = recording_owner()
+        self.manifest = {'version': 1, 'status': 'recording', 'header': header,
+                         'created': time.time(), 'owner': owner, 'segments': [], 'sidecars': []}
+        self.file = None
+        self.writer = None
+        self._open_segment()
+        _update_registry(registry, self.manifest_path, owner)
+
+    def _segment_path(self, number):
+        if not self.rotating:
+            return self.path
+        return f"{os.path.splitext(self.path)[0]}_part{number:03d}.csv"
+
+    def _open_segment(self):
+        number = len(self.manifest['segments']) + 1
+        path = self._segment_path(number)
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        # writerow возвращает число записанных символов; строки записи — ASCII, то есть это байты
+        self.segment_bytes = self.writer.writerow(self.header)
+        self.segment = {'file': os.path.basename(path), 'rows': 0, 'first_counter': None,
+                        'last_counter': None, 'start_time': None, 'end_time': None,
+                        'bytes': 0, 'closed': False}
+        self.manifest['segments'].append(self.segment)
+        self.segment_opened = time.time()
+        self.last_flush = self.segment_opened
+        self._checkpoint()
+
+    def attach(self, f):
+        """Файл-спутник (журнал событий, метки): сбрасывается вместе с сегментами."""
+        self.sidecars.append(f)
+        self.manifest['sidecars'].append(os.path.basename(f.name))
+
+    def write_row(self, row):
+        with self.lock:
+            if self.file is None:
+                return
+            self.segment_bytes += self.writer.writerow(row)
+            segment = self.segment
+            segment['rows'] += 1
+            if segment['first_counter'] is None:
+                segment['first_counter'] = row[2]
+                segment['start_time'] = row[0]
+            segment['last_counter'] = row[2]
+            segment['end_time'] = row[0]
+
+            now = time.time()
+            if now - self.last_flush >= self.flush_interval:
+                self._checkpoint()
+            if self.rotating and ((self.max_seconds and now - self.segment_opened >= self.max_seconds) or
+                                  (self.max_bytes and self.segment_bytes >= self.max_bytes)):
+                self._close_segment()
+                self._open_segment()
+
+    def _checkpoint(self):
+        for f in [self.file] + self.sidecars:
+            if not f.closed:
+                f.flush()
+                os.fsync(f.fileno())
+        self.segment['bytes'] = self.file.tell()
+        self.manifest['checkpoint'] = {'time': time.time(), 'segment': len(self.manifest['segments']),
+                                       'counter': self.segment['last_counter'],
+                                       'bytes': self.segment['bytes']}
+        _write_json_atomic(self.manifest_path, self.manifest)
+        self.last_flush = time.time()
+
+    def _close_segment(self):
+        self.segment['closed'] = True
+        self._checkpoint()
+        self.file.close()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self.manifest['status'] = 'closed'
+            self._close_segment()
+            self.file = None
+            self.writer = None
+        _update_registry(self.registry, self.manifest_path)
+
+    @property
+    def segment_count(self):
+        return len(self.manifest['segments'])
+
+    @property
+    def rows(self):
+        return sum(segment['rows'] for segment in self.manifest['segments'])
+
+
+def repair_tail(path):
+    """Обрезает файл после последнего перевода строки; возвращает число удалённых байт."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        f.truncate(pos)
+        return size - pos
+
+
+def _last_row(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().splitlines()
+    for line in reversed(lines):
+        row = line.decode('utf-8', 'replace').split(',')
+        if len(row) >= 4 and _is_valid_row(row):
+            return row
+    return None
+
+
+def recover_manifest(manifest_path):
+    """Восстанавливает запись, прерванную аварией: чинит хвосты файлов и закрывает манифест.
+    Запись, процесс-владелец которой ещё жив, не трогается (None)."""
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('status') != 'recording' or owner_alive(manifest.get('owner')):
+        return None
+    directory = os.path.dirname(manifest_path)
+    repaired = 0
+    for segment in manifest['segments']:
+        path = os.path.join(directory, segment['file'])
+        if segment['closed'] or not os.path.exists(path):
+            continue
+        repaired += repair_tail(path)
+        with open(path, 'rb') as f:
+            segment['rows'] = max(0, sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1)
+        last = _last_row(path)
+        if last and segment['rows']:
+            segment['last_counter'] = int(float(last[2]))
+            segment['end_time'] = float(last[0])
+        segment['bytes'] = os.path.getsize(path)
+        segment['closed'] = True
+    for name in manifest.get('sidecars', []):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            repaired += repair_tail(path)
+    manifest['status'] = 'recovered'
+    manifest['recovered'] = time.time()
+    _write_json_atomic(manifest_path, manifest)
+    return manifest, repaired
+
+
+def recover_recordings(directory=None, registry=ACTIVE_RECORDINGS_PATH):
+    """Незакрытые манифесты каталога и реестра с мёртвым владельцем чинит; возвращает
+    список (путь, манифест, байт обрезано). Из реестра уходят закрытые и пропавшие записи."""
+    paths = {os.path.abspath(path) for path in _read_registry(registry)} if registry else set()
+    if directory is not None:
+        paths.update(os.path.abspath(path) for path in glob.glob(os.path.join(directory, '*' + MANIFEST_SUFFIX)))
+    recovered = []
+    for manifest_path in sorted(paths):
+        try:
+            result = recover_manifest(manifest_path)
+            with open(manifest_path, encoding='utf-8') as f:
+                status = json.load(f).get('status')
+        except (OSError, ValueError, KeyError):
+            status = None
+            result = None
+        if status != 'recording':
+            _update_registry(registry, manifest_path)
+        if result:
+            recovered.append((manifest_path,) + result)
+    return recovered
+
+
+def recording_lines(path):
+    """Строки данных записи без заголовка; манифест читается как одна непрерывная запись."""
+    if path.endswith(MANIFEST_SUFFIX):
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        paths = [os.path.join(os.path.dirname(path), segment['file']) for segment in manifest['segments']]
+    else:
+        paths = [path]
+    for segment_path in paths:
+        if not os.path.exists(segment_path):
+            continue
+        with open(segment_path, newline='', encoding='utf-8') as f:
+            f.readline()
+            yield from f
+
+
+# ---------------------- Поиск устройств: параллельный опрос портов ----------------------
+
+PORT_CACHE_PATH = os.environ.get('SENSOR_PORT_CACHE',
+                                 os.path.join(os.path.expanduser('~'), '.sensor_ports.json'))
+PROBE_TIMEOUT = 2.5
+PROBE_CANCEL_TIMEOUT = 1.0  # за это время отменённый опрос закрывает порты
+FIRMATA_REPORT_VERSION = b'\xf9'
+
+DEVICE_TAGGED = 'tagged'
+DEVICE_BINARY = 'binary-v1'
+DEVICE_FIRMATA = 'firmata'
+DEVICE_SILENT = 'silent'
+DEVICE_UNKNOWN = 'unknown'
+DEVICE_BUSY = 'busy'
+DEVICE_LABELS = {
+    DEVICE_TAGGED: "Tagged",
+    DEVICE_BINARY: "Binary v1",
+    DEVICE_FIRMATA: "Firmata",
+    DEVICE_SILENT: "No data",
+    DEVICE_UNKNOWN: "Unknown data",
+    DEVICE_BUSY: "Busy",
+}
+
+
+def _tagged_channels(data):
+    """Каналы, чьи метки "A0"/"A1" повторяются с периодом кадра (3 или 6 байт)."""
+    channels = []
+    for tag in (b'A0', b'A1'):
+        positions = [m.start() for m in re.finditer(re.escape(tag), data)]
+        steps = [b - a for a, b in zip(positions, positions[1:])]
+        if len(steps) >= 3 and sum(step in (3, 6) for step in steps) * 2 > len(steps):
+            channels.append(tag.decode())
+    return channels
+
+
+def fingerprint(data):
+    """Протокол по байтам, прочитанным с порта: (тип устройства, подробности)."""
+    if not data:
+        return DEVICE_SILENT, ''
+    channels = _tagged_channels(data)
+    if channels:
+        return DEVICE_TAGGED, '/'.join(channels)
+    frames = FrameDecoder().feed(data)
+    if frames:
+        return DEVICE_BINARY, f"{len(frames[0][1])} ch"
+    # Ответ на запрос версии: 0xF9, старшая и младшая версии протокола (2.x или 3.x)
+    for match in re.finditer(re.escape(FIRMATA_REPORT_VERSION), data):
+        version = data[match.end():match.end() + 2]
+        if len(version) == 2 and 2 <= version[0] <= 3 and version[1] < 16:
+            return DEVICE_FIRMATA, f"v{version[0]}.{version[1]}"
+    return DEVICE_UNKNOWN, f"{len(data)} bytes"
+
+
+def probe_port(device, baudrates, timeout=PROBE_TIMEOUT, cancel=None):
+    """Слушает порт до timeout секунд на каждой скорости, пока протокол не опознан.
+
+    Запрос версии Firmata отправляется сразу и повторно через половину окна: после
+    сброса по DTR платам с загрузчиком нужно до ~2 с, чтобы начать отвечать.
+    Установленное событие cancel прерывает опрос; результат тогда помечен 'cancelled'.
+    """
+    started = time.perf_counter()
+    result = {'device': device, 'kind': DEVICE_SILENT, 'detail': '', 'baudrate': baudrates[0]}
+    for baudrate in baudrates:
+        if cancel is not None and cancel.is_set():
+            result['cancelled'] = True
+            break
+        try:
+            ser = serial.Serial(device, baudrate, timeout=0.05, exclusive=True)
+        except (serial.SerialException, OSError, ValueError) as e:
+            result.update(kind=DEVICE_BUSY, detail=str(e))
+            break
+        data = bytearray()
+        try:
+            ser.write(FIRMATA_REPORT_VERSION)
+            opened, asked_again = time.perf_counter(), False
+            while time.perf_counter() - opened < timeout:
+                if cancel is not None and cancel.is_set():
+                    result['cancelled'] = True
+                    break
+                data += ser.read(ser.in_waiting or 1)
+                kind, detail = fingerprint(bytes(data))
+                if kind not in (DEVICE_SILENT, DEVICE_UNKNOWN):
+                    break
+                if not asked_again and time.perf_counter() - opened > timeout / 2:
+                    ser.write(FIRMATA_REPORT_VERSION)
+                    asked_again = True
+        except (serial.SerialException, OSError) as e:
+            kind, detail = DEVICE_BUSY, str(e)
+        finally:
+            ser.close()
+        result.update(kind=kind, detail=detail, baudrate=baudrate)
+        # Нечитаемые байты — вероятно, не та скорость; тишину на другой скорости не перепроверяем
+        if kind != DEVICE_UNKNOWN or result.get('cancelled'):
+            break
+    result['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def probe_ports(devices, baudrates, timeout=PROBE_TIMEOUT, cancel=None):
+    """Опрос всех портов одновременно: общее время — как у самого медленного порта."""
+    if not devices:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(devices)) as pool:
+        return list(pool.map(lambda device: probe_port(device, baudrates, timeout, cancel), devices))
+
+
+def port_key(port):
+    """Ключ кэша: серийный номер USB, без него — VID:PID и имя порта."""
+    if port.serial_number:
+        return f"usb:{port.vid or 0:04x}:{port.pid or 0:04x}:{port.serial_number}"
+    if port.vid is not None:
+        return f"usb:{port.vid:04x}:{port.pid or 0:04x}@{port.device}"
+    return port.device
+
+
+def candidate_ports():
+    """USB-порты (у встроенных ttyS/COM нет VID) — только их опрашивает Detect Devices.
+    Автоматически при запуске порты не опрашиваются: запрос Firmata и сброс по DTR
+    недопустимы для чужих устройств."""
+    return [port for port in serial.tools.list_ports.comports() if port.vid is not None]
+
+
+class PortCache:
+    """Результаты опроса по устройствам; на другом порту та же плата узнаётся по серийному номеру."""
+
+    def __init__(self, path=PORT_CACHE_PATH):
+        self.path = path
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, port):
+        return self.entries.get(port_key(port))
+
+    def put(self, port, result):
+        # Кэшируем только опознанные протоколы: тишина или занятый порт — не свойство платы
+        if result['kind'] in (DEVICE_TAGGED, DEVICE_BINARY, DEVICE_FIRMATA) and not result.get('cancelled'):
+            self.entries[port_key(port)] = dict(result, seen=time.time())
+
+    def save(self):
+        try:
+            _write_json_atomic(self.path, self.entries)
+        except OSError:
+            pass
+
+
+def describe_probe(result, cached=False):
+    text = f"{result['device']}: {DEVICE_LABELS[result['kind']]}"
+    if result['kind'] in (DEVICE_TAGGED, DEVICE_BINARY, DEVICE_FIRMATA):
+        text += f" {result['detail']} @ {result['baudrate']}"
+    return text + (" (cached)" if cached else "")
+
+
+# ---------------------- Пакетный анализ записей ----------------------
+
+RECORDING_HEADER = ['timestamp', 'value', 'counter', 'channel']
+BATCH_CACHE_NAME = '.recording_cache.json'
+BATCH_CACHE_VERSION = 2  # 2: по строке признаков на канал
+
+EEG_BANDS = [('delta', 0.5, 4.0), ('theta', 4.0, 8.0), ('alpha', 8.0, 13.0), ('beta', 13.0, 30.0)]
+
+BATCH_FIELDS = ['file', 'channel', 'samples', 'duration_s', 'rate_hz', 'gaps', 'gap_total_s',
+                'max_gap_s', 'counter_jumps', 'mean', 'std', 'min', 'max', 'scr_count',
+                'scr_per_min', 'artifact_events', 'artifact_share'] + \
+               [f'{name}_power' for name, lo, hi in EEG_BANDS] + \
+               [f'{name}_rel' for name, lo, hi in EEG_BANDS]
+
+
+def is_recording_file(path):
+    if path.endswith(MANIFEST_SUFFIX):
+        return True
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), None) == RECORDING_HEADER
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def find_recordings(directory, recursive=False):
+    """Записи каталога: одиночные CSV и манифесты; сегменты манифеста отдельно не выдаются."""
+    sub = '**' if recursive else ''
+    segments = set()
+    manifests = []
+    for manifest_path in glob.glob(os.path.join(directory, sub, '*' + MANIFEST_SUFFIX), recursive=recursive):
+        try:
+            with open(manifest_path, encoding='utf-8') as f:
+                files = [segment['file'] for segment in json.load(f)['segments']]
+        except (OSError, ValueError, KeyError):
+            continue
+        # Запись без ротации остаётся обычным CSV-файлом
+        if files == [os.path.basename(recording_base(manifest_path)) + '.csv']:
+            continue
+        segments.update(os.path.abspath(os.path.join(os.path.dirname(manifest_path), name)) for name in files)
+        manifests.append(manifest_path)
+    files = [p for p in glob.glob(os.path.join(directory, sub, '*.csv'), recursive=recursive)
+             if os.path.abspath(p) not in segments and is_recording_file(p)]
+    return sorted(files + manifests)
+
+
+def load_recording(path):
+    """Запись по каналам: {канал: (timestamps, values, counters)} в порядке первого появления,
+    так что первым идёт основной канал (его отсчёт пишется раньше дополнительных)."""
+    chunks = list(iter_recording_chunks(path))
+    if not chunks:
+        return {}
+    timestamps, values, counters, channels = (np.concatenate(parts) for parts in zip(*chunks))
+    names, first = np.unique(channels, return_index=True)
+    result = {}
+    for name in names[np.argsort(first)]:
+        mask = channels == name
+        result[str(name)] = (timestamps[mask], values[mask], counters[mask])
+    return result
+
+
+def band_powers(values, fs, segment=256):
+    """Мощность в полосах ЭЭГ усреднением спектров по сегментам (метод Уэлча)."""
+    segment = min(segment, values.size)
+    if segment < 16 or fs <= 0:
+        return {name: float('nan') for name, lo, hi in EEG_BANDS}
+    n_segments = values.size // segment
+    frames = values[:n_segments * segment].reshape(n_segments, segment)
+    frames = (frames - frames.mean(axis=1, keepdims=True)) * np.hanning(segment)
+    power = (np.abs(np.fft.rfft(frames, axis=1)) ** 2).mean(axis=0)
+    freqs = np.fft.rfftfreq(segment, d=1.0 / fs)
+    result = {}
+    for name, lo, hi in EEG_BANDS:
+        mask = (freqs >= lo) & (freqs < hi)
+        result[name] = float(power[mask].sum()) if hi <= fs / 2 and mask.any() else float('nan')
+    return result
+
+
+def analyze_recording(path, adc_max=None):
+    """Признаки записи — список, по словарю на канал (основной первым); функция верхнего
+    уровня, чтобы её можно было отдать в пул процессов. Без adc_max шкала АЦП (8 или 10 бит)
+    определяется по максимуму всех каналов."""
+    channels = load_recording(path)
+    if not channels:
+        return [{'file': os.path.basename(path), 'channel': '', 'samples': 0}]
+    if adc_max is None:
+        adc_max = 1023 if max(values.max() for _, values, _ in channels.values()) > 255 else 255
+    return [dict(analyze_channel(timestamps, values, counters, adc_max),
+                 file=os.path.basename(path), channel=name)
+            for name, (timestamps, values, counters) in channels.items()]
+
+
+def analyze_channel(timestamps, values, counters, adc_max):
+    """Признаки одного канала записи: частота, разрывы, статистика, SCR, артефакты, ритмы."""
+    n = values.size
+    features = {'samples': n, 'start_time': float(timestamps[0])}
+    if n < 2:
+        return features
+
+    duration = float(timestamps[-1] - timestamps[0])
+    rate = (n - 1) / duration if duration > 0 else 0.0
+    dt = np.diff(timestamps)
+    median_dt = float(np.median(dt)) if dt.size else 0.0
+    gaps = dt[dt > max(5 * median_dt, 0.05)]
+    features.update({
+        'duration_s': round(duration, 3),
+        'rate_hz': round(rate, 2),
+        'gaps': int(gaps.size),
+        'gap_total_s': round(float(gaps.sum()), 3),
+        'max_gap_s': round(float(dt.max()), 3),
+        'counter_jumps': int(np.count_nonzero(np.diff(counters) != 1)),
+        'mean': round(float(values.mean()), 3),
+        'std': round(float(values.std()), 3),
+        'min': float(values.min()),
+        'max': float(values.max()),
+    })
+
+    gsr = GsrDecomposer(adc_max, fs=rate or 100.0)
+    for i in range(n):
+        gsr.push(i, values[i], timestamps[i])
+    features['scr_count'] = gsr.scr_count
+    features['scr_per_min'] = round(gsr.scr_count / (duration / 60), 3) if duration > 0 else 0.0
+
+    detector = ArtifactDetector(adc_max, budget_ms=float('inf'))
+    events = []
+    for start in range(0, n, 4096):
+        chunk = values[start:start + 4096]
+        events += detector.push_batch(range(start, start + chunk.size), chunk.tolist())
+    events += detector.flush()
+    flagged = np.zeros(n, dtype=bool)
+    for kind, start, end, value in events:
+        flagged[start:end + 1] = True
+    features['artifact_events'] = len(events)
+    features['artifact_share'] = round(float(flagged.mean()), 4)
+
+    powers = band_powers(values, rate)
+    total = sum(p for p in powers.values() if not math.isnan(p))
+    for name, lo, hi in EEG_BANDS:
+        if math.isnan(powers[name]):
+            features[f'{name}_power'] = features[f'{name}_rel'] = ''
+        else:
+            features[f'{name}_power'] = round(powers[name], 3)
+            features[f'{name}_rel'] = round(powers[name] / total, 4) if total else ''
+    return features
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_batch_cache(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == BATCH_CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {'version': BATCH_CACHE_VERSION, 'paths': {}, 'results': {}}
+
+
+def run_batch(directory, output=None, workers=None, recursive=False, adc_max=None,
+              log=print):
+    """Анализ всех записей каталога в пуле процессов; кэш результатов по хешу содержимого."""
+    output = output or os.path.join(directory, 'recordings_summary.csv')
+    files = [p for p in find_recordings(directory, recursive) if os.path.abspath(p) != os.path.abspath(output)]
+
+    cache_path = os.path.join(directory, BATCH_CACHE_NAME)
+    cache = load_batch_cache(cache_path)
+    digests, todo = {}, []
+    for path in files:
+        st = os.stat(path)
+        known = cache['paths'].get(os.path.abspath(path))
+        # Хеш пересчитываем, только если изменились размер или время модификации
+        if known and known['size'] == st.st_size and known['mtime'] == st.st_mtime:
+            digest = known['hash']
+        else:
+            digest = file_digest(path)
+            cache['paths'][os.path.abspath(path)] = {'size': st.st_size, 'mtime': st.st_mtime, 'hash': digest}
+        digests[path] = digest
+        if digest not in cache['results']:
+            todo.append(path)
+
+    log(f"{len(files)} recordings, {len(files) - len(todo)} cached, {len(todo)} to analyze")
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(analyze_recording, path, adc_max): path for path in todo}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    cache['results'][digests[path]] = future.result()
+                    log(f"[{done}/{len(todo)}] {os.path.basename(path)}")
+                except Exception as e:
+                    log(f"[{done}/{len(todo)}] {os.path.basename(path)}: failed ({e})")
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+    rows = []
+    for path in files:
+        for result in cache['results'].get(digests[path], []):
+            rows.append(dict(result, file=os.path.relpath(path, directory)))
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=BATCH_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    log(f"Summary written to {output}")
+    return rows
+
+
+def batch_main(argv, adc_max=None):
+    parser = argparse.ArgumentParser(prog='batch', description='Batch analysis of recorded CSV sessions')
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output', help='summary table (default: <directory>/recordings_summary.csv)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('-r', '--recursive', action='store_true')
+    parser.add_argument('--adc-max', type=int, default=adc_max,
+                        help=f"ADC full scale (default: {adc_max or 'auto'})")
+    args = parser.parse_args(argv)
+    run_batch(args.directory, args.output, args.workers, args.recursive, args.adc_max)
+
+# ---------------------- Каталог записей (SQLite) ----------------------
+
+CATALOG_PATH = os.environ.get('SENSOR_CATALOG',
+                              os.path.join(os.path.expanduser("~"), ".sensor_recordings.sqlite"))
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    device TEXT,
+    signal TEXT,
+    port TEXT,
+    protocol TEXT,
+    channels TEXT,
+    sample_rate REAL,
+    start_time REAL,
+    duration_s REAL,
+    samples INTEGER,
+    marker_count INTEGER DEFAULT 0,
+    markers TEXT,
+    artifact_count INTEGER DEFAULT 0,
+    artifacts TEXT,
+    artifact_share REAL,
+    scr_count INTEGER,
+    lost_frames INTEGER,
+    registered_at REAL
+);
+CREATE TABLE IF NOT EXISTS session_channels (
+    channel TEXT NOT NULL,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    PRIMARY KEY (channel, session_id)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_signal_start ON sessions(signal, start_time);
+CREATE INDEX IF NOT EXISTS idx_sessions_duration ON sessions(duration_s);
+CREATE INDEX IF NOT EXISTS idx_session_channels_session ON session_channels(session_id);
+"""
+
+CATALOG_FIELDS = ['path', 'device', 'signal', 'port', 'protocol', 'channels', 'sample_rate',
+                  'start_time', 'duration_s', 'samples', 'marker_count', 'markers',
+                  'artifact_count', 'artifacts', 'artifact_share', 'scr_count', 'lost_frames']
+
+
+class RecordingCatalog:
+    """Локальный каталог сессий: одна строка на запись плюс индекс по каналам."""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(CATALOG_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def register(self, session):
+        """Добавляет или обновляет сессию; markers/artifacts — словари {метка/тип: количество}."""
+        row = {field: session.get(field) for field in CATALOG_FIELDS}
+        row['path'] = os.path.abspath(row['path'])
+        for field in ('markers', 'artifacts'):
+            if isinstance(row[field], dict):
+                row[field] = json.dumps(row[field], ensure_ascii=False)
+        row['registered_at'] = time.time()
+        channels = [c for c in (row['channels'] or '').split(',') if c]
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE path = ?", (row['path'],))
+            cursor = self.db.execute(
+                f"INSERT INTO sessions ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                list(row.values())
+            )
+            self.db.executemany("INSERT INTO session_channels (channel, session_id) VALUES (?, ?)",
+                                [(channel, cursor.lastrowid) for channel in channels])
+        return cursor.lastrowid
+
+    def find(self, channel=None, signal=None, min_duration=None, since=None, until=None,
+             device=None, limit=None):
+        query = "SELECT s.* FROM sessions s"
+        where, params = [], []
+        if channel:
+            query += " JOIN session_channels c ON c.session_id = s.id"
+            where.append("c.channel = ?")
+            params.append(channel)
+        if signal:
+            where.append("s.signal = ?")
+            params.append(signal)
+        if device:
+            where.append("s.device LIKE ?")
+            params.append(f"%{device}%")
+        if min_duration is not None:
+            where.append("s.duration_s >= ?")
+            params.append(min_duration)
+        if since is not None:
+            where.append("s.start_time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("s.start_time < ?")
+            params.append(until)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY s.start_time DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.db.execute(query, params)]
+
+    def import_directory(self, directory, signal=None, recursive=False, adc_max=None, log=print):
+        """Регистрирует уже существующие записи (без сведений о порте и устройстве).
+
+        Частота, длительность, артефакты и SCR берутся по основному каналу, как при
+        регистрации сеанса из монитора; остальные каналы попадают в индекс каналов.
+        """
+        count = 0
+        for path in find_recordings(directory, recursive):
+            channels = analyze_recording(path, adc_max)
+            features = channels[0]
+            marker_count, markers = read_marker_summary(path)
+            self.register(dict(
+                path=path, signal=signal, channels=','.join(f['channel'] for f in channels),
+                sample_rate=features.get('rate_hz'),
+                start_time=min((f['start_time'] for f in channels if 'start_time' in f), default=None),
+                duration_s=features.get('duration_s'), samples=features.get('samples'),
+                marker_count=marker_count, markers=markers,
+                artifact_count=features.get('artifact_events'),
+                artifact_share=features.get('artifact_share'), scr_count=features.get('scr_count'),
+            ))
+            count += 1
+            log(f"registered {path}")
+        return count
+
+
+def read_marker_summary(path):
+    """Количество меток и счётчик по меткам из файла <запись>_markers.csv, если он есть."""
+    marker_path = recording_base(path) + '_markers.csv'
+    labels = {}
+    try:
+        with open(marker_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                labels[row['label']] = labels.get(row['label'], 0) + 1
+    except (OSError, KeyError):
+        pass
+    return sum(labels.values()), labels
+
+
+def parse_date(text):
+    return datetime.fromisoformat(text).timestamp() if text else None
+
+
+def catalog_main(argv, signal=None, adc_max=None):
+    parser = argparse.ArgumentParser(prog='catalog', description='Query the local recording catalog')
+    parser.add_argument('--db', default=CATALOG_PATH)
+    parser.add_argument('--channel')
+    parser.add_argument('--signal', help='e.g. EEG or GSR')
+    parser.add_argument('--device')
+    parser.add_argument('--min-duration', type=float, help='seconds')
+    parser.add_argument('--since', help='ISO date, e.g. 2026-09-01')
+    parser.add_argument('--until', help='ISO date (exclusive)')
+    parser.add_argument('--days', type=float, help='only sessions from the last N days')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--scan', metavar='DIR', help='register existing recordings from DIR first')
+    parser.add_argument('--scan-signal', default=signal)
+    args = parser.parse_args(argv)
+
+    catalog = RecordingCatalog(args.db)
+    if args.scan:
+        catalog.import_directory(args.scan, signal=args.scan_signal, adc_max=adc_max)
+    since = parse_date(args.since)
+    if args.days is not None:
+        since = max(since or 0, time.time() - args.days * 86400)
+    rows = catalog.find(args.channel, args.signal, args.min_duration, since, parse_date(args.until),
+                        args.device, args.limit)
+    for row in rows:
+        started = datetime.fromtimestamp(row['start_time']).strftime('%Y-%m-%d %H:%M') if row['start_time'] else '?'
+        print(f"{started}  {row['signal'] or '-':4} {row['channels'] or '-':6} "
+              f"{(row['duration_s'] or 0) / 60:7.1f} min  {row['sample_rate'] or 0:7.1f} Hz  "
+              f"markers {row['marker_count'] or 0:4}  artifacts {row['artifact_count'] or 0:4}  {row['path']}")
+    print(f"{len(rows)} session(s)")
+    catalog.close()
+
+# ---------------------- Потоковый экспорт: EDF+ и Parquet ----------------------
+
+# Parquet доступен только при установленном pyarrow; сам импорт (~150 мс) — при первой записи
+pa = pq = None
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+
+def load_pyarrow():
+    global pa, pq
+    if pq is None and PARQUET_AVAILABLE:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+    return pq
+
+EDF_MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+EDF_ANNOTATION_BYTES = 120
+# Место под отметку времени записи ("+<секунды>\x14\x14\x00") перед аннотациями
+EDF_TAL_RESERVE = 16
+# Место под длительность ("\x15<секунды>"), которая появляется при слиянии повторов
+EDF_DURATION_RESERVE = 12
+EDF_MAX_DURATION_S = 9999.0
+# В одну запись помещается 3–4 аннотации; очередь сверх этого не растёт без предела
+EDF_MAX_PENDING_ANNOTATIONS = 256
+# Запись в реальном времени: канал, отставший на столько секунд, дополняется повтором значения
+EDF_MAX_LAG_S = 5.0
+# В EDF+ у всех каналов одна частота; канал, отличающийся сильнее, при экспорте пропускается
+EDF_RATE_TOLERANCE = 0.05
+ADC_VREF_MV = 5000.0
+
+
+def _edf_field(value, width):
+    text = str(value)
+    if isinstance(value, float):
+        text = f"{value:.6f}".rstrip('0').rstrip('.')[:width]
+    return text[:width].ljust(width).encode('ascii', 'replace')
+
+
+def _edf_tal(onset, text='', duration=None):
+    tal = f"{onset:+.4f}".rstrip('0').rstrip('.')
+    if duration is not None:
+        tal += f"\x15{duration:.4f}".rstrip('0').rstrip('.')
+    return (tal + '\x14' + text + '\x14\x00').encode('utf-8')
+
+
+class EdfWriter:
+    """Потоковая запись EDF+C: по одной записи данных (record_duration секунд) за раз.
+
+    Физическая шкала — напряжение на входе АЦП: цифровые 0..adc_max соответствуют
+    0..vref_mv мВ, так что 8-битные (0–255) и 10-битные (0–1023) записи
+    сопоставимы. Число записей в заголовке дописывается при закрытии.
+
+    Запись данных уходит, когда отсчётов хватает по всем каналам. С max_lag_s канал,
+    отставший больше чем на max_lag_s (замолчавший), дополняется повтором последнего
+    значения, чтобы буферы остальных не росли без предела; число таких отсчётов — в padded.
+
+    Аннотации ждут места в канале аннотаций очередных записей. Повтор той же аннотации
+    на соседнем отсчёте сливается с предыдущей (растёт её длительность); сверх
+    max_pending очередь не растёт, лишние аннотации, как и не уместившиеся в записи
+    с реальными отсчётами к close(), считаются в dropped_annotations.
+    """
+
+    def __init__(self, path, channels, fs, adc_max, start_time=None, record_duration=1.0,
+                 vref_mv=ADC_VREF_MV, transducer='Arduino ADC', signal=None, max_lag_s=None,
+                 max_pending=EDF_MAX_PENDING_ANNOTATIONS):
+        self.path = path
+        self.channels = list(channels)
+        self.samples_per_record = max(1, int(round(fs * record_duration)))
+        self.fs = self.samples_per_record / record_duration
+        self.record_duration = record_duration
+        self.adc_max = adc_max
+        self.vref_mv = vref_mv
+        self.start_time = start_time or time.time()
+        self.buffers = {channel: [] for channel in self.channels}
+        self.max_lag = None if max_lag_s is None else max(1, int(max_lag_s / record_duration)) * self.samples_per_record
+        self.last_values = dict.fromkeys(self.channels, 0)
+        self.padded = dict.fromkeys(self.channels, 0)
+        self.annotations = deque()
+        self.max_pending = max_pending
+        self.dropped_annotations = 0
+        self.records = 0
+        self.file = open(path, 'wb')
+        self._write_header(transducer, signal)
+
+    def _write_header(self, transducer, signal):
+        start = datetime.fromtimestamp(self.start_time)
+        ns = len(self.channels) + 1
+        labels = [f"{signal} {channel}" if signal else channel for channel in self.channels] + ['EDF Annotations']
+        header = b''.join([
+            _edf_field('0', 8),
+            _edf_field('X X X X', 80),
+            _edf_field(f"Startdate {start.day:02d}-{EDF_MONTHS[start.month - 1]}-{start.year} X X X", 80),
+            _edf_field(start.strftime('%d.%m.%y'), 8),
+            _edf_field(start.strftime('%H.%M.%S'), 8),
+            _edf_field(256 * (ns + 1), 8),
+            _edf_field('EDF+C', 44),
+            _edf_field(-1, 8),
+            _edf_field(float(self.record_duration), 8),
+            _edf_field(ns, 4),
+        ])
+        n = len(self.channels)
+        fields = [
+            (labels, 16),
+            ([transducer] * n + [''], 80),
+            (['mV'] * n + [''], 8),
+            ([0.0] * n + [-1], 8),
+            ([float(self.vref_mv)] * n + [1], 8),
+            ([0] * n + [-32768], 8),
+            ([self.adc_max] * n + [32767], 8),
+            ([''] * ns, 80),
+            ([self.samples_per_record] * n + [EDF_ANNOTATION_BYTES // 2], 8),
+            ([''] * ns, 32),
+        ]
+        for values, width in fields:
+            header += b''.join(_edf_field(value, width) for value in values)
+        self.file.write(header)
+
+    def annotate(self, onset, text, duration=None):
+        """Аннотация (метка, артефакт) с началом в секундах от начала записи.
+
+        Текст обрезается по байтам UTF-8 (не разрывая символ) так, чтобы TAL вместе с
+        отметкой времени и длительностью поместился в одну запись: иначе он не ушёл бы ни в одну.
+        """
+        onset = max(onset, 0.0)
+        room = EDF_ANNOTATION_BYTES - EDF_TAL_RESERVE - EDF_DURATION_RESERVE - len(_edf_tal(onset))
+        text = text.replace('\x14', ' ').replace('\x15', ' ').encode('utf-8')[:max(room, 0)]
+        text = text.decode('utf-8', 'ignore')
+        if duration is not None:
+            duration = min(max(duration, 0.0), EDF_MAX_DURATION_S)
+        if self.annotations:
+            last = self.annotations[-1]
+            last_end = last[0] + (last[2] or 0.0)
+            end = onset + (duration or 0.0)
+            if last[1] == text and last[0] <= onset < last_end + 1.5 / self.fs and end - last[0] <= EDF_MAX_DURATION_S:
+                last[2] = max(last_end, end) - last[0]
+                return
+        if len(self.annotations) >= self.max_pending:
+            self.dropped_annotations += 1
+            return
+        self.annotations.append([onset, text, duration])
+
+    def write(self, channel, values):
+        self.buffers[channel].extend(values)
+        while all(len(buf) >= self.samples_per_record for buf in self.buffers.values()):
+            self._write_record()
+        if self.max_lag is not None:
+            while len(self.buffers[channel]) >= self.max_lag + self.samples_per_record:
+                self._write_record(pad=True)
+
+    def _write_record(self, pad=False):
+        spr = self.samples_per_record
+        blocks = {}
+        for channel in self.channels:
+            buf = self.buffers[channel]
+            blocks[channel], self.buffers[channel] = buf[:spr], buf[spr:]
+        # Недобор последней записи у всех каналов одинаков; отставание считаем от самого полного
+        longest = max(len(block) for block in blocks.values())
+        chunks = []
+        for channel, block in blocks.items():
+            if pad and len(block) < spr:
+                self.padded[channel] += longest - len(block)
+                block = block + [block[-1] if block else self.last_values[channel]] * (spr - len(block))
+            self.last_values[channel] = block[-1]
+            chunks.append(np.clip(np.asarray(block), 0, self.adc_max).astype('<i2').tobytes())
+        tal = _edf_tal(self.records * self.record_duration)
+        while self.annotations:
+            onset, text, duration = self.annotations[0]
+            encoded = _edf_tal(onset, text, duration or None)
+            if len(tal) + len(encoded) > EDF_ANNOTATION_BYTES:
+                break
+            tal += encoded
+            self.annotations.popleft()
+        chunks.append(tal.ljust(EDF_ANNOTATION_BYTES, b'\x00'))
+        self.file.write(b''.join(chunks))
+        self.records += 1
+
+    def close(self):
+        # Записи — только под реальные отсчёты; аннотациям, которым не хватило места, записей не добавляем
+        while any(self.buffers.values()):
+            self._write_record(pad=True)
+        self.dropped_annotations += len(self.annotations)
+        self.annotations.clear()
+        self.file.seek(236)
+        self.file.write(_edf_field(self.records, 8))
+        self.file.close()
+
+
+class ParquetSink:
+    """Запись строк в Parquet группами по chunk_rows строк; в памяти — не больше одной группы."""
+
+    def __init__(self, path, chunk_rows=65536):
+        if load_pyarrow() is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.chunk_rows = chunk_rows
+        self.schema = pa.schema([('timestamp', pa.float64()), ('value', pa.int32()),
+                                 ('counter', pa.int64()), ('channel', pa.dictionary(pa.int8(), pa.string()))])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.columns = ([], [], [], [])
+
+    def write_row(self, timestamp, value, counter, channel):
+        for column, item in zip(self.columns, (timestamp, value, counter, channel)):
+            column.append(item)
+        if len(self.columns[0]) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.columns[0]:
+            return
+        timestamps, values, counters, channels = self.columns
+        self.columns = ([], [], [], [])
+        self.write_columns(timestamps, values, counters, channels)
+
+    def write_columns(self, timestamps, values, counters, channels):
+        """Готовый блок столбцов (например, из iter_recording_chunks) — одна группа строк."""
+        table = pa.Table.from_arrays([
+            pa.array(timestamps, pa.float64()),
+            pa.array(values, pa.int32()),
+            pa.array(counters, pa.int64()),
+            pa.array(channels, pa.string()).dictionary_encode().cast(self.schema.field('channel').type),
+        ], schema=self.schema)
+        self.writer.write_table(table, row_group_size=self.chunk_rows)
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class EdfSink:
+    """EDF+ как приёмник записи в реальном времени (каналы записи, частота — оценка на старте)."""
+
+    def __init__(self, path, channels, fs, adc_max, start_time, signal=None):
+        self.channels = list(channels)
+        self.start_time = start_time
+        self.writer = EdfWriter(path, self.channels, fs, adc_max, start_time=start_time, signal=signal,
+                                max_lag_s=EDF_MAX_LAG_S)
+        self.pending = {channel: [] for channel in self.channels}
+        self.first_counter = None
+
+    def write_row(self, timestamp, value, counter, channel):
+        if self.first_counter is None:
+            self.first_counter = counter
+        pending = self.pending.get(channel)
+        if pending is None:
+            return
+        pending.append(value)
+        if len(pending) >= self.writer.samples_per_record:
+            self.writer.write(channel, pending)
+            self.pending[channel] = []
+
+    def annotate(self, counter, text):
+        if self.first_counter is not None:
+            self.writer.annotate((counter - self.first_counter) / self.writer.fs, text)
+
+    def close(self):
+        """Дописывает файл; возвращает предупреждения о каналах, дополненных повтором значения,
+        и об аннотациях, которым не хватило места."""
+        for channel, pending in self.pending.items():
+            if pending:
+                self.writer.write(channel, pending)
+        self.writer.close()
+        warnings = [f"EDF+: {channel} padded with {count} repeated samples (channel silent or lagging)"
+                    for channel, count in self.writer.padded.items() if count]
+        if self.writer.dropped_annotations:
+            warnings.append(f"EDF+: {self.writer.dropped_annotations} annotations dropped "
+                            f"(more than the annotation channel holds)")
+        return warnings
+
+
+def iter_recording_chunks(path, chunk_rows=65536):
+    """Чтение записи блоками: (timestamps, values, counters, channels) как массивы NumPy.
+
+    Числовые столбцы блока разбирает np.loadtxt; если в блоке есть оборванные или
+    испорченные строки (например, хвост после аварийного завершения), они отбрасываются.
+    """
+    source = recording_lines(path)
+    while True:
+        lines = list(itertools.islice(source, chunk_rows))
+        if not lines:
+            break
+        try:
+            data = np.loadtxt(lines, delimiter=',', usecols=(0, 1, 2), ndmin=2)
+            channels = [line.rstrip('\r\n').rsplit(',', 1)[-1] for line in lines]
+            if data.shape[0] != len(channels):
+                raise ValueError("blank lines in chunk")
+        except ValueError:
+            rows = [line.rstrip('\r\n').split(',') for line in lines]
+            rows = [row for row in rows if len(row) >= 4 and _is_valid_row(row)]
+            if not rows:
+                continue
+            data = np.array([[float(row[0]), float(row[1]), float(row[2])] for row in rows], ndmin=2)
+            channels = [row[3] for row in rows]
+        yield data[:, 0], data[:, 1], data[:, 2].astype(np.int64), np.asarray(channels)
+
+
+def _is_valid_row(row):
+    try:
+        float(row[0]), float(row[1]), float(row[2])
+        return True
+    except ValueError:
+        return False
+
+
+def scan_recording(path):
+    """Первый проход без загрузки в память: по каналам [число, t первого, t последнего,
+    максимум, первый counter]."""
+    info = {}
+    for timestamps, values, counters, channels in iter_recording_chunks(path):
+        for channel in np.unique(channels):
+            mask = channels == channel
+            ts, vals = timestamps[mask], values[mask]
+            entry = info.setdefault(str(channel), [0, ts[0], ts[0], vals.max(), int(counters[mask][0])])
+            entry[0] += ts.size
+            entry[2] = ts[-1]
+            entry[3] = max(entry[3], vals.max())
+    return info
+
+
+def export_recording(path, edf_path=None, parquet_path=None, adc_max=None, chunk_rows=65536,
+                     signal=None, log=print):
+    """Потоковое преобразование CSV-записи в EDF+ и/или Parquet за два прохода по файлу."""
+    info = scan_recording(path)
+    if not info:
+        raise ValueError(f"{path}: no samples")
+    start_time = min(entry[1] for entry in info.values())
+    first_counter = min(entry[4] for entry in info.values())
+    if adc_max is None:
+        adc_max = 1023 if max(entry[3] for entry in info.values()) > 255 else 255
+
+    edf = None
+    if edf_path:
+        rates = {channel: (entry[0] - 1) / (entry[2] - entry[1]) for channel, entry in info.items() if entry[2] > entry[1]}
+        # Частота файла — по самому полному каналу; каналы с другой частотой не подгоняются повтором
+        reference = max(info, key=lambda channel: info[channel][0])
+        fs = rates.get(reference, 1.0)
+        edf_channels = sorted(channel for channel in info
+                              if channel == reference or abs(rates.get(channel, 0.0) - fs) <= EDF_RATE_TOLERANCE * fs)
+        for channel in sorted(set(info) - set(edf_channels)):
+            log(f"EDF+: {channel} skipped: {rates.get(channel, 0.0):.1f} Hz differs from {fs:.1f} Hz "
+                f"of {reference} (EDF+ needs one sample rate per file)")
+        edf = EdfWriter(edf_path, edf_channels, fs, adc_max, start_time=start_time, signal=signal)
+    # Метки отдаются по мере чтения, чтобы очередь аннотаций не держала их все сразу
+    markers = deque(sorted(read_markers(path))) if edf else deque()
+    parquet = ParquetSink(parquet_path, chunk_rows) if parquet_path else None
+
+    for timestamps, values, counters, channels in iter_recording_chunks(path, chunk_rows):
+        if parquet:
+            parquet.write_columns(timestamps, values.astype(np.int32), counters, channels)
+        if edf:
+            while markers and markers[0][0] <= counters[-1]:
+                counter, label = markers.popleft()
+                edf.annotate((counter - first_counter) / edf.fs, label)
+            for channel in edf.channels:
+                edf.write(channel, values[channels == channel].astype(np.int32).tolist())
+    if edf:
+        for counter, label in markers:
+            edf.annotate((counter - first_counter) / edf.fs, label)
+        edf.close()
+        log(f"EDF+: {edf_path} ({edf.records} records × {edf.record_duration:g} s, "
+            f"{edf.samples_per_record} samples/record, 0..{adc_max} → 0..{edf.vref_mv:g} mV)")
+        for channel, count in edf.padded.items():
+            if count:
+                log(f"EDF+: {channel} is {count} samples short, padded with its last value")
+        if edf.dropped_annotations:
+            log(f"EDF+: {edf.dropped_annotations} annotations dropped (more than the annotation channel holds)")
+    if parquet:
+        parquet.close()
+        log(f"Parquet: {parquet_path}")
+
+
+def read_markers(path):
+    marker_path = recording_base(path) + '_markers.csv'
+    try:
+        with open(marker_path, newline='', encoding='utf-8') as f:
+            return [(int(row['counter']), row['label']) for row in csv.DictReader(f)]
+    except (OSError, KeyError, ValueError):
+        return []
+
+
+def export_main(argv, signal=None, adc_max=None):
+    parser = argparse.ArgumentParser(prog='export', description='Convert a CSV recording to EDF+ and/or Parquet')
+    parser.add_argument('recording')
+    parser.add_argument('--edf', help='output EDF+ file')
+    parser.add_argument('--parquet', help='output Parquet file')
+    parser.add_argument('--adc-max', type=int, default=adc_max,
+                        help=f"ADC full scale (default: {adc_max or 'auto'})")
+    parser.add_argument('--chunk-rows', type=int, default=65536)
+    args = parser.parse_args(argv)
+    if not args.edf and not args.parquet:
+        base = recording_base(args.recording)
+        args.edf, args.parquet = base + '.edf', (base + '.parquet' if PARQUET_AVAILABLE else None)
+    export_recording(args.recording, args.edf, args.parquet, args.adc_max, args.chunk_rows, signal)
+
+
+# ---------------------- Эпохи и усреднение вызванных ответов ----------------------
+
+EPOCH_PRE_MS = 200
+EPOCH_POST_MS = 800
+
+
+def extract_epochs(data, onsets, pre, post):
+    """Эпохи (события × каналы × отсчёты) вокруг onsets с вычтенной базовой линией [-pre, 0).
+
+    sliding_window_view — представление всех окон длины pre + post над data (каналы ×
+    отсчёты) без копирования; окна событий выбираются одной векторной выборкой, и
+    базовая линия вычитается на месте в этой единственной копии.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(data, pre + post, axis=-1)
+    epochs = windows[:, np.asarray(onsets, dtype=np.int64) - pre].transpose(1, 0, 2)
+    if pre:
+        epochs -= epochs[..., :pre].mean(axis=-1, keepdims=True)
+    return epochs
+
+
+class RunningAverage:
+    """Поточечные среднее и дисперсия эпох; пачки объединяются по формуле Чана."""
+
+    def __init__(self, shape):
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def add(self, epochs):
+        k = len(epochs)
+        if not k:
+            return
+        batch_mean = epochs.mean(axis=0)
+        batch_m2 = ((epochs - batch_mean) ** 2).sum(axis=0)
+        delta = batch_mean - self.mean
+        total = self.n + k
+        self.mean += delta * k / total
+        self.m2 += batch_m2 + delta ** 2 * self.n * k / total
+        self.n = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else np.zeros_like(self.mean)
+
+    def band(self, level=0.95):
+        """Доверительная полоса среднего (нормальное приближение): (нижняя, верхняя)."""
+        if self.n < 2:
+            return self.mean.copy(), self.mean.copy()
+        half = NormalDist().inv_cdf(0.5 + level / 2) * self.std / math.sqrt(self.n)
+        return self.mean - half, self.mean + half
+
+
+def average_epochs(data, events, pre, post, averages=None):
+    """Добавляет эпохи событий [(индекс в data, метка)] в averages {метка: RunningAverage}.
+
+    Возвращает (число принятых эпох, число отброшенных: окно за краем данных или с пропусками).
+    """
+    averages = {} if averages is None else averages
+    accepted = rejected = 0
+    by_label = {}
+    for index, label in events:
+        if index - pre < 0 or index + post > data.shape[-1]:
+            rejected += 1
+        else:
+            by_label.setdefault(label, []).append(index)
+    for label, onsets in by_label.items():
+        epochs = extract_epochs(data, onsets, pre, post)
+        valid = ~np.isnan(epochs).any(axis=(1, 2))
+        averages.setdefault(label, RunningAverage(epochs.shape[1:])).add(epochs[valid])
+        accepted += int(valid.sum())
+        rejected += int((~valid).sum())
+    return accepted, rejected
+
+
+class EpochEngine:
+    """Эпохи в реальном времени: отсчёты копятся в кольцевом буфере, а событие
+    усредняется, как только после него пришло post отсчётов."""
+
+    def __init__(self, pre, post, fs, channels=1, capacity=None):
+        self.pre = pre
+        self.post = post
+        self.fs = fs
+        self.capacity = capacity or max(8 * (pre + post), 4096)
+        self.buffer = np.full((channels, 2 * self.capacity), np.nan)
+        self.start = None
+        self.size = 0
+        self.pending = []
+        self.averages = {}
+        self.accepted = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    @property
+    def times_ms(self):
+        return np.arange(-self.pre, self.post) / self.fs * 1000
+
+    def push(self, index, values, channel=None):
+        """Отсчёт с абсолютным индексом index (значение или по одному на канал).
+
+        С channel значение относится к одному каналу; остальные каналы этого отсчёта
+        остаются NaN, пока их не допишет put(), — эпоха с пропуском отбрасывается.
+        """
+        with self.lock:
+            if self.start is None or index < self.start + self.size:
+                # Начало или сброс счётчика отсчётов
+                self.start, self.size = index, 0
+                self.pending.clear()
+            position = index - self.start
+            if position >= self.buffer.shape[1]:
+                # Буфер вдвое больше capacity: сдвиг раз в capacity отсчётов
+                shift = position - self.capacity + 1
+                keep = max(0, self.size - shift)
+                self.buffer[:, :keep] = self.buffer[:, shift:shift + keep]
+                self.start += shift
+                self.size = keep
+                position -= shift
+            self.buffer[:, self.size:position] = np.nan
+            if channel is None:
+                self.buffer[:, position] = values
+            else:
+                self.buffer[:, position] = np.nan
+                self.buffer[channel, position] = values
+            self.size = position + 1
+
+    def put(self, index, channel, value):
+        """Значение канала channel для уже добавленного отсчёта index (каналы приходят по отдельности)."""
+        with self.lock:
+            if self.start is not None and 0 <= index - self.start < self.size:
+                self.buffer[channel, index - self.start] = value
+
+    def add_event(self, index, label):
+        with self.lock:
+            self.pending.append((index, label))
+
+    def update(self):
+        """Усредняет события, окна которых уже целиком в буфере; возвращает число новых эпох."""
+        with self.lock:
+            if self.start is None or not self.pending:
+                return 0
+            end = self.start + self.size
+            ready = [(index - self.start, label) for index, label in self.pending if index + self.post <= end]
+            self.pending = [(index, label) for index, label in self.pending if index + self.post > end]
+            if not ready:
+                return 0
+            accepted, rejected = average_epochs(self.buffer[:, :self.size], ready, self.pre, self.post,
+                                                self.averages)
+        self.accepted += accepted
+        self.rejected += rejected
+        return accepted
+
+
+def recording_matrix(path):
+    """Запись как матрица каналы × отсчёты по counter (пропуски — NaN).
+
+    Возвращает (первый counter, имена каналов, данные, оценка частоты).
+    """
+    parts = list(iter_recording_chunks(path))
+    if not parts:
+        raise ValueError(f"{path}: no samples")
+    timestamps, values, counters, channels = (np.concatenate(part) for part in zip(*parts))
+    names = sorted(set(channels.tolist()))
+    first = int(counters.min())
+    data = np.full((len(names), int(counters.max()) - first + 1), np.nan)
+    for row, name in enumerate(names):
+        mask = channels == name
+        data[row, counters[mask] - first] = values[mask]
+    ts = timestamps[channels == names[0]]
+    fs = (len(ts) - 1) / (ts[-1] - ts[0]) if len(ts) > 1 and ts[-1] > ts[0] else 0.0
+    return first, names, data, fs
+
+
+def epochs_main(argv):
+    parser = argparse.ArgumentParser(prog='epochs',
+                                     description='Average baseline-corrected epochs around recorded markers')
+    parser.add_argument('recording')
+    parser.add_argument('--pre', type=float, default=EPOCH_PRE_MS / 1000, help='baseline before the event, s')
+    parser.add_argument('--post', type=float, default=EPOCH_POST_MS / 1000, help='window after the event, s')
+    parser.add_argument('--labels', nargs='*', help='marker labels to average (default: all)')
+    parser.add_argument('--fs', type=float, default=None, help='sample rate (default: from timestamps)')
+    parser.add_argument('--level', type=float, default=0.95, help='confidence level of the band')
+    parser.add_argument('--output', help='CSV with the averages (default: <recording>_erp.csv)')
+    args = parser.parse_args(argv)
+
+    first, names, data, fs = recording_matrix(args.recording)
+    fs = args.fs or fs
+    if fs <= 0:
+        raise SystemExit("cannot estimate the sample rate, pass --fs")
+    pre, post = int(round(args.pre * fs)), int(round(args.post * fs))
+    events = [(counter - first, label) for counter, label in read_markers(args.recording)
+              if not args.labels or label in args.labels]
+    averages = {}
+    accepted, rejected = average_epochs(data, events, pre, post, averages)
+    print(f"{accepted} epochs averaged, {rejected} rejected ({len(names)} channel(s), {fs:.1f} Hz, "
+          f"-{pre} .. +{post} samples)")
+
+    output = args.output or recording_base(args.recording) + '_erp.csv'
+    times = np.arange(-pre, post) / fs * 1000
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['label', 'channel', 't_ms', 'n', 'mean', 'ci_low', 'ci_high'])
+        for label, average in sorted(averages.items()):
+            low, high = average.band(args.level)
+            for row, name in enumerate(names):
+                for i, t in enumerate(times):
+                    writer.writerow([label, name, f"{t:.2f}", average.n, f"{average.mean[row, i]:.4f}",
+                                     f"{low[row, i]:.4f}", f"{high[row, i]:.4f}"])
+            print(f"  {label}: n={average.n}")
+    print(f"Averages written to {output}")
+
+# ---------------------- Длительный прогон (soak) на синтетическом устройстве ----------------------
+
+SOAK_WARMUP = 0.2
+SOAK_CONNECT_TIMEOUT = 10.0  # столько ждём подключения синтетического устройства, с
+# Допустимый рост метрики за прогон после прогрева: max(абсолютный, доля от медианы)
+SOAK_LIMITS = {
+    'rss_mb': (25.0, 0.10),
+    'traced_mb': (10.0, 0.10),
+    'tk_lag_ms': (50.0, 0.5),
+    'pending_after': (20.0, 0.5),
+    'backlog_ms': (200.0, 0.5),
+    'process_ms': (1.0, 0.5),
+    'record_ms': (1.0, 0.5),
+    'render_ms': (20.0, 0.5),
+}
+SOAK_FIELDS = ['t', 'samples'] + list(SOAK_LIMITS)
+
+
+class SyntheticSignal:
+    """Сигнал с альфа-ритмом, медленным дрейфом, откликами КГР каждые 20 с и редкими выбросами."""
+
+    def __init__(self, fs, adc_max, seed=0):
+        self.fs = fs
+        self.adc_max = adc_max
+        self.rng = np.random.default_rng(seed)
+
+    def block(self, start, n):
+        t = (start + np.arange(n)) / self.fs
+        phase = t % 20.0
+        x = (0.5 + 0.15 * np.sin(2 * np.pi * 10 * t) + 0.1 * np.sin(2 * np.pi * 0.01 * t) +
+             0.15 * (phase > 2) * np.exp(-np.maximum(phase - 2, 0) / 3) +
+             0.03 * self.rng.standard_normal(n))
+        x[self.rng.random(n) < 1e-4] = 1.0
+        return np.clip(np.round(x * self.adc_max), 0, self.adc_max).astype(int)
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # без /proc (macOS): пиковый RSS в байтах вместо текущего
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+    except ImportError:
+        return float('nan')
+
+
+def _p95(values):
+    return float(np.percentile(values, 95)) if values else float('nan')
+
+
+def soak_trends(rows, limits=SOAK_LIMITS, warmup=SOAK_WARMUP):
+    """Рост каждой метрики по линейной регрессии после прогрева: (метрика, уровень, рост, допуск, ок)."""
+    rows = rows[int(len(rows) * warmup):]
+    t = np.array([row['t'] for row in rows], dtype=float)
+    trends = []
+    for metric, (abs_tol, rel_tol) in limits.items():
+        y = np.array([row[metric] for row in rows], dtype=float)
+        valid = np.isfinite(y)
+        if valid.sum() < 3:
+            trends.append((metric, float('nan'), float('nan'), float('nan'), True))
+            continue
+        slope, intercept = np.polyfit(t[valid], y[valid], 1)
+        growth = slope * (t[valid][-1] - t[valid][0])
+        allowed = max(abs_tol, rel_tol * abs(float(np.median(y[valid]))))
+        trends.append((metric, intercept + slope * t[valid][0], growth, allowed, growth <= allowed))
+    return trends
+
+
+class SoakTest:
+    """Прогон монитора с записью и отрисовкой против синтетического устройства.
+
+    Раз в interval секунд снимаются RSS, объём tracemalloc, задержка таймеров Tk, число
+    ожидающих after-обработчиков, отставание чтения от устройства и p95 длительности
+    стадий; по окончании прогон проваливается, если какая-то метрика растёт.
+
+    Синтетическое устройство у каждой лабораторной своё: connect() в подклассе
+    подключает его к монитору и возвращает объект с методом backlog_ms() или None,
+    если монитор пока не подключился; тогда попытка повторяется до SOAK_CONNECT_TIMEOUT.
+    """
+
+    def __init__(self, app, duration, out_dir, rate, interval=10.0, trace=True, segment="60 min"):
+        self.app = app
+        self.root = app.root
+        self.duration = duration
+        self.out_dir = out_dir
+        self.rate = rate
+        self.interval = interval
+        self.trace = trace
+        self.segment = segment
+        self.rows = []
+        self.stage_times = {'process': [], 'record': [], 'render': []}
+        self.lags = []
+        self.baseline = None
+        self.top_allocations = []
+        self.failed = None
+
+    def _timed(self, stage, func):
+        times = self.stage_times[stage]
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                times.append((time.perf_counter() - started) * 1000)
+        return wrapper
+
+    def start(self):
+        if self.trace:
+            tracemalloc.start()
+        os.makedirs(self.out_dir, exist_ok=True)
+        app = self.app
+        app.process_sample = self._timed('process', app.process_sample)
+        app.update_display = self._timed('render', app.update_display)
+        self.connect_deadline = time.perf_counter() + SOAK_CONNECT_TIMEOUT
+        self.start_when_connected()
+
+    def start_when_connected(self):
+        app = self.app
+        self.device = self.connect()
+        if self.device is None:
+            if time.perf_counter() < self.connect_deadline:
+                self.root.after(500, self.start_when_connected)
+            else:
+                self.abort(f"device did not connect within {SOAK_CONNECT_TIMEOUT:g} s")
+            return
+        app.segment_var.set(self.segment)
+        app.path_var.set(os.path.join(self.out_dir, 'soak.csv'))
+        app.start_recording()
+        if app.recorder is None:
+            self.abort("recording did not start")
+            return
+        app.recorder.write_row = self._timed('record', app.recorder.write_row)
+        self.metrics_file = open(os.path.join(self.out_dir, 'soak_metrics.csv'), 'w', newline='', encoding='utf-8')
+        self.metrics_writer = csv.DictWriter(self.metrics_file, SOAK_FIELDS)
+        self.metrics_writer.writeheader()
+        self.started = time.perf_counter()
+        self.lag_expected = self.started + 0.1
+        self.root.after(100, self.probe_lag)
+        self.root.after(int(self.interval * 1000), self.tick)
+        print(f"Soak: {self.duration / 3600:.2f} h at {self.rate:.0f} samples/s, output in {self.out_dir}")
+
+    def connect(self):
+        raise NotImplementedError
+
+    def abort(self, reason):
+        """Прогон не начался: причина в stderr, код возврата soak_main — ошибка."""
+        print(f"SOAK FAILED: {reason}", file=sys.stderr)
+        self.failed = True
+        if self.trace:
+            tracemalloc.stop()
+        self.app.stop()
+
+    def probe_lag(self):
+        """Таймер на 100 мс: опоздание его срабатывания — задержка очереди событий Tk."""
+        now = time.perf_counter()
+        self.lags.append((now - self.lag_expected) * 1000)
+        self.lag_expected = now + 0.1
+        if self.failed is None:
+            self.root.after(100, self.probe_lag)
+
+    def tick(self):
+        elapsed = time.perf_counter() - self.started
+        stages = {stage: times[:] for stage, times in self.stage_times.items()}
+        for times in self.stage_times.values():
+            times.clear()
+        lags, self.lags = self.lags, []
+        row = {
+            't': round(elapsed, 1),
+            'samples': self.app.counter,
+            'rss_mb': current_rss_mb(),
+            'traced_mb': tracemalloc.get_traced_memory()[0] / 2 ** 20 if self.trace else float('nan'),
+            'tk_lag_ms': _p95(lags),
+            'pending_after': len(self.root.tk.splitlist(self.root.tk.call('after', 'info'))),
+            'backlog_ms': self.device.backlog_ms(),
+        }
+        row.update({f'{stage}_ms': _p95(times) for stage, times in stages.items()})
+        self.rows.append(row)
+        self.metrics_writer.writerow(row)
+        self.metrics_file.flush()
+        if self.trace and self.baseline is None and elapsed >= self.duration * SOAK_WARMUP:
+            self.baseline = tracemalloc.take_snapshot()
+        if elapsed >= self.duration:
+            self.finish()
+        else:
+            self.root.after(int(self.interval * 1000), self.tick)
+
+    def finish(self):
+        self.app.stop_recording()
+        self.metrics_file.close()
+        if self.trace and self.baseline is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self.baseline, 'lineno')
+            self.top_allocations = [str(stat) for stat in stats[:10]]
+        if self.trace:
+            tracemalloc.stop()
+        trends = soak_trends(self.rows)
+        self.failed = not all(ok for metric, level, growth, allowed, ok in trends)
+        print(self.report(trends))
+        self.app.stop()
+
+    def report(self, trends):
+        lines = [f"Soak finished: {self.rows[-1]['t'] if self.rows else 0:.0f} s, "
+                 f"{self.app.counter} samples, {len(self.rows)} metric points",
+                 f"  {'metric':<14}{'level':>10}{'growth':>10}{'allowed':>10}  status"]
+        for metric, level, growth, allowed, ok in trends:
+            lines.append(f"  {metric:<14}{level:>10.2f}{growth:>+10.2f}{allowed:>10.2f}  {'ok' if ok else 'TRENDING UP'}")
+        b = self.app.budget
+        lines.append(f"  profile '{self.app.preset_name}': {b.overruns} over-budget checks "
+                     f"(CPU {b.cpu_percent:g}%, frame latency {b.latency_ms:g} ms), "
+                     f"degrade level {self.app.degrade_level}")
+        if self.top_allocations:
+            lines.append("  Top allocation growth since warm-up:")
+            lines += [f"    {line}" for line in self.top_allocations]
+        lines.append("SOAK FAILED" if self.failed else "SOAK PASSED")
+        return '\n'.join(lines)
+
+
+# ---------------------- Профили сеанса и бюджеты производительности ----------------------
+
+PRESETS_PATH = os.environ.get('SENSOR_PRESETS',
+                              os.path.join(os.path.expanduser('~'), '.sensor_presets.json'))
+DEFAULT_PRESET = 'Default'
+# Стадии обработки отсчёта в порядке цепочки; при деградации отключаются с конца
+PRESET_STAGES = ('artifacts', 'gsr', 'epochs')
+PRESET_EXPORTS = ('edf', 'parquet')
+PRESET_INTS = ('baudrate', 'buffer_points', 'visible_points', 'decimation')
+PRESET_FLOATS = ('sample_rate', 'poll_ms', 'render_fps', 'cpu_budget', 'latency_budget_ms')
+
+def normalize_preset(preset, default):
+    """Профиль с недостающими полями из default (встроенный Default лабораторной);
+    неверное значение — ValueError с именем поля."""
+    result = dict(default, **{key: value for key, value in preset.items() if key in default})
+    field = None
+    try:
+        for field in PRESET_INTS:
+            result[field] = int(result[field])
+        for field in PRESET_FLOATS:
+            result[field] = float(result[field])
+        field = 'y_range'
+        if result['y_range'] is not None:
+            lo, hi = (float(value) for value in result['y_range'])
+            result['y_range'] = [lo, hi]
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: expected a number") from None
+    checks = [
+        ('channels', bool(result['channels']) and all(re.fullmatch(r'A[0-5]', str(channel))
+                                                      for channel in result['channels'])),
+        ('sample_rate', result['sample_rate'] > 0),
+        ('poll_ms', result['poll_ms'] >= 0),
+        ('visible_points', 0 < result['visible_points'] <= result['buffer_points']),
+        ('render_fps', result['render_fps'] > 0),
+        ('decimation', result['decimation'] >= 1),
+        ('y_range', result['y_range'] is None or result['y_range'][0] < result['y_range'][1]),
+        ('segment', result['segment'] in SEGMENT_OPTIONS),
+        ('export', all(kind in PRESET_EXPORTS for kind in result['export'])),
+        ('chain', all(stage in PRESET_STAGES for stage in result['chain'])),
+        ('cpu_budget', result['cpu_budget'] > 0),
+        ('latency_budget_ms', result['latency_budget_ms'] > 0),
+    ]
+    for field, ok in checks:
+        if not ok:
+            raise ValueError(f"{field}: invalid value {result[field]!r}")
+    result['channels'] = list(dict.fromkeys(result['channels']))
+    result['degrade'] = bool(result['degrade'])
+    return result
+
+
+def degrade_levels(preset):
+    """Ступени деградации профиля: [0] — сам профиль, каждая следующая на шаг дешевле.
+
+    Сначала график прореживается (×2, ×4), затем вдвое снижается частота кадров, но не
+    ниже той, при которой ожидание кадра занимает половину бюджета задержки; дальше с
+    конца цепочки отключаются стадии обработки, первая остаётся всегда. Шаги, которые
+    ничего не меняют, пропускаются.
+    """
+    levels = [dict(preset)]
+
+    def step(**changes):
+        settings = dict(levels[-1], **changes)
+        if settings != levels[-1]:
+            levels.append(settings)
+
+    for _ in range(2):
+        step(decimation=levels[-1]['decimation'] * 2)
+    floor = min(preset['render_fps'], 2000.0 / preset['latency_budget_ms'])
+    for _ in range(2):
+        step(render_fps=max(floor, levels[-1]['render_fps'] / 2))
+    for _ in range(len(preset['chain']) - 1):
+        step(chain=levels[-1]['chain'][:-1])
+    return levels
+
+
+def describe_preset(settings):
+    chain = ' → '.join(settings['chain']) or 'raw'
+    return (f"{settings['sample_rate']:g} Hz {'+'.join(settings['channels'])} | "
+            f"buffer {settings['buffer_points']}, view {settings['visible_points']} | "
+            f"{settings['render_fps']:.3g} fps, plot ×{settings['decimation']} | {chain}")
+
+
+class PresetStore:
+    """Встроенные и сохранённые профили. Файл общий для обеих лабораторных, поэтому
+    профили лежат под ключом signal (EEG, GSR) вместе с именем последнего выбранного;
+    normalize — проверка профиля лабораторной (по умолчанию normalize_preset по её Default)."""
+
+    def __init__(self, signal, builtins, normalize=None, path=PRESETS_PATH):
+        self.path = path
+        self.signal = signal
+        self.builtins = builtins
+        self.normalize = normalize or (lambda preset: normalize_preset(preset, builtins[DEFAULT_PRESET]))
+        self.saved = {}
+        self.errors = []
+        section = self._read().get(signal, {})
+        for name, preset in section.get('presets', {}).items():
+            try:
+                self.saved[name] = self.normalize(preset)
+            except ValueError as e:
+                self.errors.append(f"{name}: {e}")
+        self.last = section.get('last') if section.get('last') in self.names() else DEFAULT_PRESET
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def names(self):
+        return list(self.builtins) + [name for name in self.saved if name not in self.builtins]
+
+    def get(self, name):
+        return dict(self.saved.get(name) or self.builtins[name])
+
+    def save(self, name, preset):
+        self.saved[name] = self.normalize(preset)
+        self.select(name)
+
+    def select(self, name):
+        self.last = name
+        data = self._read()
+        data[self.signal] = {'presets': self.saved, 'last': self.last}
+        try:
+            _write_json_atomic(self.path, data)
+        except OSError:
+            pass
+
+
+class PerformanceBudget:
+    """Бюджет профиля: загрузка CPU процессом (% одного ядра) и задержка от прихода отсчёта
+    до кадра с ним на экране (p95 за интервал между проверками).
+
+    check() вызывается раз в секунду в потоке Tk: +1 — бюджет превышен patience проверок
+    подряд, пора деградировать; -1 — restore_after проверок обе метрики ниже половины
+    бюджета, можно вернуть шаг назад; иначе 0.
+    """
+
+    def __init__(self, cpu_percent, latency_ms, patience=3, restore_after=10):
+        self.cpu_percent = cpu_percent
+        self.latency_ms = latency_ms
+        self.patience = patience
+        self.restore_after = restore_after
+        self.latencies_ms = deque(maxlen=1000)
+        self.cpu = 0.0
+        self.latency_p95 = 0.0
+        self.over = 0
+        self.under = 0
+        self.overruns = 0
+        self.last_check = (time.perf_counter(), time.process_time())
+
+    def add_latency(self, ms):
+        self.latencies_ms.append(ms)
+
+    @property
+    def exceeded(self):
+        return self.cpu > self.cpu_percent or self.latency_p95 > self.latency_ms
+
+    def check(self):
+        now, cpu_now = time.perf_counter(), time.process_time()
+        wall, cpu = now - self.last_check[0], cpu_now - self.last_check[1]
+        self.last_check = (now, cpu_now)
+        self.cpu = cpu / wall * 100 if wall > 0 else 0.0
+        latencies = list(self.latencies_ms)
+        self.latencies_ms.clear()
+        self.latency_p95 = _p95(latencies) if latencies else 0.0
+        if self.exceeded:
+            self.overruns += 1
+            self.over, self.under = self.over + 1, 0
+        elif self.cpu < self.cpu_percent / 2 and self.latency_p95 < self.latency_ms / 2:
+            self.over, self.under = 0, self.under + 1
+        else:
+            self.over = self.under = 0
+        if self.over >= self.patience:
+            self.over = 0
+            return 1
+        if self.under >= self.restore_after:
+            self.under = 0
+            return -1
+        return 0
+
+
+# ---------------------- Общая часть окна монитора ----------------------
+
+class MonitorMixin:
+    """Методы GSRMonitor, одинаковые в Lab 5 и Lab 6; атрибуты окна (root, figure, gsr,
+    detector, markers, export_sinks и т. д.) создаёт GSRMonitor.__init__ лабораторной."""
+
+    # ---------------------- Запуск окна ----------------------
+
+    def on_first_map(self, event):
+        if event.widget is not self.root or self.window_shown:
+            return
+        self.window_shown = True
+        self.root.unbind('<Map>')
+        self.startup.mark('first window')
+        self.refresh_ports()
+        self.start_serial_reading()
+        self.startup.mark('ports + reader')
+        self.root.after(500, self.poll_epochs)
+        self.root.after(1000, self.check_budget)
+        self.root.after(0, self.finish_startup)
+
+    def finish_startup(self):
+        if self.preload_thread.is_alive():
+            self.root.after(20, self.finish_startup)
+            return
+        self.build_plot()
+        self.startup.mark('plot')
+        print(self.startup.report())
+
+    # ---------------------- Опрос портов ----------------------
+
+    def refresh_ports(self):
+        ports = serial.tools.list_ports.comports()
+        port_list = [port.device for port in ports]
+        self.port_combo['values'] = port_list
+        if port_list and not self.port_var.get():
+            self.port_var.set(port_list[0])
+        # Платы, известные по кэшу, выбираются сразу; новые опрашиваются только по Detect Devices
+        self.port_info = {}
+        for port in ports:
+            cached = self.port_cache.get(port)
+            if cached:
+                self.port_info[port.device] = dict(cached, device=port.device, cached=True)
+        self.select_detected_port()
+        self.show_probe_results()
+
+    def cancel_probe(self):
+        """Прерывает опрос (например, при подключении): порты освобождаются, результаты отбрасываются."""
+        if not self.probing:
+            return
+        self.probe_cancel.set()
+        self.probe_thread.join(timeout=PROBE_CANCEL_TIMEOUT)
+        self.probing = False
+        self.show_probe_results()
+
+    def apply_probe_results(self, ports, results):
+        if not self.probing:
+            return
+        self.probing = False
+        for port, result in zip(ports, results):
+            self.port_info[port.device] = result
+            self.port_cache.put(port, result)
+        self.port_cache.save()
+        self.select_detected_port()
+        self.show_probe_results()
+
+    def show_probe_results(self):
+        lines = [describe_probe(result, result.get('cached')) for result in self.port_info.values()]
+        self.probe_var.set('\n'.join(lines) or "Press 🔎 Detect Devices to identify boards")
+
+    # ---------------------- Обработка в потоке чтения ----------------------
+
+    def handle_artifacts(self, events):
+        for kind, start, end, value in events:
+            self.artifact_events.append((kind, start, end, value))
+            self.artifact_count += 1
+            with self.sidecar_lock:
+                if self.event_writer:
+                    # Индексы в журнале совпадают со столбцом counter основного CSV
+                    self.event_writer.writerow([kind, start + 1, end + 1, f"{value:.3f}"])
+                    self.record_artifact_kinds[kind] = self.record_artifact_kinds.get(kind, 0) + 1
+                    self.record_artifact_samples += end - start + 1
+                    self.annotate_exports(start + 1, f"artifact:{kind}")
+        self.root.after(0, self.update_artifact_info)
+
+    def write_exports(self, timestamp, value, channel):
+        with self.export_lock:
+            for sink in self.export_sinks:
+                sink.write_row(timestamp, value, self.counter, channel)
+
+    def annotate_exports(self, counter, text):
+        with self.export_lock:
+            for sink in self.export_sinks:
+                if hasattr(sink, 'annotate'):
+                    sink.annotate(counter, text)
+
+    def close_export_sinks(self):
+        with self.export_lock:
+            sinks, self.export_sinks = self.export_sinks, []
+        warnings = []
+        for sink in sinks:
+            warnings += sink.close() or []
+        return warnings
+
+    def handle_scr(self, scr):
+        onset, peak, amplitude, rise_time, onset_ts = scr
+        self.scr_events.append(scr)
+        with self.sidecar_lock:
+            if self.scr_writer:
+                self.scr_writer.writerow([onset + 1, peak + 1, f"{amplitude:.2f}", f"{rise_time:.3f}", onset_ts])
+
+    # ---------------------- Метки стимулов ----------------------
+
+    def start_marker_server(self):
+        try:
+            self.marker_server.start()
+        except OSError as e:
+            self.marker_info_var.set(f"UDP port {MARKER_PORT} unavailable: {e}")
+
+    def on_marker_key(self, event):
+        if event.widget.winfo_class() in ('TEntry', 'Entry', 'TCombobox'):
+            return
+        if event.char and (event.char.isdigit() or event.char == ' '):
+            self.add_marker('key_space' if event.char == ' ' else f'key_{event.char}', source='key')
+
+    def add_marker(self, label, source='api'):
+        """API для скриптов внутри процесса; время фиксируется в момент вызова."""
+        self.markers.mark(label, source=source)
+
+    def handle_markers(self, resolved):
+        for index, label, source, t_mark, offset_ms, latency_ms in resolved:
+            self.epochs.add_event(index, label)
+            with self.sidecar_lock:
+                if self.marker_writer:
+                    self.marker_writer.writerow([index + 1, label, source, f"{t_mark:.6f}",
+                                                 f"{offset_ms:.2f}", f"{latency_ms:.2f}"])
+                    self.record_marker_labels[label] = self.record_marker_labels.get(label, 0) + 1
+                    self.annotate_exports(index + 1, label)
+        self.root.after(0, self.update_marker_info)
+
+    def update_marker_info(self):
+        report = self.markers.latency_report()
+        if not report:
+            return
+        index, label, source, t_mark, offset_ms, latency_ms = self.markers.markers[-1]
+        self.marker_info_var.set(
+            f"{report['count']} markers | last '{label}' @ {index + 1}\n"
+            f"latency avg {report['latency_mean_ms']:.1f} / max {report['latency_max_ms']:.1f} ms | "
+            f"offset avg {report['offset_mean_ms']:.1f} / max {report['offset_max_ms']:.1f} ms"
+        )
+
+    # ---------------------- Профиль сеанса и бюджет ----------------------
+
+    def apply_settings(self, settings):
+        """Рабочие настройки: одна из ступеней degrade_levels профиля."""
+        self.settings = settings
+        self.stages = frozenset(settings['chain'])
+        if settings['buffer_points'] != self.x_data.maxlen:
+            self.x_data = deque(self.x_data, maxlen=settings['buffer_points'])
+            self.y_data = deque(self.y_data, maxlen=settings['buffer_points'])
+            self.tonic_data = deque(self.tonic_data, maxlen=settings['buffer_points'])
+        if settings['visible_points'] != self.visible_points:
+            self.visible_points = settings['visible_points']
+            self.view_stats.resize(self.visible_points)
+        self.scroll_position = max(0, len(self.x_data) - self.visible_points)
+        self.update_scrollbar_position()
+        self.update_plot_view()
+
+    def on_draw(self, event):
+        # Задержка «отсчёт → кадр»: от прихода последнего отрисованного отсчёта до конца отрисовки
+        if self.render_sample_time is not None:
+            self.budget.add_latency((time.time() - self.render_sample_time) * 1000)
+            self.render_sample_time = None
+
+    def check_budget(self):
+        b = self.budget
+        step = b.check()
+        if step and self.preset['degrade']:
+            level = min(max(self.degrade_level + step, 0), len(self.degrade_levels) - 1)
+            if level != self.degrade_level:
+                self.degrade_level = level
+                self.apply_settings(self.degrade_levels[level])
+                info = describe_preset(self.settings)
+                if level:
+                    info += f"\n⚠️ Degraded (level {level}) to stay within budget"
+                self.preset_info_var.set(info)
+        info = (f"⏱️ CPU {b.cpu:.0f}% / {b.cpu_percent:g}% | "
+                f"frame latency p95 {b.latency_p95:.0f} / {b.latency_ms:g} ms")
+        if b.exceeded:
+            info += " | ⚠️ over budget"
+        if b.overruns:
+            info += f" | overruns {b.overruns}"
+        if self.degrade_level:
+            info += f" | degraded: level {self.degrade_level}"
+        self.budget_var.set(info)
+        if self.running:
+            self.root.after(1000, self.check_budget)
+
+    # ---------------------- Вызванные ответы ----------------------
+
+    def epoch_samples(self, ms):
+        return max(0, int(round(ms * self.gsr.fs / 1000)))
+
+    # ---------------------- Обновление графика и статусов ----------------------
+
+    def update_artifact_info(self):
+        d = self.detector
+        self.artifact_var.set(f"⚠️ Artifacts: {self.artifact_count} | "
+                              f"detector {d.last_ms:.2f} ms/batch (max {d.max_ms:.2f}, "
+                              f"budget {d.budget_ms:.1f}, overruns {d.overruns})")
+
+    def on_stats_window_change(self, event=None):
+        self.stats.resize(int(self.stats_window_var.get()))
+
+    def clear_plot(self):
+        self.x_data.clear()
+        self.y_data.clear()
+        self.stats.reset()
+        self.view_stats.reset()
+        self.detector.reset()
+        self.artifact_events.clear()
+        self.gsr.reset()
+        self.tonic_data.clear()
+        self.scr_events.clear()
+        self.markers.reset()
+        self.reset_epochs(force=True)
+        self.counter = 0
+        self.scroll_position = 0
+        self.scroll_var.set(0)
+        if self.canvas is not None:
+            self.line.set_data([], [])
+            self.artifact_line.set_data([], [])
+            self.tonic_line.set_data([], [])
+            self.scr_line.set_data([], [])
+            self.marker_line.set_data([], [])
+            self.ax.set_xlim(0, self.visible_points)
+            self.canvas.draw()
+        self.counter_var.set("📊 Data points: 0")
+        self.value_var.set("🎯 Current value: --")
+        self.stats_var.set("📐 Mean: -- | RMS: -- | Peak: --")
+        self.scroll_info_var.set("Viewing: latest data")
+
+    # ---------------------- Запись в CSV ----------------------
+
+    def recorded_path(self):
+        if self.record_segments > 1 or SEGMENT_OPTIONS[self.segment_var.get()] != (None, None):
+            return manifest_path_for(self.path_var.get())
+        return self.path_var.get()
+
+    def open_sidecar_files(self):
+        """Открывает журналы событий, SCR и меток рядом с записью и подключает их к recorder.
+        Поток чтения видит файлы только под sidecar_lock и уже с заголовками."""
+        base = os.path.splitext(self.path_var.get())[0]
+        files = []
+        try:
+            for suffix, header in SIDECAR_HEADERS:
+                f = open(base + suffix, 'w', newline='', encoding='utf-8')
+                files.append(f)
+                csv.writer(f).writerow(header)
+        except Exception:
+            for f in files:
+                f.close()
+            raise
+        for f in files:
+            self.recorder.attach(f)
+        with self.sidecar_lock:
+            self.event_file, self.scr_file, self.marker_file = files
+            self.event_writer, self.scr_writer, self.marker_writer = (csv.writer(f) for f in files)
+
+    def close_sidecar_files(self):
+        """Закрывает журналы событий, SCR и меток текущей записи. Поток чтения пишет в них из
+        handle_artifacts/handle_scr/handle_markers, поэтому файлы сначала отцепляются под
+        sidecar_lock и закрываются уже после него (как экспорт в close_export_sinks)."""
+        with self.sidecar_lock:
+            files = [self.event_file, self.scr_file, self.marker_file]
+            self.event_file = self.scr_file = self.marker_file = None
+            self.event_writer = self.scr_writer = self.marker_writer = None
+        for f in files:
+            if f:
+                f.close()
+
+    def abort_recording(self):
+        """Откатывает start_recording, упавший на полпути: запись закрывается и снимается с реестра,
+        файлы-спутники и экспорт закрываются, окно возвращается в состояние «не пишем»."""
+        self.recording = False
+        recorder, self.recorder = self.recorder, None
+        try:
+            if recorder:
+                recorder.close()
+        finally:
+            try:
+                self.close_sidecar_files()
+            finally:
+                self.close_export_sinks()
+                self.record_status_var.set("🔴 Recording: OFF")
+                self.start_record_btn.config(state="normal")
+                self.stop_record_btn.config(state="disabled")
+
+    def recover_recordings(self):
+        """Чинит записи, оборванные аварийным завершением прошлого запуска: из каталога записи
+        и из общего реестра. Запись, которую ещё ведёт другая запущенная лабораторная, не трогается."""
+        directory = os.path.dirname(self.path_var.get()) or '.'
+        try:
+            recovered = recover_recordings(directory)
+        except OSError:
+            return
+        if recovered:
+            names = ', '.join(os.path.basename(recording_base(path)) for path, manifest, repaired in recovered)
+            self.record_info_var.set(f"Recovered after crash: {names}")
+
+    # ---------------------- Работа со скроллом графика ----------------------
+
+    def on_scroll(self, value):
+        if len(self.x_data) > self.visible_points:
+            max_scroll = len(self.x_data) - self.visible_points
+            self.scroll_position = int(float(value) / 100 * max_scroll)
+            self.update_plot_view()
+
+    def scroll_up(self):
+        if self.scroll_position > 0:
+            self.scroll_position -= 10
+            if self.scroll_position < 0:
+                self.scroll_position = 0
+            self.update_scrollbar_position()
+            self.update_plot_view()
+
+    def scroll_down(self):
+        max_scroll = max(0, len(self.x_data) - self.visible_points)
+        if self.scroll_position < max_scroll:
+            self.scroll_position += 10
+            if self.scroll_position > max_scroll:
+                self.scroll_position = max_scroll
+            self.update_scrollbar_position()
+            self.update_plot_view()
+
+    def scroll_to_latest(self):
+        self.scroll_position = max(0, len(self.x_data) - self.visible_points)
+        self.update_scrollbar_position()
+        self.update_plot_view()
+
+    def update_scrollbar_position(self):
+        max_scroll = max(1, len(self.x_data) - self.visible_points)
+        if max_scroll > 0:
+            scroll_percentage = (self.scroll_position / max_scroll) * 100
+            self.scroll_var.set(scroll_percentage)
+
+    def update_plot_view(self):
+        if self.canvas is not None and len(self.x_data) > 0:
+            start_idx = self.scroll_position
+            end_idx = start_idx + self.visible_points
+
+            if len(self.x_data) >= end_idx:
+                x_view = list(self.x_data)[start_idx:end_idx]
+                y_view = list(self.y_data)[start_idx:end_idx]
+            else:
+                x_view = list(self.x_data)
+                y_view = list(self.y_data)
+
+            step = self.settings['decimation']
+            self.line.set_data(x_view[::step], y_view[::step])
+            self.artifact_line.set_data(x_view, self.artifact_overlay(x_view, y_view))
+            tonic_view = list(self.tonic_data)[start_idx:start_idx + len(x_view)]
+            if len(tonic_view) == len(x_view):
+                self.tonic_line.set_data(x_view[::step], tonic_view[::step])
+            self.scr_line.set_data(*self.scr_overlay(x_view, y_view))
+            self.ax.set_xlim(x_view[0], x_view[0] + self.visible_points)
+            if self.autoscale_var.get():
+                if end_idx >= len(self.x_data):
+                    data_lo = self.view_stats.percentile(AUTOSCALE_PERCENTILE)
+                    data_hi = self.view_stats.percentile(100 - AUTOSCALE_PERCENTILE)
+                else:
+                    data_lo, data_hi = robust_range(y_view)
+                self.ax.set_ylim(*self.autoscaler.update(data_lo, data_hi))
+            self.marker_line.set_data(*self.marker_overlay(x_view))
+
+            total_points = len(self.x_data)
+            if total_points > self.visible_points:
+                view_info = f"Viewing: {start_idx}-{min(end_idx, total_points)} of {total_points}"
+                if end_idx >= total_points:
+                    view_info += " (LATEST)"
+            else:
+                view_info = "Viewing: all data"
+
+            self.scroll_info_var.set(view_info)
+            self.canvas.draw_idle()
+
+    def artifact_overlay(self, x_view, y_view):
+        overlay = [float('nan')] * len(y_view)
+        if not x_view:
+            return overlay
+        first, last = x_view[0], x_view[-1]
+        for kind, start, end, value in list(self.artifact_events):
+            if end < first or start > last:
+                continue
+            if start == end and start > first:
+                start -= 1
+            for i in range(max(start, first) - first, min(end, last) - first + 1):
+                overlay[i] = y_view[i]
+        return overlay
+
+    def marker_overlay(self, x_view):
+        xs, ys = [], []
+        if not x_view:
+            return xs, ys
+        lo, hi = self.ax.get_ylim()
+        for index, label, source, t_mark, offset_ms, latency_ms in list(self.markers.markers):
+            if x_view[0] <= index <= x_view[-1]:
+                xs += [index, index, float('nan')]
+                ys += [lo, hi, float('nan')]
+        return xs, ys
+
+    def scr_overlay(self, x_view, y_view):
+        xs, ys = [], []
+        if not x_view:
+            return xs, ys
+        first, last = x_view[0], x_view[-1]
+        for onset, peak, amplitude, rise_time, onset_ts in list(self.scr_events):
+            if first <= peak <= last:
+                xs.append(peak)
+                ys.append(y_view[peak - first])
+        return xs, ys
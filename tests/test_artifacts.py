@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import (
+    ARTIFACT_CLIP, ARTIFACT_FLAT, ARTIFACT_OUTLIER, ARTIFACT_STEP, ArtifactDetector,
+)
+
+
+def noise(rng, n, center=500, spread=20):
+    return [center + rng.randint(-spread, spread) for _ in range(n)]
+
+
+def stream_events(detector, values, kinds=None):
+    events = []
+    for index, value in enumerate(values):
+        events += detector.push(index, value)
+    events += detector.flush()
+    return sorted(event for event in events if kinds is None or event[0] in kinds)
+
+
+class ArtifactDetectorTest(unittest.TestCase):
+    def test_clip_run_needs_clip_run_samples(self):
+        rng = random.Random(1)
+        values = noise(rng, 100) + [1023] * 2 + noise(rng, 100) + [0] * 3 + noise(rng, 100)
+        events = stream_events(ArtifactDetector(1023), values, {ARTIFACT_CLIP})
+        self.assertEqual(events, [(ARTIFACT_CLIP, 202, 204, 0.0)])
+
+    def test_flat_run_across_batches(self):
+        rng = random.Random(2)
+        values = noise(rng, 60) + [400] * 51 + noise(rng, 60) + [600] * 49 + noise(rng, 60)
+        events = stream_events(ArtifactDetector(1023, batch_size=16), values, {ARTIFACT_FLAT})
+        # Первый отсчёт плато ещё отличается от предыдущего; серия нулевых разностей — 50 отсчётов
+        self.assertEqual(events, [(ARTIFACT_FLAT, 61, 110, 400.0)])
+
+    def test_step_reports_the_jump(self):
+        values = [500] * 30 + [800] * 30
+        values[1::2] = [value + 1 for value in values[1::2]]
+        events = stream_events(ArtifactDetector(1023), values, {ARTIFACT_STEP})
+        self.assertEqual(events, [(ARTIFACT_STEP, 30, 30, 299.0)])
+
+    def test_outlier_against_running_baseline(self):
+        rng = random.Random(3)
+        values = noise(rng, 500, spread=5) + [700] + noise(rng, 200, spread=5)
+        events = stream_events(ArtifactDetector(1023, step_threshold=1e9), values, {ARTIFACT_OUTLIER})
+        self.assertEqual([(kind, start, end) for kind, start, end, z in events], [(ARTIFACT_OUTLIER, 500, 500)])
+        self.assertGreater(events[0][3], 6.0)
+
+    def test_runs_do_not_depend_on_batch_boundaries(self):
+        rng = random.Random(4)
+        values = []
+        for _ in range(40):
+            values += noise(rng, rng.randint(1, 40))
+            values += rng.choice([[0] * rng.randint(1, 6), [1023] * rng.randint(1, 6),
+                                  [300] * rng.randint(40, 70), [900]])
+        kinds = {ARTIFACT_CLIP, ARTIFACT_FLAT, ARTIFACT_STEP}
+        whole = ArtifactDetector(1023)
+        expected = sorted(event for event in whole.push_batch(range(len(values)), values) + whole.flush()
+                          if event[0] in kinds)
+        self.assertTrue({event[0] for event in expected} >= kinds)
+        for batch_size in (8, 13, 64):
+            detector = ArtifactDetector(1023, batch_size=batch_size, budget_ms=1e9)
+            self.assertEqual(stream_events(detector, values, kinds), expected, batch_size)
+
+    def test_batch_shrinks_when_over_budget(self):
+        detector = ArtifactDetector(1023, batch_size=64, budget_ms=0.0)
+        for index in range(64 + 32 + 16 + 8 + 8):
+            detector.push(index, 500)
+        self.assertEqual(detector.batch_size, 8)
+        self.assertEqual(detector.overruns, 5)
+        detector.reset()
+        self.assertEqual((detector.batch_size, detector.overruns), (64, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import EDF_ANNOTATION_BYTES, EdfSink, EdfWriter, EDF_MAX_PENDING_ANNOTATIONS
+
+
+def read_edf(path):
+    """Число записей, отсчётов на запись по сигналам и сырые байты аннотаций каждой записи."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = int(data[236:244])
+    ns = int(data[252:256])
+    offset = 256 + 216 * ns
+    samples = [int(data[offset + 8 * i:offset + 8 * i + 8]) for i in range(ns)]
+    record_bytes = 2 * sum(samples)
+    body = data[256 * (ns + 1):]
+    annotations = [body[r * record_bytes + 2 * sum(samples[:-1]):(r + 1) * record_bytes]
+                   for r in range(records)]
+    return records, samples, annotations, len(body) == records * record_bytes
+
+
+class EdfWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'rec.edf')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def close_with_timeout(self, writer):
+        thread = threading.Thread(target=writer.close, daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive(), "EdfWriter.close() did not finish")
+
+    def test_long_non_ascii_label_is_truncated_to_fit_a_record(self):
+        label = 'Стимул' * 11  # 66 символов кириллицы — больше 120 байт в UTF-8
+        writer = EdfWriter(self.path, ['A0'], 10.0, 1023, start_time=0)
+        writer.annotate(0.5, label)
+        writer.write('A0', [512] * 10)
+        self.close_with_timeout(writer)
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertTrue(complete)
+        self.assertEqual(samples[-1] * 2, EDF_ANNOTATION_BYTES)
+        text = b''.join(annotations).split(b'\x14')[3].decode('utf-8')
+        self.assertTrue(label.startswith(text))
+        self.assertGreater(len(text), 0)
+
+    def test_annotations_never_add_records_beyond_real_samples(self):
+        writer = EdfWriter(self.path, ['A0'], 10.0, 1023, start_time=0)
+        for i in range(30):
+            writer.annotate(i * 0.05, f'метка_{i}_' + 'ж' * 40)
+        writer.write('A0', [1] * 20)
+        self.close_with_timeout(writer)
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertTrue(complete)
+        self.assertEqual(records, 2)
+        self.assertEqual(writer.padded, {'A0': 0})
+        written = b''.join(annotations).decode('utf-8')
+        kept = [i for i in range(30) if f'метка_{i}_' in written]
+        # Уходят первые по времени; остальные учтены как отброшенные
+        self.assertEqual(kept, list(range(len(kept))))
+        self.assertGreater(len(kept), 0)
+        self.assertEqual(len(kept) + writer.dropped_annotations, 30)
+
+    def test_repeated_annotation_on_adjacent_samples_is_merged(self):
+        writer = EdfWriter(self.path, ['A0'], 10.0, 1023, start_time=0)
+        for i in range(50):
+            writer.annotate(1.0 + i * 0.1, 'artifact:step')
+        writer.annotate(7.0, 'artifact:step')
+        self.assertEqual([a[:2] for a in writer.annotations], [[1.0, 'artifact:step'], [7.0, 'artifact:step']])
+        self.assertAlmostEqual(writer.annotations[0][2], 4.9)
+        writer.write('A0', [1] * 10)
+        self.close_with_timeout(writer)
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertEqual(records, 1)
+        self.assertIn(b'+1\x154.9\x14artifact:step\x14', annotations[0])
+        self.assertEqual(writer.dropped_annotations, 0)
+
+    def test_pending_annotations_are_bounded(self):
+        sink = EdfSink(self.path, ['A0'], 10.0, 1023, start_time=0)
+        sink.write_row(0.0, 1, 0, 'A0')
+        for counter in range(0, 2000, 2):
+            sink.annotate(counter, f'key_{counter}')
+        self.assertEqual(len(sink.writer.annotations), EDF_MAX_PENDING_ANNOTATIONS)
+        warnings = sink.close()
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertEqual(records, 1)
+        self.assertEqual(sink.writer.dropped_annotations, 1000 - sum(a.count(b'key_') for a in annotations))
+        self.assertTrue(any('annotations dropped' in warning for warning in warnings))
+
+    def test_silent_channel_is_padded_and_buffers_stay_bounded(self):
+        sink = EdfSink(self.path, ['A0', 'A1'], 10.0, 1023, start_time=0)
+        for counter in range(1, 1001):
+            sink.write_row(0.0, counter % 1024, counter, 'A0')
+            buffered = sum(len(buf) for buf in sink.writer.buffers.values())
+            self.assertLessEqual(buffered, 10 * 7)
+        warnings = sink.close()
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertTrue(complete)
+        self.assertEqual(records, 100)
+        self.assertEqual(sink.writer.padded, {'A0': 0, 'A1': 1000})
+        self.assertEqual(len(warnings), 1)
+
+    def test_close_writes_every_buffered_sample(self):
+        writer = EdfWriter(self.path, ['A0', 'A1'], 10.0, 1023, start_time=0)
+        writer.write('A0', list(range(95)))
+        writer.write('A1', list(range(40)))
+        self.close_with_timeout(writer)
+
+        records, samples, annotations, complete = read_edf(self.path)
+        self.assertTrue(complete)
+        self.assertEqual(records, 10)
+        self.assertEqual(writer.padded, {'A0': 0, 'A1': 55})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import EpochEngine
+
+
+class EpochEngineTest(unittest.TestCase):
+    def test_channels_pushed_separately_are_averaged_together(self):
+        engine = EpochEngine(2, 4, 100.0, channels=2)
+        for index in range(40):
+            engine.push(index, index % 5, 0)
+            engine.put(index, 1, 10 * (index % 5))
+        engine.add_event(10, 'stim')
+        engine.add_event(20, 'stim')
+        self.assertEqual(engine.update(), 2)
+
+        mean = engine.averages['stim'].mean
+        self.assertEqual(mean.shape, (2, 6))
+        np.testing.assert_allclose(mean[1], 10 * mean[0])
+
+    def test_missing_channel_rejects_the_epoch(self):
+        engine = EpochEngine(2, 4, 100.0, channels=2)
+        for index in range(40):
+            engine.push(index, 1.0, 0)
+            if index != 21:
+                engine.put(index, 1, 2.0)
+        engine.add_event(10, 'stim')
+        engine.add_event(20, 'stim')
+        engine.update()
+        self.assertEqual((engine.accepted, engine.rejected), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
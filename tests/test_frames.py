@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import FRAME_SYNC, FrameDecoder, crc8, encode_frame, frame_size
+
+
+def stream(seqs, n_channels=2):
+    """Кадры с номерами seqs и значениями, по которым номер восстанавливается."""
+    return b''.join(encode_frame(seq, [(seq + i) & 0x3FF for i in range(n_channels)]) for seq in seqs)
+
+
+class FrameDecoderTest(unittest.TestCase):
+    def test_crc8_matches_the_sketch_polynomial(self):
+        # Контрольное значение CRC-8 (poly 0x07, init 0) для "123456789"
+        self.assertEqual(crc8(b'123456789'), 0xF4)
+
+    def test_round_trip_for_every_channel_count(self):
+        for n_channels in range(1, 7):
+            values = [0, 1023, 512, 1, 700, 333][:n_channels]
+            frame = encode_frame(300, values)
+            self.assertEqual(len(frame), frame_size(n_channels))
+            decoder = FrameDecoder()
+            self.assertEqual(decoder.feed(frame), [(300, values)])
+            self.assertEqual((decoder.lost, decoder.crc_errors, decoder.resyncs), (0, 0, 0))
+
+    def test_crc_error_drops_the_frame_and_counts_it_as_lost(self):
+        bad = bytearray(encode_frame(1, [100, 200]))
+        bad[6] ^= 0x10
+        decoder = FrameDecoder()
+        frames = decoder.feed(encode_frame(0, [1, 2]) + bytes(bad) + encode_frame(2, [3, 4]))
+        self.assertEqual([seq for seq, values in frames], [0, 2])
+        self.assertEqual((decoder.crc_errors, decoder.lost, decoder.frames), (1, 1, 2))
+
+    def test_exact_loss_counts(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed(stream([0, 1, 5, 6, 10]))
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(decoder.lost, 3 + 3)
+        self.assertAlmostEqual(decoder.loss_ratio(), 6 / 11)
+        self.assertEqual(decoder.resyncs, 0)
+
+    def test_counter_wraparound_is_not_a_loss(self):
+        decoder = FrameDecoder()
+        decoder.feed(stream([65534, 65535, 0, 1]))
+        self.assertEqual((decoder.lost, decoder.resyncs), (0, 0))
+        decoder.feed(stream([4]))
+        self.assertEqual(decoder.lost, 2)
+
+    def test_sequence_restart_is_a_resync_not_a_loss(self):
+        decoder = FrameDecoder()
+        decoder.feed(stream([5000, 5001, 0, 1]))
+        self.assertEqual((decoder.lost, decoder.resyncs, decoder.frames), (0, 1, 4))
+
+    def test_resync_after_garbage(self):
+        # Мусор с ложным синхрословом (неверный заголовок) перед кадром и между кадрами
+        garbage = b'\x00\x13' + FRAME_SYNC + b'\xff\x42' + FRAME_SYNC[:1] + b'\x99'
+        decoder = FrameDecoder()
+        frames = decoder.feed(garbage + stream([0, 1]) + garbage + stream([2, 3]))
+        self.assertEqual([seq for seq, values in frames], [0, 1, 2, 3])
+        self.assertEqual((decoder.resyncs, decoder.lost, decoder.crc_errors), (2, 0, 0))
+
+    def test_garbage_spread_over_reads_is_one_resync(self):
+        decoder = FrameDecoder()
+        decoder.feed(stream([0]))
+        for _ in range(5):
+            self.assertEqual(decoder.feed(b'\x11\x22\x33'), [])
+        self.assertEqual([seq for seq, values in decoder.feed(stream([1]))], [1])
+        self.assertEqual(decoder.resyncs, 1)
+        self.assertLessEqual(len(decoder.buffer), 1)
+
+    def test_frames_split_across_feeds(self):
+        data = stream(range(200), n_channels=3)
+        whole = FrameDecoder().feed(data)
+        rng = random.Random(26)
+        for _ in range(20):
+            decoder, frames, pos = FrameDecoder(), [], 0
+            while pos < len(data):
+                step = rng.randint(1, 17)
+                frames += decoder.feed(data[pos:pos + step])
+                pos += step
+            self.assertEqual(frames, whole)
+            self.assertEqual((decoder.lost, decoder.resyncs, decoder.crc_errors), (0, 0, 0))
+        self.assertEqual(whole[-1], (199, [199, 200, 201]))
+
+
+if __name__ == '__main__':
+    unittest.main()
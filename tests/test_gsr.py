@@ -0,0 +1,72 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import GsrDecomposer
+
+
+def scr_shape(t, onset, amplitude, rise=1.5, decay=4.0):
+    """Отклик кожи: подъём за rise секунд и экспоненциальный спад."""
+    if t < onset:
+        return 0.0
+    if t < onset + rise:
+        return amplitude * math.sin(math.pi / 2 * (t - onset) / rise) ** 2
+    return amplitude * math.exp(-(t - onset - rise) / decay)
+
+
+def run(decomposer, signal, fs=100.0, seconds=60.0):
+    scrs = []
+    for index in range(int(seconds * fs)):
+        t = index / fs
+        scr = decomposer.push(index, signal(t), t)
+        if scr:
+            scrs.append(scr)
+    return scrs
+
+
+class GsrDecomposerTest(unittest.TestCase):
+    def test_constant_signal_is_all_tonic(self):
+        gsr = GsrDecomposer(1023)
+        self.assertEqual(run(gsr, lambda t: 400.0), [])
+        self.assertAlmostEqual(gsr.tonic_level, 400.0)
+        self.assertAlmostEqual(gsr.phasic, 0.0)
+
+    def test_each_response_is_one_scr_with_its_onset_and_amplitude(self):
+        onsets = [10.0, 25.0, 40.0]
+        gsr = GsrDecomposer(1023)
+        scrs = run(gsr, lambda t: 300.0 + sum(scr_shape(t, onset, 60.0) for onset in onsets))
+        self.assertEqual(gsr.scr_count, 3)
+        for (onset, peak, amplitude, rise_time, onset_ts), true_onset in zip(scrs, onsets):
+            self.assertLess(abs(onset_ts - true_onset), 0.5)
+            self.assertEqual(onset, round(onset_ts * 100))
+            self.assertGreater(peak, onset)
+            self.assertTrue(20.0 < amplitude <= 60.0, amplitude)
+            self.assertTrue(0.5 < rise_time < 3.0, rise_time)
+
+    def test_small_responses_are_ignored(self):
+        gsr = GsrDecomposer(1023)
+        self.assertEqual(run(gsr, lambda t: 300.0 + scr_shape(t, 10.0, 4.0)), [])
+
+    def test_slow_drift_is_not_a_response(self):
+        gsr = GsrDecomposer(1023)
+        self.assertEqual(run(gsr, lambda t: 300.0 + 3.0 * max(0.0, t - 5.0)), [])
+        self.assertGreater(gsr.tonic_level, 400.0)
+
+    def test_inverted_polarity(self):
+        def signal(t):
+            return 700.0 - scr_shape(t, 10.0, 60.0)
+        self.assertEqual(run(GsrDecomposer(1023), signal), [])
+        self.assertEqual(len(run(GsrDecomposer(1023, polarity=-1), signal)), 1)
+
+    def test_sample_rate_follows_timestamps(self):
+        gsr = GsrDecomposer(1023, fs=100.0)
+        run(gsr, lambda t: 300.0 + scr_shape(t, 10.0, 60.0), fs=25.0, seconds=30.0)
+        self.assertAlmostEqual(gsr.fs, 25.0, delta=0.5)
+        gsr.reset()
+        self.assertEqual((gsr.fs, gsr.scr_count), (100.0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
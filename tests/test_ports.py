@@ -0,0 +1,88 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import (
+    DEVICE_BINARY, DEVICE_BUSY, DEVICE_FIRMATA, DEVICE_SILENT, DEVICE_TAGGED, DEVICE_UNKNOWN, PortCache,
+    encode_frame, fingerprint, port_key,
+)
+
+
+def tagged(channels, count=20):
+    """Поток скетча Tagged: метка канала и байт значения."""
+    return b''.join(channel.encode() + bytes([i % 256]) for i in range(count) for channel in channels)
+
+
+def usb_port(device, serial_number='8573531303735', vid=0x2341, pid=0x0043):
+    return SimpleNamespace(device=device, serial_number=serial_number, vid=vid, pid=pid)
+
+
+class FingerprintTest(unittest.TestCase):
+    def test_protocols(self):
+        self.assertEqual(fingerprint(b''), (DEVICE_SILENT, ''))
+        self.assertEqual(fingerprint(tagged(['A0'])), (DEVICE_TAGGED, 'A0'))
+        self.assertEqual(fingerprint(tagged(['A0', 'A1'])), (DEVICE_TAGGED, 'A0/A1'))
+        binary = b''.join(encode_frame(seq, [seq, 1023, 0]) for seq in range(3))
+        self.assertEqual(fingerprint(b'\x07\x00' + binary), (DEVICE_BINARY, '3 ch'))
+        self.assertEqual(fingerprint(b'\x00\xf9\x02\x05'), (DEVICE_FIRMATA, 'v2.5'))
+
+    def test_partial_or_foreign_data_is_not_identified(self):
+        self.assertEqual(fingerprint(tagged(['A0'], count=3))[0], DEVICE_UNKNOWN)
+        self.assertEqual(fingerprint(encode_frame(0, [1, 2])[:-1])[0], DEVICE_UNKNOWN)
+        # 0xF9 без правдоподобной версии Firmata — просто байт данных
+        self.assertEqual(fingerprint(b'\xf9\x09\x01hello'), (DEVICE_UNKNOWN, '8 bytes'))
+        self.assertEqual(fingerprint(b'\xf9\x02'), (DEVICE_UNKNOWN, '2 bytes'))
+
+
+class PortCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'ports.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_port_key(self):
+        self.assertEqual(port_key(usb_port('/dev/ttyACM0')), 'usb:2341:0043:8573531303735')
+        self.assertEqual(port_key(usb_port('COM5', serial_number=None)), 'usb:2341:0043@COM5')
+        self.assertEqual(port_key(usb_port('/dev/ttyS0', serial_number=None, vid=None, pid=None)), '/dev/ttyS0')
+
+    def test_board_is_recognised_on_another_port_after_reload(self):
+        cache = PortCache(self.path)
+        cache.put(usb_port('/dev/ttyACM0'), {'device': '/dev/ttyACM0', 'kind': DEVICE_FIRMATA,
+                                             'detail': 'v2.5', 'baudrate': 57600})
+        cache.save()
+
+        entry = PortCache(self.path).get(usb_port('/dev/ttyACM1'))
+        self.assertEqual((entry['kind'], entry['baudrate']), (DEVICE_FIRMATA, 57600))
+        self.assertIsNone(PortCache(self.path).get(usb_port('/dev/ttyACM0', serial_number='other')))
+
+    def test_only_identified_complete_results_are_cached(self):
+        cache = PortCache(self.path)
+        port = usb_port('/dev/ttyUSB0')
+        for kind in (DEVICE_SILENT, DEVICE_UNKNOWN, DEVICE_BUSY):
+            cache.put(port, {'device': port.device, 'kind': kind, 'detail': '', 'baudrate': 115200})
+        cache.put(port, {'device': port.device, 'kind': DEVICE_TAGGED, 'detail': 'A0',
+                         'baudrate': 115200, 'cancelled': True})
+        self.assertIsNone(cache.get(port))
+        cache.put(port, {'device': port.device, 'kind': DEVICE_BINARY, 'detail': '2 ch', 'baudrate': 115200})
+        self.assertEqual(cache.get(port)['detail'], '2 ch')
+
+    def test_unreadable_cache_starts_empty(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{broken')
+        cache = PortCache(self.path)
+        self.assertEqual(cache.entries, {})
+        cache.put(usb_port('/dev/ttyACM0'), {'device': '/dev/ttyACM0', 'kind': DEVICE_TAGGED,
+                                             'detail': 'A0', 'baudrate': 115200})
+        cache.save()
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(list(json.load(f)), ['usb:2341:0043:8573531303735'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import PerformanceBudget, degrade_levels, normalize_preset
+
+# Как встроенный Default Lab 6
+DEFAULT = dict(
+    baudrate=115200, channels=['A0'], sample_rate=100.0, poll_ms=10.0,
+    buffer_points=1000, visible_points=500, render_fps=30.0, decimation=1, y_range=None,
+    segment="Off", export=[], chain=['artifacts', 'gsr', 'epochs'],
+    cpu_budget=80.0, latency_budget_ms=200.0, degrade=True,
+)
+
+
+class NormalizePresetTest(unittest.TestCase):
+    def test_missing_fields_come_from_default_and_unknown_are_dropped(self):
+        preset = normalize_preset({'sample_rate': '250', 'channels': ['A1', 'A0', 'A1'],
+                                   'y_range': ('0', 512), 'degrade': 0, 'color': 'red'}, DEFAULT)
+        self.assertEqual(preset['sample_rate'], 250.0)
+        self.assertEqual(preset['channels'], ['A1', 'A0'])
+        self.assertEqual(preset['y_range'], [0.0, 512.0])
+        self.assertIs(preset['degrade'], False)
+        self.assertNotIn('color', preset)
+        self.assertEqual({key: preset[key] for key in ('buffer_points', 'chain', 'segment')},
+                         {key: DEFAULT[key] for key in ('buffer_points', 'chain', 'segment')})
+        self.assertEqual(normalize_preset({}, DEFAULT), DEFAULT)
+
+    def test_errors_name_the_field(self):
+        cases = [
+            ({'sample_rate': 'fast'}, 'sample_rate: expected a number'),
+            ({'decimation': None}, 'decimation: expected a number'),
+            ({'y_range': [1]}, 'y_range: expected a number'),
+            ({'channels': ['A6']}, 'channels: invalid value'),
+            ({'channels': []}, 'channels: invalid value'),
+            ({'sample_rate': 0}, 'sample_rate: invalid value'),
+            ({'visible_points': 2000}, 'visible_points: invalid value'),
+            ({'decimation': 0}, 'decimation: invalid value'),
+            ({'y_range': [10, 5]}, 'y_range: invalid value'),
+            ({'segment': '5 min'}, 'segment: invalid value'),
+            ({'export': ['wav']}, 'export: invalid value'),
+            ({'chain': ['gsr', 'fft']}, 'chain: invalid value'),
+            ({'latency_budget_ms': -1}, 'latency_budget_ms: invalid value'),
+        ]
+        for preset, message in cases:
+            with self.assertRaises(ValueError, msg=preset) as caught:
+                normalize_preset(preset, DEFAULT)
+            self.assertTrue(str(caught.exception).startswith(message), (preset, str(caught.exception)))
+
+
+class DegradeLevelsTest(unittest.TestCase):
+    def test_levels_get_cheaper_one_step_at_a_time(self):
+        levels = degrade_levels(DEFAULT)
+        self.assertEqual(levels[0], DEFAULT)
+        self.assertEqual([(level['decimation'], level['render_fps'], level['chain']) for level in levels], [
+            (1, 30.0, ['artifacts', 'gsr', 'epochs']),
+            (2, 30.0, ['artifacts', 'gsr', 'epochs']),
+            (4, 30.0, ['artifacts', 'gsr', 'epochs']),
+            (4, 15.0, ['artifacts', 'gsr', 'epochs']),
+            # Не ниже 2000 / 200 мс = 10 кадров/с: ожидание кадра — половина бюджета задержки
+            (4, 10.0, ['artifacts', 'gsr', 'epochs']),
+            (4, 10.0, ['artifacts', 'gsr']),
+            (4, 10.0, ['artifacts']),
+        ])
+        for previous, level in zip(levels, levels[1:]):
+            self.assertEqual(len([key for key in level if level[key] != previous[key]]), 1)
+
+    def test_steps_that_change_nothing_are_skipped(self):
+        preset = dict(DEFAULT, render_fps=5.0, latency_budget_ms=400.0, chain=['gsr'])
+        levels = degrade_levels(preset)
+        self.assertEqual([(level['decimation'], level['render_fps'], level['chain']) for level in levels],
+                         [(1, 5.0, ['gsr']), (2, 5.0, ['gsr']), (4, 5.0, ['gsr'])])
+        self.assertEqual(preset['decimation'], 1)
+
+
+class PerformanceBudgetTest(unittest.TestCase):
+    def setUp(self):
+        # CPU-бюджет недостижимо велик: решения зависят только от задержки
+        self.budget = PerformanceBudget(cpu_percent=1e9, latency_ms=200.0, patience=3, restore_after=2)
+
+    def check(self, *latencies):
+        for ms in latencies:
+            self.budget.add_latency(ms)
+        return self.budget.check()
+
+    def test_degrades_after_patience_overruns_in_a_row(self):
+        self.assertEqual([self.check(500.0) for _ in range(3)], [0, 0, 1])
+        self.assertEqual(self.budget.overruns, 3)
+        self.assertEqual([self.check(500.0), self.check(150.0), self.check(500.0)], [0, 0, 0])
+
+    def test_restores_after_calm_checks(self):
+        self.assertEqual([self.check(10.0) for _ in range(4)], [0, -1, 0, -1])
+        self.assertEqual([self.check(10.0), self.check(150.0), self.check(10.0)], [0, 0, 0])
+
+    def test_latency_is_p95_of_the_interval(self):
+        self.check(*[float(ms) for ms in range(1, 101)])
+        self.assertAlmostEqual(self.budget.latency_p95, 95.05)
+        self.check()
+        self.assertEqual(self.budget.latency_p95, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
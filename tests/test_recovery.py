@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import RECORDING_HEADER, SegmentedRecorder, load_recording, recover_recordings
+
+
+def dead_pid():
+    """pid только что завершившегося процесса."""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class RecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.registry = os.path.join(self.dir.name, 'active.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def crashed_recording(self, subdir):
+        """Незакрытая запись с оборванной последней строкой, как после аварии."""
+        directory = os.path.join(self.dir.name, subdir)
+        os.makedirs(directory)
+        recorder = SegmentedRecorder(os.path.join(directory, 'rec.csv'), RECORDING_HEADER,
+                                     flush_interval=0.0, registry=self.registry)
+        for i in range(50):
+            recorder.write_row([i / 10, i, i + 1, 'A0'])
+        recorder.file.write('5.0,12')
+        recorder.file.flush()
+        return recorder
+
+    def set_owner_pid(self, recorder, pid):
+        with open(recorder.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['owner']['pid'] = pid
+        with open(recorder.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+    def registered(self):
+        with open(self.registry, encoding='utf-8') as f:
+            return list(json.load(f))
+
+    def test_live_owner_is_not_repaired(self):
+        recorder = self.crashed_recording('shared')
+        self.assertEqual(recover_recordings(os.path.dirname(recorder.path), self.registry), [])
+        self.assertEqual(self.registered(), [os.path.abspath(recorder.manifest_path)])
+        recorder.close()
+        self.assertEqual(self.registered(), [])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "process start time is read from /proc")
+    def test_reused_pid_is_not_a_live_owner(self):
+        recorder = self.crashed_recording('reused')
+        # Запись старше процесса, которому теперь принадлежит её pid (как после перезагрузки)
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        with open(recorder.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest['owner'].update(pid=process.pid, started=manifest['owner']['started'] - 3600)
+        with open(recorder.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        recovered = recover_recordings(os.path.dirname(recorder.path), self.registry)
+        self.assertEqual([manifest['status'] for path, manifest, repaired in recovered], ['recovered'])
+
+    def test_registry_finds_recording_outside_directory(self):
+        recorder = self.crashed_recording('elsewhere')
+        self.set_owner_pid(recorder, dead_pid())
+        os.makedirs(os.path.join(self.dir.name, 'current'))
+
+        recovered = recover_recordings(os.path.join(self.dir.name, 'current'), self.registry)
+        self.assertEqual([path for path, manifest, repaired in recovered],
+                         [os.path.abspath(recorder.manifest_path)])
+        self.assertEqual(recovered[0][1]['status'], 'recovered')
+        self.assertEqual(self.registered(), [])
+        timestamps, values, counters = load_recording(recorder.manifest_path)['A0']
+        self.assertEqual(list(counters), list(range(1, 51)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sensorlab import WindowStats, robust_range
+
+
+class WindowStatsTest(unittest.TestCase):
+    def assert_matches(self, stats, window):
+        """Сравнение со счётом «в лоб» по последним значениям окна."""
+        self.assertEqual(len(stats), len(window))
+        ordered = sorted(window)
+        n = len(ordered)
+        self.assertEqual(stats.minimum, ordered[0])
+        self.assertEqual(stats.maximum, ordered[-1])
+        self.assertAlmostEqual(stats.mean, float(np.mean(window)), places=9)
+        self.assertAlmostEqual(stats.std, float(np.std(window)), places=6)
+        self.assertAlmostEqual(stats.rms, float(np.sqrt(np.mean(np.square(window, dtype=np.float64)))), places=6)
+        for q in (0, 0.5, 5, 25, 50, 75, 95, 99.5, 100):
+            self.assertEqual(stats.percentile(q), ordered[int(q / 100 * (n - 1))], q)
+
+    def test_random_streams_match_brute_force(self):
+        rng = random.Random(27)
+        for window_size, value_max in ((1, 255), (7, 255), (64, 1023), (500, 1023)):
+            stats = WindowStats(window_size, value_max)
+            history = []
+            for step in range(3 * window_size + 200):
+                # Плато, ступеньки и шум: в монотонных деках бывают и равные, и убывающие серии
+                value = rng.choice([rng.randint(0, value_max), history[-1] if history else 0,
+                                    rng.randint(0, 3), value_max])
+                stats.push(value)
+                history.append(value)
+                if step % 7 == 0 or step < 2 * window_size:
+                    self.assert_matches(stats, history[-window_size:])
+
+    def test_out_of_range_values_are_clipped(self):
+        stats = WindowStats(4, value_max=255)
+        for value in (-5, 300, 12.7, 255):
+            stats.push(value)
+        self.assert_matches(stats, [0, 255, 12, 255])
+
+    def test_resize_evicts_oldest_values(self):
+        rng = random.Random(7)
+        stats = WindowStats(100, 1023)
+        history = [rng.randint(0, 1023) for _ in range(150)]
+        for value in history:
+            stats.push(value)
+        stats.resize(10)
+        self.assert_matches(stats, history[-10:])
+        for value in history[:30]:
+            stats.push(value)
+            history.append(value)
+        self.assert_matches(stats, history[-10:])
+        stats.resize(50)
+        for value in history[:5]:
+            stats.push(value)
+            history.append(value)
+        self.assert_matches(stats, history[-15:])
+
+    def test_empty_window_and_reset(self):
+        stats = WindowStats(5)
+        self.assertEqual((stats.minimum, stats.maximum, stats.mean, stats.percentile(50)), (0, 0, 0.0, 0))
+        stats.push(10)
+        stats.reset()
+        self.assertEqual(len(stats), 0)
+        stats.push(3)
+        self.assert_matches(stats, [3])
+
+    def test_robust_range_uses_the_same_percentile_rule(self):
+        rng = random.Random(3)
+        values = [rng.randint(0, 1023) for _ in range(333)]
+        stats = WindowStats(len(values))
+        for value in values:
+            stats.push(value)
+        self.assertEqual(robust_range(values, 2.5), (stats.percentile(2.5), stats.percentile(97.5)))
+
+
+if __name__ == '__main__':
+    unittest.main()